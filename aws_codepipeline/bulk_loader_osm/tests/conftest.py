@@ -0,0 +1 @@
+from tests.fixtures.osm_data import osm_input_file, default_output, bulk_load_output
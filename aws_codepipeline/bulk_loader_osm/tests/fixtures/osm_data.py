@@ -0,0 +1,56 @@
+import gzip
+import os
+
+import pytest
+
+from driver import main
+
+
+CSV_NAMES = ["node", "way", "relation", "wayLink", "relationLink"]
+
+
+def read_rows(path):
+
+    # read the rows of a bulk load CSV as sets of (column, value) pairs without the empty values, so that the
+    # rows of CSVs whose tag columns are in a different order can be compared
+    with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as csvFile:
+        lines = csvFile.read().splitlines()
+
+    columns = [column.strip() for column in lines[0].split(",\t")]
+
+    return [frozenset((column, value) for column, value in zip(columns, line.rstrip(",").split(",\t")) if value != "")
+            for line in lines[1:]]
+
+
+def without_dataset_id(rows):
+
+    # the relation links take the dataset id of the last way written, which depends on the order of the ways
+    return sorted((sorted(pair for pair in row if pair[0] != "__datasetid:String(single)") for row in rows))
+
+
+@pytest.fixture(scope="session")
+def osm_input_file():
+
+    # define the synthetic OSM extract: 64 nodes around the corner of 4 grid cells (33.8N84.4W), footways,
+    # crossings, a road, a building and steps, and 2 relations
+    return "tests/data/sample.osm"
+
+
+@pytest.fixture(scope="session")
+def bulk_load_output():
+
+    # read the rows of the CSVs written to a directory, or to the .csv.gz files of a sink
+    def read_output(directory, suffix=""):
+        return {name: read_rows(os.path.join(directory, name + ".csv" + suffix)) for name in CSV_NAMES}
+
+    return read_output
+
+
+@pytest.fixture(scope="session")
+def default_output(osm_input_file, bulk_load_output, tmp_path_factory):
+
+    # define the expected output of every mode: the CSVs of main() with its default settings
+    directory = str(tmp_path_factory.mktemp("default"))
+    main(osm_input_file, directory=directory)
+
+    return bulk_load_output(directory)
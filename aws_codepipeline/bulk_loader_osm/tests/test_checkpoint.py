@@ -0,0 +1,41 @@
+import glob
+
+from checkpoint import OsmImportCheckpoint, LocalCheckpointStore
+from driver import main, main_checkpointed
+from tests.fixtures.osm_data import CSV_NAMES, read_rows
+
+
+class TestOsmImportCheckpoint:
+
+    def test_resume(self, osm_input_file, bulk_load_output, tmp_path):
+
+        # define the checkpoints: every 7 elements, with no time left so that each invocation stops at its first one
+        store = LocalCheckpointStore(str(tmp_path / "store"))
+        checkpoint = OsmImportCheckpoint(store, every=7, remaining_time=lambda: 0)
+        with open(osm_input_file, "rb") as osmFile:
+            xml = osmFile.read()
+
+        # run the test function as the chain of lambda invocations: each one starts from an empty directory with
+        # the xml downloaded from the offset of the last checkpoint
+        invocations = 0
+        manifest = {"done": False, "offset": 0}
+        while not manifest["done"]:
+            invocations += 1
+            directory = tmp_path / "invocation-{}".format(invocations)
+            directory.mkdir()
+            manifest = checkpoint.load(str(directory)) or manifest
+            with open(str(directory / "data.osm"), "wb") as osmFile:
+                osmFile.write(xml[manifest["offset"]:])
+            manifest = main_checkpointed(str(directory / "data.osm"), checkpoint, directory=str(directory),
+                                         infile_offset=manifest["offset"])
+        main(osm_input_file, streaming=True, directory=str(tmp_path))
+        streaming_output = bulk_load_output(str(tmp_path))
+
+        # make sure the import was resumed at each checkpoint of its 75 elements, and the rows of the parts are
+        # the rows of the streaming mode, each of them once
+        assert invocations >= 11
+        for name in CSV_NAMES:
+            rows = [row for path in sorted(glob.glob(str(tmp_path / "store" / "parts" / (name + "-*.csv"))))
+                    for row in read_rows(path)]
+            assert len(rows) == len(set(rows))
+            assert rows == streaming_output[name]
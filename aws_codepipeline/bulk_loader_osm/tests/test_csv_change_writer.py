@@ -0,0 +1,84 @@
+import json
+import xml.etree.ElementTree as ET
+
+from csv_writer import OsmAWSBulkLoadCSVWriter
+from driver import main, main_change
+
+
+class TestOsmAWSChangeCSVWriter:
+
+    def test_change(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # define the osmChange diff: way 1005 is modified alone, its nodes are found in the extract as in the database,
+        # and way 1009 is deleted
+        root = ET.parse(osm_input_file).getroot()
+        nodes = {node.get("id"): node for node in root.iter("node")}
+        change = ET.Element("osmChange", version="0.6")
+        ET.SubElement(change, "modify").append(next(way for way in root.iter("way") if way.get("id") == "1005"))
+        ET.SubElement(ET.SubElement(change, "delete"), "way", id="1009", version="2")
+        ET.ElementTree(change).write(str(tmp_path / "change.osc"))
+
+        found = []
+        def find_nodes(node_ids):
+            found.extend(node_ids)
+            return [{"id": node_id, "tags": {"lat": nodes[node_id].get("lat"), "lon": nodes[node_id].get("lon")}}
+                    for node_id in node_ids]
+
+        # run the test function
+        main_change(str(tmp_path / "change.osc"), directory=str(tmp_path), findNodes=find_nodes)
+        output = bulk_load_output(str(tmp_path))
+        with open(str(tmp_path / "delete.json")) as delete_file:
+            deletions = json.load(delete_file)
+
+        # make sure all the nodes of the way are looked up, and its rows are the rows of the whole extract
+        assert sorted(found) == [str(node_id) for node_id in range(133, 141)]
+        assert output["way"] == [row for row in default_output["way"] if ("id:String(single)", "1005") in row]
+        assert sorted(output["wayLink"], key=sorted) == sorted([row for row in default_output["wayLink"]
+                                                                if dict(row)["~from"] == "w1005" or
+                                                                dict(row).get("way-id:String(single)") == "1005"], key=sorted)
+        assert deletions["ways"] == ["1009"]
+        assert deletions["wayLinks"] == ["1009", "1005"]
+
+
+    def test_moved_node(self, osm_input_file, bulk_load_output, tmp_path):
+
+        # define the osmChange diff: node 136 of way 1005 is moved alone, and the extract with the node moved
+        root = ET.parse(osm_input_file).getroot()
+        node = next(node for node in root.iter("node") if node.get("id") == "136")
+        node.set("lat", "{:.7f}".format(float(node.get("lat")) + 0.0005))
+        nodes = {node.get("id"): node for node in root.iter("node")}
+        ways = {way.get("id"): [nd.get("ref") for nd in way.iter("nd")] for way in root.iter("way")}
+        change = ET.Element("osmChange", version="0.6")
+        ET.SubElement(change, "modify").append(node)
+        ET.ElementTree(change).write(str(tmp_path / "change.osc"))
+        ET.ElementTree(root).write(str(tmp_path / "moved.osm"))
+
+        def find_nodes(node_ids):
+            return [{"id": node_id, "tags": {"lat": nodes[node_id].get("lat"), "lon": nodes[node_id].get("lon")}}
+                    for node_id in node_ids]
+
+        def find_ways(node_ids):
+            return [{"id": way_id, "nodes": refs} for way_id, refs in ways.items() if set(refs) & set(node_ids)]
+
+        (tmp_path / "change").mkdir()
+        (tmp_path / "moved").mkdir()
+
+        # run the test function
+        main_change(str(tmp_path / "change.osc"), directory=str(tmp_path / "change"), findNodes=find_nodes,
+                    findWays=find_ways)
+        main(str(tmp_path / "moved.osm"), directory=str(tmp_path / "moved"))
+        output = bulk_load_output(str(tmp_path / "change"))
+        moved_output = bulk_load_output(str(tmp_path / "moved"))
+        with open(str(tmp_path / "change" / "delete.json")) as delete_file:
+            deletions = json.load(delete_file)
+
+        # make sure the way is written again with the geometry of the extract with the node moved, without its tags,
+        # and its links are replaced
+        geometry = {"~id", "~label", "id:String(single)", "__datasetid:String(single)", "__geohash:String(single)"} | \
+            {column + ":Double(single)" for column in OsmAWSBulkLoadCSVWriter.WAY_GEOMETRY}
+        assert output["way"] == [frozenset(pair for pair in row if pair[0] in geometry)
+                                 for row in moved_output["way"] if ("id:String(single)", "1005") in row]
+        assert sorted(output["wayLink"], key=sorted) == sorted([row for row in moved_output["wayLink"]
+                                                                if dict(row)["~from"] == "w1005" or
+                                                                dict(row).get("way-id:String(single)") == "1005"], key=sorted)
+        assert deletions["ways"] == [] and deletions["wayLinks"] == ["1005"]
@@ -0,0 +1,23 @@
+import glob
+import os
+
+from driver import main
+from tests.fixtures.osm_data import CSV_NAMES, read_rows, without_dataset_id
+
+
+class TestOsmAWSPartitionedCSVWriter:
+
+    def test_partitioned(self, osm_input_file, default_output, tmp_path):
+
+        # run the test function with the cells written by 2 worker processes
+        main(osm_input_file, directory=str(tmp_path), partitioned=True, workers=2)
+
+        # make sure the sample is split into the 4 grid cells around its corner, the relations keeping the dataset id
+        # of the extract, with the default rows altogether
+        cells = sorted(os.listdir(str(tmp_path)))
+        assert cells == ["33.7N84.4W", "33.7N84.5W", "33.8N84.4W", "33.8N84.5W", "area-unset"]
+        for name in CSV_NAMES[:-1]:
+            rows = [row for path in glob.glob(str(tmp_path / "*" / (name + ".csv"))) for row in read_rows(path)]
+            assert sorted(rows, key=sorted) == sorted(default_output[name], key=sorted)
+        rows = [row for path in glob.glob(str(tmp_path / "*" / "relationLink.csv")) for row in read_rows(path)]
+        assert without_dataset_id(rows) == without_dataset_id(default_output["relationLink"])
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from driver import main
+from csv_sinks import LocalGzipSink, S3MultipartSink
+from csv_writer import geohash
+
+
+def unpack_other_tags(row):
+
+    # turn the packed other_tags column of a sparse row into the tag columns of the wide schema
+    columns = dict(row)
+    packed = columns.pop("other_tags:String(single)", None)
+    if packed:
+        for key, value in json.loads(packed[1:-1].replace('""', '"')).items():
+            columns[key.replace(":", "\\:") + ":String(single)"] = '"{}"'.format(value.replace('"', '""'))
+
+    return frozenset(columns.items())
+
+
+class TestOsmAWSBulkLoadCSVWriter:
+
+    def test_streaming(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # run the test function: rows written as the elements are parsed, with the expat parser as in the lambda
+        (tmp_path / "sax").mkdir()
+        (tmp_path / "expat").mkdir()
+        main(osm_input_file, streaming=True, directory=str(tmp_path / "sax"))
+        main(osm_input_file, streaming=True, directory=str(tmp_path / "expat"), parser="expat")
+
+        # make sure both write the same rows as the default output
+        assert bulk_load_output(str(tmp_path / "sax")) == default_output
+        assert bulk_load_output(str(tmp_path / "expat")) == default_output
+
+
+    def test_sparse_schema(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # run the test function
+        main(osm_input_file, streaming=True, directory=str(tmp_path), schema="sparse")
+        output = bulk_load_output(str(tmp_path))
+
+        # make sure the hot tags are columns and the other tags are packed, e.g. the building and amenity tags
+        header = open(str(tmp_path / "way.csv")).readline()
+        assert "footway:String(single)" in header and "building:String(single)" not in header
+        for name in ["node", "way", "relation"]:
+            assert sorted(map(sorted, map(unpack_other_tags, output[name]))) == sorted(map(sorted, default_output[name]))
+        assert output["wayLink"] == default_output["wayLink"]
+
+
+    def test_sink(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # run the test function: the CSVs are written gzip-compressed to the sink instead of the directory
+        (tmp_path / "spill").mkdir()
+        (tmp_path / "sink").mkdir()
+        main(osm_input_file, streaming=True, directory=str(tmp_path / "spill"), sink=LocalGzipSink(str(tmp_path / "sink")))
+
+        # make sure the compressed CSVs have the same rows as the default output
+        assert bulk_load_output(str(tmp_path / "sink"), ".gz") == default_output
+
+
+    def test_sink_abort(self, osm_input_file, tmp_path):
+
+        # define a stand-in S3 client recording the multipart uploads, and an extract cut in the middle of a way
+        class MultipartClient:
+            def __init__(self):
+                self.calls = []
+            def create_multipart_upload(self, Bucket, Key):
+                self.calls.append(("create", Key))
+                return {"UploadId": Key}
+            def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+                return {"ETag": str(PartNumber)}
+            def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+                self.calls.append(("complete", Key))
+            def abort_multipart_upload(self, Bucket, Key, UploadId):
+                self.calls.append(("abort", Key))
+
+        xml = open(osm_input_file).read()
+        (tmp_path / "cut.osm").write_text(xml[:xml.index('<way id="1005"') + 20])
+        client = MultipartClient()
+        sink = S3MultipartSink("bucket", "osm-updated", client)
+
+        # run the test function
+        with pytest.raises(Exception):
+            main(str(tmp_path / "cut.osm"), streaming=True, directory=str(tmp_path), parser="expat", sink=sink)
+
+        # make sure the uploads of the link CSVs opened before the error are aborted, and none is completed
+        created = sorted(key for call, key in client.calls if call == "create")
+        assert created == ["osm-updated/relationLink.csv.gz", "osm-updated/wayLink.csv.gz"]
+        assert sorted(key for call, key in client.calls if call == "abort") == created
+        assert sink.streams == set()
+
+
+    def test_way_geometry(self, default_output):
+
+        # find the geometry columns of the sidewalk way 1005
+        way = dict(next(row for row in default_output["way"] if ("id:String(single)", "1005") in row))
+
+        # make sure the end coordinates are the values of the xml, and the midpoint and geohash are between them
+        assert way["__start_lat:Double(single)"] == "33.8001083"
+        assert way["__end_lon:Double(single)"] == "-84.3987038"
+        mid_lat, mid_lon = float(way["__mid_lat:Double(single)"]), float(way["__mid_lon:Double(single)"])
+        assert float(way["__min_lat:Double(single)"]) <= mid_lat <= float(way["__max_lat:Double(single)"])
+        assert way["__geohash:String(single)"] == geohash(mid_lat, mid_lon)
+        assert 800.0 < float(way["__length:Double(single)"]) < 900.0
+
+
+    def test_contract(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # run the test function
+        main(osm_input_file, directory=str(tmp_path), contract=True)
+        output = bulk_load_output(str(tmp_path))
+
+        # make sure the vertices are the same, and the WAY links of each way chain its first node to its last node
+        # through the junctions, with the length of the way in total
+        for name in ["node", "way", "relation", "relationLink"]:
+            assert output[name] == default_output[name]
+
+        for way in map(dict, output["way"]):
+            links = sorted((dict(link) for link in output["wayLink"] if ("~label", "WAY") in link
+                            and ("way-id:String(single)", way["id:String(single)"]) in link),
+                           key=lambda link: int(link["~id"].split("-")[-1]))
+            first = next(dict(link) for link in output["wayLink"] if ("~id", "wf" + way["id:String(single)"]) in link)
+            last = next(dict(link) for link in output["wayLink"] if ("~id", "wl" + way["id:String(single)"]) in link)
+            assert links[0]["~from"] == first["~to"] and links[-1]["~to"] == last["~to"]
+            assert all(link["~to"] == next_link["~from"] for link, next_link in zip(links, links[1:]))
+            assert abs(sum(float(link["length:Double(single)"]) for link in links)
+                       - float(way["__length:Double(single)"])) < 0.1
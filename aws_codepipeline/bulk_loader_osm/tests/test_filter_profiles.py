@@ -0,0 +1,22 @@
+from driver import main
+
+
+class TestOsmFilter:
+
+    def test_pedestrian_profile(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # run the test function
+        main(osm_input_file, streaming=True, directory=str(tmp_path), profile="pedestrian")
+        output = bulk_load_output(str(tmp_path))
+
+        # make sure the road and the building are left out with the relations, and the kept ways keep their links
+        way_ids = sorted(dict(row)["id:String(single)"] for row in output["way"])
+        assert way_ids == ["1001", "1002", "1003", "1005", "1006", "1008", "1009"]
+        assert output["relation"] == [] and output["relationLink"] == []
+        assert sorted(output["wayLink"], key=sorted) == sorted([row for row in default_output["wayLink"]
+                                                                if dict(row)["~id"][2:].split("-")[0] in way_ids], key=sorted)
+
+        # make sure only the nodes of the kept ways are written, without the tags out of the profile
+        node_ids = {dict(row)["~to"] for row in output["wayLink"]} | {dict(row)["~from"] for row in output["wayLink"]}
+        assert {dict(row)["~id"] for row in output["node"]} == node_ids - {"w" + way_id for way_id in way_ids}
+        assert not any(column.startswith("amenity") for row in output["node"] for column, _ in row)
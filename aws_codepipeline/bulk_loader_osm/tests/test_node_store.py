@@ -0,0 +1,27 @@
+from node_store import OsmNodeStore
+
+
+class TestOsmNodeStore:
+
+    def test_resolve_way(self, tmp_path):
+
+        # add the nodes out of id order, spilled to files every 2 nodes
+        store = OsmNodeStore(str(tmp_path), spill_size=2)
+        for node_id, lat, lon in [(30, "33.8500001", "-84.3500001"), (10, "33.7999999", "-84.4000001"),
+                                  (20, "33.8000001", "-84.3999999")]:
+            store.add(node_id, lat, lon)
+
+        # run the test function
+        store.finalize()
+        datasetid, length, bbox, complete = store.resolveWay(["10", "20", "30"], "area-unset")
+        missing_datasetid, _, _, missing_complete = store.resolveWay(["99", "20", "98"], "area-unset")
+        lats, lons = store.coordinates(["30", "10"])
+        store.close()
+
+        # make sure the dataset id is the grid cell of the first node, and the coordinates keep their xml values
+        assert datasetid == "33.7N84.5W"
+        assert complete and not missing_complete
+        assert missing_datasetid == "area-unset"
+        assert bbox == (33.7999999, -84.4000001, 33.8500001, -84.3500001)
+        assert 23000.0 < length < 24000.0
+        assert list(lats) == [33.8500001, 33.7999999] and list(lons) == [-84.3500001, -84.4000001]
@@ -0,0 +1,25 @@
+from driver import parse
+
+
+def read_elements(infile, parser, workers=1):
+
+    # collect the elements and the (tags, dataset_id) tuple sent at the end of the file
+    elements = []
+    parse(infile, elements.append, "33.7N84.5W", parser=parser, workers=workers)
+    return elements
+
+
+class TestOsmPbfReader:
+
+    def test_parse(self, osm_input_file):
+
+        # run the test function on the pbf of the sample extract, converted with osmium; its 64 nodes, 9 ways and
+        # 2 relations are in 3 OSMData blocks, so that 2 workers decode them in parallel
+        sax_elements = read_elements(osm_input_file, "sax")
+        pbf_elements = read_elements(osm_input_file + ".pbf", "pbf")
+        pbf_elements_workers = read_elements(osm_input_file + ".pbf", "pbf", workers=2)
+
+        # make sure the pbf reader sends the same elements as the xml parser, in the same order
+        assert len(sax_elements) == 76
+        assert pbf_elements == sax_elements
+        assert pbf_elements_workers == sax_elements
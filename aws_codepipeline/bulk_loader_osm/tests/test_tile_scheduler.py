@@ -0,0 +1,89 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from driver import main_tiles
+from tests.fixtures.osm_data import without_dataset_id
+from tile_scheduler import planTiles, AdaptiveRateLimiter, OsmTileScheduler, OsmTileThrottled
+
+
+class TileSource:
+
+    # stand in for the OSM API map call on the sample extract: the nodes in the bbox, the ways with one of them
+    # and all their nodes, and the relations with one of these ways or nodes, so the tiles overlap at their borders
+    def __init__(self, osm_input_file, fail_keys=()):
+
+        self.root = ET.parse(osm_input_file).getroot()
+        self.fail_keys = set(fail_keys) # tiles answering HTTP 400
+        self.throttled = set() # tiles answering HTTP 429 to their first request
+        self.requests = []
+
+
+    def __call__(self, tile):
+
+        self.requests.append(tile["key"])
+        if tile["key"] not in self.throttled:
+            self.throttled.add(tile["key"])
+            raise OsmTileThrottled("Tile {} throttled".format(tile["key"]), 0.0)
+        if tile["key"] in self.fail_keys:
+            raise Exception("Tile {} failed with HTTP 400".format(tile["key"]))
+
+        min_lon, min_lat, max_lon, max_lat = [float(value) for value in tile["bbox"].split(",")]
+        nodes = {node.get("id"): node for node in self.root.iter("node")}
+        inside = {node_id for node_id, node in nodes.items() if min_lat <= float(node.get("lat")) <= max_lat
+                  and min_lon <= float(node.get("lon")) <= max_lon}
+        ways = [way for way in self.root.iter("way") if any(nd.get("ref") in inside for nd in way.iter("nd"))]
+        way_ids = {way.get("id") for way in ways}
+        refs = inside | {nd.get("ref") for way in ways for nd in way.iter("nd")}
+        relations = [relation for relation in self.root.iter("relation")
+                     if any(member.get("ref") in (way_ids if member.get("type") == "way" else refs)
+                            for member in relation.iter("member"))]
+
+        osm = ET.Element("osm", version="0.6")
+        osm.extend([nodes[node_id] for node_id in sorted(refs, key=int)] + ways + relations)
+
+        return ET.tostring(osm)
+
+
+class TestOsmTileScheduler:
+
+    def test_plan_tiles(self):
+
+        # run the test function on a 0.1 degree cell
+        tiles = planTiles({"33.8N84.4W": {"min_lat": 33.8, "max_lat": 33.9, "min_lon": -84.4, "max_lon": -84.3}}, 0.02)
+
+        # make sure the 25 tiles cover the cell exactly, without the drift of adding 0.02 up
+        assert len(tiles) == 25
+        assert tiles[0]["bbox"] == "-84.4,33.8,-84.38,33.82"
+        assert tiles[-1]["bbox"] == "-84.32,33.88,-84.3,33.9"
+
+
+    def test_run_resume_dedupe(self, osm_input_file, default_output, bulk_load_output, tmp_path):
+
+        # define the tiles of the sample extract, the second one fails in the first run
+        tiles = planTiles({"33.7N84.5W": {"min_lat": 33.798, "max_lat": 33.802, "min_lon": -84.402, "max_lon": -84.398}},
+                          0.001)
+        source = TileSource(osm_input_file, fail_keys=[tiles[1]["key"]])
+        limiter = AdaptiveRateLimiter(interval=0.0, minInterval=0.0, maxInterval=0.01)
+
+        # run the test functions: a first run with a failed tile, the CSVs cannot be written yet, then a second run
+        failed = OsmTileScheduler(source, str(tmp_path), workers=4, limiter=limiter).run(tiles)
+        with pytest.raises(Exception, match="1 OSM tiles are not fetched"):
+            main_tiles(OsmTileScheduler(source, str(tmp_path)), tiles, directory=str(tmp_path))
+        source.fail_keys = set()
+        source.requests = []
+        scheduler = OsmTileScheduler(source, str(tmp_path), workers=4, limiter=limiter)
+        resumed = scheduler.run(tiles)
+        main_tiles(scheduler, tiles, directory=str(tmp_path))
+
+        # make sure only the failed tile is fetched again, and the elements shared by the tiles are written once
+        assert failed == [tiles[1]["key"]]
+        assert resumed == [] and source.requests == [tiles[1]["key"]]
+        output = bulk_load_output(str(tmp_path))
+        for name in ["node", "way", "wayLink"]:
+            assert sorted(output[name], key=sorted) == sorted(default_output[name], key=sorted)
+        assert without_dataset_id(output["relation"]) == without_dataset_id(default_output["relation"])
+        assert without_dataset_id(output["relationLink"]) == without_dataset_id(default_output["relationLink"])
+
+        # make sure the relations are written with the grid cell of their tile instead of the unset dataset id
+        assert {dict(row)["__datasetid:String(single)"] for row in output["relation"]} == {"33.7N84.5W"}
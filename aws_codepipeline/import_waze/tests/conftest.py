@@ -1,3 +1,4 @@
 from tests.fixtures.crosswalk_data import crosswalk_input_data
+from tests.fixtures.query_data import query_url
 from tests.fixtures.sidewalk_data import sidewalk_input_data
 from tests.fixtures.waze_data import waze_input_data
\ No newline at end of file
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def query_url():
+
+    # define the AWS Neptune database url; the database driver is mocked in the tests, so it is never reached
+    query_url = "bolt://database-name.cluster-id.us-east-2.neptune.amazonaws.com:8182"
+
+    return query_url
@@ -0,0 +1,111 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from batched_delete import BatchedDelete
+
+
+class DriverError(Exception):
+
+    # stand-in of the errors of the neo4j driver, which tell if they are worth retrying
+    def __init__(self, message, retryable):
+        super().__init__(message)
+        self.retryable = retryable
+
+    def is_retryable(self):
+        return self.retryable
+
+
+class TestBatchedDelete:
+
+    def test_delete(self):
+
+        # the database holds 2500 matched nodes; the second batch fails once with a concurrent modification
+        remaining = [2500]
+        calls = []
+
+        def execute_query(query, parameters):
+            calls.append(query)
+            if len(calls) == 2:
+                raise Exception("ConcurrentModificationException")
+            deleted = min(remaining[0], 1000)
+            remaining[0] -= deleted
+            return [{"deleted": deleted}], None, None
+
+        driver = MagicMock()
+        driver.execute_query.side_effect = execute_query
+
+        # run the test function
+        deleted = BatchedDelete(driver, batch_size=1000, backoff=0).delete(
+            "WAZE", "MATCH (waze:`WAZE`) WHERE waze.endTimeMillis < $time_limit", "waze", parameters={"time_limit": 0})
+
+        # make sure the nodes are deleted in batches of 1000 until a batch deletes nothing, with the failed batch retried
+        assert deleted == 2500
+        assert len(calls) == 5
+        assert calls[0] == "MATCH (waze:`WAZE`) WHERE waze.endTimeMillis < $time_limit WITH DISTINCT waze LIMIT 1000  " \
+                           "DETACH DELETE waze RETURN count(*) AS deleted"
+
+
+    def test_run(self):
+
+        # every batch deletes 10 rows of its label until 30 rows of each label are deleted
+        remaining = {"OSM-NODE": 30, "OSM-WAY": 30}
+
+        def execute_query(query, parameters):
+            label = query.split("`")[1]
+            deleted = min(remaining[label], 10)
+            remaining[label] -= deleted
+            return [{"deleted": deleted}], None, None
+
+        driver = MagicMock()
+        driver.execute_query.side_effect = execute_query
+        groups = [{"name": label, "match": "MATCH (n:`{}` {{__datasetid: $id}})".format(label), "parameters": {"id": "33.8N84.2W"}}
+                  for label in remaining]
+
+        # run the test function
+        deleted = BatchedDelete(driver, batch_size=10).run(groups)
+
+        # make sure each label group is deleted with its parameters
+        assert deleted == {"OSM-NODE": 30, "OSM-WAY": 30}
+        assert all(call.args[1] == {"id": "33.8N84.2W"} for call in driver.execute_query.call_args_list)
+
+
+    def test_retry(self):
+
+        # the first batch fails with a lost connection, then with a syntax error
+        errors = [DriverError("ServiceUnavailable", True), DriverError("SyntaxError", False)]
+
+        def execute_query(query, parameters):
+            raise errors.pop(0)
+
+        driver = MagicMock()
+        driver.execute_query.side_effect = execute_query
+
+        # run the test function and make sure only the transient error is retried
+        with pytest.raises(DriverError, match="SyntaxError"):
+            BatchedDelete(driver, backoff=0).delete("WAZE", "MATCH (waze:`WAZE`)", "waze")
+        assert driver.execute_query.call_count == 2
+
+
+    def test_run_in_order(self):
+
+        # every batch deletes 10 rows of its label until 20 rows of each label are deleted
+        remaining = {"OSM-RELATION": 20, "OSM-WAY": 20, "OSM-NODE": 20}
+        labels = []
+
+        def execute_query(query, parameters):
+            labels.append(query.split("`")[1])
+            deleted = min(remaining[labels[-1]], 10)
+            remaining[labels[-1]] -= deleted
+            return [{"deleted": deleted}], None, None
+
+        driver = MagicMock()
+        driver.execute_query.side_effect = execute_query
+        groups = [{"name": label, "match": "MATCH (n:`{}`)".format(label)} for label in remaining]
+
+        # run the test function
+        deleted = BatchedDelete(driver, batch_size=10).run_in_order(groups)
+
+        # make sure a label is only deleted once all the rows of the previous one are deleted
+        assert deleted == {"OSM-RELATION": 20, "OSM-WAY": 20, "OSM-NODE": 20}
+        assert labels == ["OSM-RELATION"] * 3 + ["OSM-WAY"] * 3 + ["OSM-NODE"] * 3
@@ -0,0 +1,30 @@
+from unittest.mock import MagicMock, patch
+
+from footway_geometry_cache import FootwayGeometryCache
+
+
+class TestFootwayGeometryCache:
+
+    def test_find_indexes(self):
+
+        # count and largest way id returned by the signature query of each grid cell
+        signatures = {"33.8N84.2W": (10, 100), "33.8N84.3W": (5, 50)}
+        cache = FootwayGeometryCache(max_entries=1)
+        cache.find_signature = MagicMock(side_effect=lambda driverObj, datasetid: signatures[datasetid])
+        cache.retrieve_indexes = MagicMock(side_effect=lambda driverObj, datasetid: (MagicMock(), MagicMock()))
+
+        # run the test function; the driver is not used since the queries are mocked
+        with patch("footway_geometry_cache.GraphDatabaseDriver"):
+
+            first_indexes = cache.find_indexes("query_url", "33.8N84.2W")
+            assert cache.find_indexes("query_url", "33.8N84.2W") == first_indexes
+            assert cache.retrieve_indexes.call_count == 1
+
+            # a changed signature invalidates the cached segments
+            signatures["33.8N84.2W"] = (11, 101)
+            assert cache.find_indexes("query_url", "33.8N84.2W") != first_indexes
+            assert cache.retrieve_indexes.call_count == 2
+
+            # the least recently used grid cell is evicted
+            cache.find_indexes("query_url", "33.8N84.3W")
+            assert list(cache.entries.keys()) == ["33.8N84.3W"]
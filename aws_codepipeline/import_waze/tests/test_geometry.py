@@ -0,0 +1,64 @@
+import numpy as np
+
+from geometry import point_segment_distances, point_distances, point_in_polygon
+
+
+class TestGeometry:
+
+    def test_point_segment_distances(self):
+
+        # define the query point and the segments around it
+        lat = 33.8862
+        lon = -84.1335
+        start_lat = np.array([33.8870, 33.8862, 33.8850, 33.8860])
+        start_lon = np.array([-84.1340, -84.1336, -84.1335, -84.1340])
+        end_lat = np.array([33.8870, 33.8862, 33.8850, 33.8860])
+        end_lon = np.array([-84.1330, -84.1334, -84.1335, -84.1340])
+
+        # define the expected outputs of the test function
+        expected_distances = [291.13, 0.0, 436.69, 168.3] # WGS84 geodesic distances rounded to two decimal places
+        expected_order = [1, 3, 0, 2]
+
+        # run the test function
+        distances, order = point_segment_distances(lat, lon, start_lat, start_lon, end_lat, end_lon)
+
+        # make sure the values are the same between expected and the actual
+        assert np.round(distances, 2).tolist() == expected_distances
+        assert order.tolist() == expected_order
+
+
+    def test_point_segment_distances_ties(self):
+
+        # define two identical segments and an empty segment list
+        lat = 33.89
+        lon = -84.15
+        segment_lat = np.array([33.8901, 33.8901])
+        segment_lon = np.array([-84.1501, -84.1501])
+        empty = np.array([])
+
+        # run the test function
+        _, order = point_segment_distances(lat, lon, segment_lat, segment_lon, segment_lat, segment_lon)
+        distances, empty_order = point_segment_distances(lat, lon, empty, empty, empty, empty)
+
+        # make sure ties keep the order of the segments and empty inputs are supported
+        assert order.tolist() == [0, 1]
+        assert distances.size == 0
+        assert empty_order.size == 0
+
+
+    def test_point_distances(self):
+
+        # one thousandth of a degree of latitude is about 364 ft at the study area
+        distances = point_distances(33.89, -84.15, np.array([33.891, 33.89]), np.array([-84.15, -84.15]))
+
+        assert np.round(distances, 2).tolist() == [363.91, 0.0]
+
+
+    def test_point_in_polygon(self):
+
+        # define a square around the query points as (lat, lon) vertices
+        square = [(33.89, -84.15), (33.90, -84.15), (33.90, -84.14), (33.89, -84.14)]
+
+        assert point_in_polygon(33.895, -84.145, square)
+        assert not point_in_polygon(33.905, -84.145, square)
+        assert not point_in_polygon(33.89, -84.145, square) # on the boundary
@@ -0,0 +1,112 @@
+import numpy as np
+
+from geometry import point_segment_distances
+from intersection_index import IntersectionBoxIndex
+
+
+class TestIntersectionBoxIndex:
+
+    def setup_method(self):
+
+        # define the 4 crosswalks, each about 60 ft long, of an intersection centered at (33.8862, -84.1335)
+        lat, lon = 33.8862, -84.1335
+        dlat, dlon = 0.0000823, 0.0000992 # about 30 ft
+        crosswalks = [
+            ((lat + dlat, lon - dlon), (lat + dlat, lon + dlon)), # north
+            ((lat - dlat, lon + dlon), (lat - dlat, lon - dlon)), # south
+            ((lat - dlat, lon + dlon), (lat + dlat, lon + dlon)), # east
+            ((lat + dlat, lon - dlon), (lat - dlat, lon - dlon)), # west
+        ]
+
+        self.start_lat = np.array([start[0] for start, _ in crosswalks])
+        self.start_lon = np.array([start[1] for start, _ in crosswalks])
+        self.end_lat = np.array([end[0] for _, end in crosswalks])
+        self.end_lon = np.array([end[1] for _, end in crosswalks])
+        self.center = (lat, lon)
+        self.lat_per_ft = dlat / 30.0
+
+
+    def test_crosswalk_boxes(self):
+
+        # build the index and run the test function
+        index = IntersectionBoxIndex.build_crosswalk_boxes(self.start_lat, self.start_lon, self.end_lat, self.end_lon)
+        lat, lon = self.center
+
+        # make sure the point in the intersection is found in a box, and the point 0.1 mile away is not
+        assert index.contains(lat + 0.00001, lon + 0.00001)
+        assert not index.contains(lat + 528 * self.lat_per_ft, lon)
+
+        # the box of a pair of crosswalks is found under the pair, or drawn from the crosswalks if no crosswalk drew it
+        assert index.contains_pair(lat + 0.00001, lon + 0.00001, *next(iter(index.pairs)))
+        pair = next((close, far) for close in range(4) for far in range(4) if (close, far) not in index.pairs)
+        boxes = len(index.boxes)
+        assert not index.contains_pair(lat + 528 * self.lat_per_ft, lon, *pair)
+        assert pair in index.pairs and len(index.boxes) == boxes + 1
+
+        # no box is drawn if the 4th nearest crosswalk is beyond the intersection distance
+        index = IntersectionBoxIndex.build_crosswalk_boxes(self.start_lat, self.start_lon, self.end_lat, self.end_lon,
+                                                           box_distance=10.0)
+        assert not index.boxes
+
+
+    def test_traffic_signal_boxes(self):
+
+        # build the index; half of the side of the boxes is 30 ft plus the 20 ft buffer
+        index = IntersectionBoxIndex.build_traffic_signal_boxes(self.start_lat, self.start_lon, self.end_lat, 
+                                                                self.end_lon)
+        lat, lon = self.center
+
+        # make sure the boxes are measured in ft around the center of the intersection
+        assert index.contains(lat + 45 * self.lat_per_ft, lon)
+        assert not index.contains(lat + 55 * self.lat_per_ft, lon)
+
+        # behavior change: the shapely buffer of 50 "ft" used to be applied to lat/lon degrees, so every deviated point
+        # of a grid cell with 4 traffic signal crosswalks was counted as near a traffic light intersection
+        assert not index.contains(lat + 0.001, lon)
+        assert not index.contains(lat + 0.05, lon - 0.05)
+
+
+    def test_to_bytes(self):
+
+        # save the index to a compressed file and read it back
+        index = IntersectionBoxIndex.build_crosswalk_boxes(self.start_lat, self.start_lon, self.end_lat, self.end_lon,
+                                                           signature=(4, "1234"))
+        loaded_index = IntersectionBoxIndex.from_bytes(index.to_bytes())
+
+        # make sure the boxes and the signature are the same between the saved and the loaded index
+        assert np.allclose(loaded_index.boxes, index.boxes)
+        assert loaded_index.signature == (4, "1234")
+        assert loaded_index.buckets == index.buckets
+
+
+    def test_find_nearest_crosswalks(self):
+
+        # define intersections every 0.002 degrees on a line, each with 4 crosswalks, and a lone crosswalk 0.05 degrees away
+        start_lat, start_lon, end_lat, end_lon = [], [], [], []
+        for shift in np.arange(10) * 0.002:
+            start_lat.extend(self.start_lat + shift)
+            start_lon.extend(self.start_lon + shift)
+            end_lat.extend(self.end_lat + shift)
+            end_lon.extend(self.end_lon + shift)
+        start_lat, start_lon = np.array(start_lat + [33.94]), np.array(start_lon + [-84.08])
+        end_lat, end_lon = np.array(end_lat + [33.9401]), np.array(end_lon + [-84.08])
+
+        # run the test function with and without a maximum distance
+        nearest_crosswalks = list(IntersectionBoxIndex.find_nearest_crosswalks(start_lat, start_lon, end_lat, end_lon))
+        close_crosswalks = list(IntersectionBoxIndex.find_nearest_crosswalks(start_lat, start_lon, end_lat, end_lon,
+                                                                             300.0, 300.0))
+
+        # make sure the 4 nearest crosswalks found in the grid are the ones found among all the crosswalks of the cell
+        for index, ((distances, nearest), (close_distances, close)) in enumerate(zip(nearest_crosswalks, close_crosswalks)):
+            middle_lat = (start_lat[index] + end_lat[index]) / 2.0
+            middle_lon = (start_lon[index] + end_lon[index]) / 2.0
+            all_distances, order = point_segment_distances(middle_lat, middle_lon, start_lat, start_lon, end_lat, end_lon)
+
+            assert list(nearest[:4]) == list(order[:4])
+            assert np.allclose(distances[:4], all_distances[order[:4]])
+            assert list(close[close_distances <= 300.0]) == [i for i in order if all_distances[i] <= 300.0]
+
+        # each crosswalk of an intersection draws a box; the lone crosswalk draws one with the crosswalks of the
+        # nearest intersection only if the distance is unlimited
+        assert len(IntersectionBoxIndex.build_crosswalk_boxes(start_lat, start_lon, end_lat, end_lon).boxes) == 40
+        assert len(IntersectionBoxIndex.build_traffic_signal_boxes(start_lat, start_lon, end_lat, end_lon).boxes) == 41
@@ -0,0 +1,71 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from neptune_loader import NeptuneLoaderClient
+
+
+class LoaderStandIn(BaseHTTPRequestHandler):
+
+    # local stand-in of the Neptune loader endpoint: each job is in progress for 2 status requests, then completed
+    jobs = {}
+
+    def send_json(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode("utf-8"))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        load_id = "load-{}".format(len(self.jobs) + 1)
+        self.jobs[load_id] = {"request": request, "polls": 0}
+        self.send_json({"status": "200 OK", "payload": {"loadId": load_id}})
+
+    def do_GET(self):
+        load_id = self.path.strip("/").split("/")[-1]
+        if load_id not in self.jobs:
+            self.send_json({"code": "BadRequestException", "detailedMessage": "Load id {} not found".format(load_id)})
+            return
+        job = self.jobs[load_id]
+        job["polls"] += 1
+        status = "LOAD_IN_PROGRESS" if job["polls"] <= 2 else "LOAD_COMPLETED"
+        self.send_json({"status": "200 OK", "payload": {"overallStatus": {"status": status}}})
+
+    def log_message(self, *args):
+        return
+
+
+class TestNeptuneLoaderClient:
+
+    def test_submit_wait(self):
+
+        # start the loader stand-in on a free local port
+        LoaderStandIn.jobs = {}
+        server = HTTPServer(("127.0.0.1", 0), LoaderStandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            loader = NeptuneLoaderClient("http://127.0.0.1:{}/loader".format(server.server_port))
+
+            # run the test functions
+            vertex_load_ids, edge_load_ids = loader.submit_vertices_edges(["s3://bucket/waze/api/node.csv"],
+                                                                          ["s3://bucket/waze/api/relationship.csv"])
+            statuses = loader.wait_all(interval=0.01)
+
+            # an unknown loadId gets an error response without a payload
+            with pytest.raises(Exception, match="status of the bulk load load-9 is not available"):
+                loader.status("load-9")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # make sure the edge load depends on the vertex load and both are polled until completed
+        assert vertex_load_ids == ["load-1"]
+        assert edge_load_ids == ["load-2"]
+        assert LoaderStandIn.jobs["load-2"]["request"]["dependencies"] == ["load-1"]
+        assert LoaderStandIn.jobs["load-2"]["request"]["source"] == "s3://bucket/waze/api/relationship.csv"
+        assert statuses == {"load-1": "LOAD_COMPLETED", "load-2": "LOAD_COMPLETED"}
+        assert LoaderStandIn.jobs["load-1"]["polls"] == 3
@@ -0,0 +1,87 @@
+from spatial_index import SegmentGridIndex, CentroidGridIndex
+
+
+class SegmentRecord:
+
+    # stand in for the neo4j record returned by the sidewalk/crosswalk queries
+    def __init__(self, way_key, way_id, start_latlon, end_latlon):
+
+        self.record_data = {
+            way_key: {"id": way_id, "__datasetid": "33.8N84.2W"},
+            "node1": {"lat": start_latlon[0], "lon": start_latlon[1]},
+            "node2": {"lat": end_latlon[0], "lon": end_latlon[1]},
+        }
+
+    def data(self):
+
+        return self.record_data
+
+
+class TestSegmentGridIndex:
+
+    def test_query_within_radius(self):
+
+        # define the sidewalk segments around the waze alert at (33.8862, -84.1335)
+        records = [
+            SegmentRecord("sidewalk", "near", (33.8862, -84.13352), (33.88632, -84.133484)), # a few ft away
+            SegmentRecord("sidewalk", "long", (33.8800, -84.1400), (33.8900, -84.1300)), # crosses many buckets
+            SegmentRecord("sidewalk", "far", (33.8962, -84.1235), (33.8963, -84.1236)), # ~0.9 mile away
+        ]
+
+        # define the expected outputs of the test function
+        expected_way_ids_weather = ["near", "long"]
+        expected_way_ids_nearby = ["near", "long"]
+
+        # build the spatial index and run the test function
+        index = SegmentGridIndex(records, "sidewalk")
+        way_ids_weather = [index.ways[i]["id"] for i in index.query(33.8862, -84.1335, 1000.0)]
+        way_ids_nearby = [index.ways[i]["id"] for i in index.query(33.8862, -84.1335, 20.0)]
+
+        # make sure the candidates are the same between expected and the actual
+        assert way_ids_weather == expected_way_ids_weather
+        assert way_ids_nearby == expected_way_ids_nearby
+        assert index.first_latlon[0] == (33.8862, -84.13352)
+        assert index.last_latlon[0] == (33.88632, -84.133484)
+
+
+    def test_query_no_candidates(self):
+
+        # define a single crosswalk segment far from the waze alert
+        records = [SegmentRecord("crosswalk", "far", (33.89015, -84.14857), (33.89015, -84.14854))]
+
+        # build the spatial index and run the test function
+        index = SegmentGridIndex(records, "crosswalk")
+        indices = index.query(33.810679, -84.181536, 1000.0)
+
+        # make sure no candidate is returned
+        assert len(indices) == 0
+
+
+class TestCentroidGridIndex:
+
+    def test_nearest(self):
+
+        # define the GT/CE-SIDEWALK centroids as returned by the sidewalk query
+        records = [
+            {"ID(sidewalk)": "far", "sidewalk.__datasetid": "33.9N84.1W",
+             "sidewalk.sidewalksimLinkCentroidLatitude": 33.9500, "sidewalk.sidewalksimLinkCentroidLongitude": -84.0500},
+            {"ID(sidewalk)": "near", "sidewalk.__datasetid": "33.8N84.2W",
+             "sidewalk.sidewalksimLinkCentroidLatitude": 33.8870, "sidewalk.sidewalksimLinkCentroidLongitude": -84.1343},
+            {"ID(sidewalk)": "next-bucket", "sidewalk.__datasetid": "33.8N84.2W",
+             "sidewalk.sidewalksimLinkCentroidLatitude": 33.8876, "sidewalk.sidewalksimLinkCentroidLongitude": -84.1335},
+            {"ID(sidewalk)": "no-centroid", "sidewalk.__datasetid": "33.8N84.2W",
+             "sidewalk.sidewalksimLinkCentroidLatitude": None, "sidewalk.sidewalksimLinkCentroidLongitude": None},
+        ]
+
+        # build the index and run the test function
+        index = CentroidGridIndex(records)
+        nearest = index.nearest(33.8862, -84.1335)
+        nearest_far_away = index.nearest(34.5, -83.5)
+
+        # make sure the nearest sidewalk uses the sum of absolute lat and lon differences,
+        # and nodes without a centroid are skipped
+        assert index.ids == ["far", "near", "next-bucket"]
+        assert index.ids[nearest] == "next-bucket"
+        assert index.datasetids[nearest] == "33.8N84.2W"
+        assert index.ids[nearest_far_away] == "far"
+        assert CentroidGridIndex([]).nearest(33.8862, -84.1335) is None
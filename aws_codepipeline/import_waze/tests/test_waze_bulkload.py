@@ -0,0 +1,39 @@
+import sys
+from unittest.mock import MagicMock
+
+# mock libraries not being used in the tests
+sys.modules["neo4j"] = MagicMock()
+
+from query_writer_waze_bulkload import WazeBulkLoadStaging
+
+
+class TestWazeBulkLoadStaging:
+
+    def test_replace_relationship(self):
+
+        # define the waze nodes and relationships staged for bulk load
+        old_node = {"~id": "old", "~label": "WAZE-ALERT", "subtype:String(single)": "HAZARD_WEATHER_FLOOD",
+                    "endTimeMillis:Long(single)": 1000}
+        new_node = {"~id": "new", "~label": "WAZE-ALERT", "subtype:String(single)": "HAZARD_WEATHER_FLOOD",
+                    "endTimeMillis:Long(single)": 2000}
+        old_relationship = {"~id": "10-old", "~label": "WAZE-ALERT", "~from": "10", "~to": "old"}
+        new_relationship = {"~id": "10-new", "~label": "WAZE-ALERT", "~from": "10", "~to": "new"}
+
+        # stage the old waze node and replace it with the new one
+        staging = WazeBulkLoadStaging()
+        staging.add_node(old_node)
+        staging.add_relationship(old_relationship)
+
+        assert staging.find_relationship("10", "HAZARD_WEATHER_FLOOD") is old_node
+        assert staging.find_relationship("10", "HAZARD_WEATHER_HEAVY_SNOW") is None
+
+        staging.add_node(new_node)
+        staging.add_relationship(new_relationship)
+        staging.remove_node("old")
+        staging.remove_relationship("10-old")
+
+        # make sure only the new waze node and relationship are left for the CSV files
+        assert staging.find_node("old") is None
+        assert staging.find_relationship("10", "HAZARD_WEATHER_FLOOD") is new_node
+        assert staging.node_rows() == [new_node]
+        assert staging.relationship_rows() == [new_relationship]
@@ -0,0 +1,74 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from waze_feed_fetcher import WazeFeedFetcher
+
+
+class WazeFeedHandler(BaseHTTPRequestHandler):
+
+    # stand in for the Waze partner hub, "/etag" answers conditional requests and "/plain" ignores them
+    payload = json.dumps({"alerts": [], "startTimeMillis": 0, "endTimeMillis": 0}).encode("utf-8")
+
+    def do_GET(self):
+
+        if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.payload)))
+
+        if self.path == "/etag":
+            self.send_header("ETag", '"v1"')
+
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+
+    def log_message(self, format, *args):
+
+        return # keep the test output quiet
+
+
+class TestWazeFeedFetcher:
+
+    def test_fetch_all(self):
+
+        # start the local Waze feed stub
+        server = ThreadingHTTPServer(("127.0.0.1", 0), WazeFeedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+        # define the grid cells served by the stub, the last one cannot be reached
+        urls = {"33.8N84.2W": base_url + "/etag", "33.9N84.2W": base_url + "/plain", 
+                "34.0N84.2W": "http://127.0.0.1:1/closed"}
+
+        try:
+
+            # run the test function three times, as runs of the same warm container; the feeds of the first run
+            # are only committed once the second run has retrieved them again, as after a failed ingestion
+            fetcher = WazeFeedFetcher(urls, timeout=5)
+            first_run = fetcher.fetch_all()
+            retry_run = fetcher.fetch_all()
+            for name, result in retry_run.items():
+                fetcher.commit(name, result)
+            second_run = fetcher.fetch_all()
+            unknown = fetcher.fetch_feed("35.0N84.2W")
+
+        finally:
+
+            server.shutdown()
+            server.server_close()
+
+        # make sure new feeds are returned until committed, then skipped by ETag or by content hash
+        assert [first_run[name]["status"] for name in urls] == ["changed", "changed", "error"]
+        assert [retry_run[name]["status"] for name in urls] == ["changed", "changed", "error"]
+        assert [second_run[name]["status"] for name in urls] == ["not-modified", "unchanged", "error"]
+        assert first_run["33.8N84.2W"]["data"]["alerts"] == []
+        assert second_run["33.9N84.2W"]["data"] is None
+        assert all(result["elapsed"] >= 0.0 for result in second_run.values())
+        assert unknown["status"] == "error"
+        assert "35.0N84.2W" in unknown["error"]
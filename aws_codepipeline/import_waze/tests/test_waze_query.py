@@ -1,5 +1,5 @@
 import sys
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
 # mock libraries not being used in the tests
 sys.modules["shapely.geometry"] = MagicMock()
@@ -100,3 +100,83 @@ class TestWazeIngestions:
 
             count += 1
 
+
+    def test_batch_write(self, query_url, waze_input_data, sidewalk_input_data,
+                         crosswalk_input_data):
+
+        # define inputs to the WazeAlertsQueries class
+        method = "POST"
+        data = waze_input_data # fixture
+        sidewalk_records = sidewalk_input_data # fixture
+        crosswalk_records = crosswalk_input_data # fixture
+
+        # call the WazeAlertsQueries class with defined inputs, no waze node exists in the database
+        wazeQueryObj = WazeAlertsQueries(query_url, method, data, sidewalk_records, crosswalk_records, batch_write=True)
+        wazeQueryObj.driver = MagicMock()
+        wazeQueryObj.driver.execute_query.return_value = ([], None, None)
+
+        # specify the test inputs, two alerts with the same subtype attached to the same sidewalk node
+        osm_node = {"id": "544894254", "__datasetid": "33.8N84.2W"}
+        old_alert = {**data["alerts"][2], "location": dict(data["alerts"][2]["location"]), "uuid": "old"}
+        new_alert = {**data["alerts"][2], "location": dict(data["alerts"][2]["location"]), "uuid": "new"}
+
+        # run the test function
+        wazeQueryObj.create_update_waze_node_link(osm_node, "SIDEWALK", old_alert, 
+                                                  {"endTimeMillis": 1000, "endTime": "old"})
+        wazeQueryObj.create_update_waze_node_link(osm_node, "SIDEWALK", new_alert, 
+                                                  {"endTimeMillis": 2000, "endTime": "new"})
+
+        # make sure the old waze node is replaced in memory and nothing is written before the flush
+        assert list(wazeQueryObj.pending_nodes.keys()) == ["new"]
+        assert [row["uuid"] for row in wazeQueryObj.pending_relationships.values()] == ["new"]
+        assert wazeQueryObj.pending_detached_uuids == {"old"}
+
+        wazeQueryObj.driver.execute_query.reset_mock()
+        wazeQueryObj.write_batch()
+
+        # make sure each kind of write is sent as a single UNWIND statement
+        calls = wazeQueryObj.driver.execute_query.call_args_list
+        assert len(calls) == 3
+        assert all(call.args[0].startswith("UNWIND $rows") for call in calls)
+        assert calls[0].kwargs["rows"] == ["old"]
+        assert calls[1].kwargs["rows"][0]["endTimeMillis"] == 2000
+        assert calls[2].kwargs["rows"][0]["__impedance_factor"] == 10
+
+
+    def test_prefetch_waze_state(self, query_url, waze_input_data, sidewalk_input_data,
+                                 crosswalk_input_data):
+
+        # define inputs to the WazeAlertsQueries class
+        method = "POST"
+        data = waze_input_data # fixture
+        sidewalk_records = sidewalk_input_data # fixture
+        crosswalk_records = crosswalk_input_data # fixture
+
+        # call the WazeAlertsQueries class with defined inputs, an old waze node with the same subtype 
+        # as the third alert is attached to the sidewalk node in the database, possibly from a neighboring grid cell
+        osm_node = {"id": "544894254", "__datasetid": "33.8N84.2W"}
+        existing_record = {"waze.uuid": "old", "waze.type": data["alerts"][2]["type"], 
+                           "waze.subtype": data["alerts"][2]["subtype"], "waze.endTimeMillis": 1000, 
+                           "way_ids": [osm_node["id"]]}
+
+        wazeQueryObj = WazeAlertsQueries(query_url, method, data, sidewalk_records, crosswalk_records, batch_write=True)
+        wazeQueryObj.driver = MagicMock()
+        wazeQueryObj.driver.execute_query.return_value = ([existing_record], None, None)
+        wazeQueryObj.sidewalk_index = MagicMock(ways=[osm_node])
+        wazeQueryObj.crosswalk_index = MagicMock(ways=[])
+
+        # run the test function
+        wazeQueryObj.prefetch_waze_state()
+
+        new_alert = {**data["alerts"][2], "location": dict(data["alerts"][2]["location"]), "uuid": "new"}
+        wazeQueryObj.create_update_waze_node_link(osm_node, "SIDEWALK", new_alert, 
+                                                  {"endTimeMillis": 2000, "endTime": "new"})
+
+        # make sure the old waze node is replaced using the prefetched state and a single read query
+        assert wazeQueryObj.driver.execute_query.call_count == 1
+        assert wazeQueryObj.driver.execute_query.call_args.kwargs["datasetids"] == ["33.8N84.2W"]
+        assert wazeQueryObj.driver.execute_query.call_args.kwargs["way_ids"] == ["544894254"]
+        assert "osm.id IN $way_ids" in wazeQueryObj.driver.execute_query.call_args.args[0]
+        assert wazeQueryObj.match_waze_node("old") == (False, None)
+        assert wazeQueryObj.match_waze_node("new") == (True, 2000)
+        assert wazeQueryObj.pending_detached_uuids == {"old"}
@@ -0,0 +1,53 @@
+import io
+import json
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+from waze_snapshot_cache import WazeSnapshotCache
+
+
+class TestWazeSnapshotCache:
+
+    def test_find_delta(self, waze_input_data):
+
+        # define the previous feed with the first two alerts, the second one with a new reliability
+        data = waze_input_data # fixture
+        previous_data = {"endTimeMillis": data["endTimeMillis"] - 120000, 
+                         "alerts": [data["alerts"][0], {**data["alerts"][1], "reliability": 1}, {"uuid": "gone"}]}
+
+        # no snapshot is saved in the S3 bucket yet
+        s3_client = MagicMock()
+        s3_client.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        snapshot_cache = WazeSnapshotCache(s3_client)
+
+        # run the test function before and after the previous snapshot is saved
+        assert snapshot_cache.load("bucket", "33.8N84.2W", previous_data["endTimeMillis"]) is None
+
+        snapshot_cache.save("bucket", "33.8N84.2W", snapshot_cache.build_snapshot(previous_data))
+        snapshot = snapshot_cache.build_snapshot(data)
+        previous_snapshot = snapshot_cache.load("bucket", "33.8N84.2W", data["endTimeMillis"])
+        new_uuids, updated_uuids, unchanged_uuids, vanished_uuids = snapshot_cache.find_delta(previous_snapshot, snapshot)
+
+        # make sure the alerts are classified w.r.t. the previous snapshot
+        assert new_uuids == [data["alerts"][2]["uuid"]]
+        assert updated_uuids == [data["alerts"][1]["uuid"]]
+        assert unchanged_uuids == [data["alerts"][0]["uuid"]]
+        assert vanished_uuids == ["gone"]
+        assert s3_client.put_object.call_args.kwargs["Key"] == "waze-snapshots/33.8N84.2W.json"
+
+
+    def test_load_s3(self, waze_input_data):
+
+        # define a snapshot saved by another container, 10 minutes before the current feed
+        data = waze_input_data # fixture
+        saved_snapshot = {"endTimeMillis": data["endTimeMillis"] - 600000, "alerts": {}}
+
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {"Body": io.BytesIO(json.dumps(saved_snapshot).encode("utf-8"))}
+        snapshot_cache = WazeSnapshotCache(s3_client)
+
+        # make sure the snapshot is read from the S3 bucket once, and not used since it is too old
+        assert snapshot_cache.load("bucket", "33.8N84.2W", data["endTimeMillis"]) is None
+        assert snapshot_cache.load("bucket", "33.8N84.2W", saved_snapshot["endTimeMillis"]) == saved_snapshot
+        assert s3_client.get_object.call_count == 1
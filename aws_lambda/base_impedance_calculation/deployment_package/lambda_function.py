@@ -1,5 +1,4 @@
 import json
-import requests
 import numpy
 import pandas as pd
 from neo4j import GraphDatabase, RoutingControl
@@ -7,6 +6,8 @@ import datetime
 import boto3
 from time import time
 
+from neptune_loader import NeptuneLoaderClient
+
 numTravelTypes = -18
 
 def lambda_handler(event, context):
@@ -236,19 +237,8 @@ def lambda_handler(event, context):
     s3 = boto3.client('s3')
     s3.upload_file("/tmp/base_impedance_calculation.csv", LOAD_BUCKET, "base_impedance_calculation/base_impedance_calculation.csv")
 
-    bulkLoad_json = {
-            "source" : "s3://{}/base_impedance_calculation".format(LOAD_BUCKET),
-            "format" : "csv",
-            "iamRoleArn" : "arn:aws:iam::760336115441:role/neptune-s3-read-access",
-            "region" : "us-east-2",
-            "failOnError" : "FALSE",
-            "parallelism" : "MEDIUM",
-            "updateSingleCardinalityProperties" : "TRUE",
-            "queueRequest" : "TRUE",
-            "dependencies" : []
-        }
-
-    bulkLoad_response = requests.post(LOADER_URL, json=bulkLoad_json)
+    loader = NeptuneLoaderClient(LOADER_URL)
+    load_id = loader.submit("s3://{}/base_impedance_calculation".format(LOAD_BUCKET))
 
     return {
         'statusCode': 200,
@@ -256,7 +246,7 @@ def lambda_handler(event, context):
                     'Access-Control-Allow-Headers': 'Content-Type', 
                     'Access-Control-Allow-Origin':'*', 
                     'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
-        'body': json.dumps(bulkLoad_response.json())
+        'body': json.dumps(loader.responses[load_id])
     }
 
     
\ No newline at end of file
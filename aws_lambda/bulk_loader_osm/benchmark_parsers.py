@@ -0,0 +1,83 @@
+"""
+Benchmark of the OSM XML parser backends selectable in driver.main: xml.sax with OsmDataHandler, and pyexpat
+with OsmExpatParser. A synthetic extract is generated, each backend parses it into a receiver that only counts
+the elements, and the throughput is reported in elements (nodes, ways and relations) per second.
+
+    python benchmark_parsers.py [number of nodes]
+
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from driver import parse
+
+
+def write_synthetic_extract(path, num_nodes):
+
+    # write nodes with a few tags, ways of 2 to 10 nodes, and relations of 2 to 5 ways, in the OSM xml layout
+    random.seed(0)
+    num_ways = num_nodes // 5
+    num_relations = num_ways // 20
+
+    with open(path, "w") as xmlFile:
+        xmlFile.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="benchmark">\n')
+
+        for nodeId in range(1, num_nodes + 1):
+            lat = 33.8 + random.random() * 0.3
+            lon = -84.4 + random.random() * 0.5
+            if nodeId % 10:
+                xmlFile.write(' <node id="{}" lat="{:.7f}" lon="{:.7f}" version="1"/>\n'.format(nodeId, lat, lon))
+            else:
+                xmlFile.write(' <node id="{}" lat="{:.7f}" lon="{:.7f}" version="1">\n'.format(nodeId, lat, lon))
+                xmlFile.write('  <tag k="highway" v="crossing"/>\n  <tag k="crossing" v="traffic_signals"/>\n </node>\n')
+
+        for wayId in range(1, num_ways + 1):
+            xmlFile.write(' <way id="{}" version="1">\n'.format(wayId))
+            for _ in range(random.randint(2, 10)):
+                xmlFile.write('  <nd ref="{}"/>\n'.format(random.randint(1, num_nodes)))
+            xmlFile.write('  <tag k="highway" v="footway"/>\n  <tag k="footway" v="sidewalk"/>\n </way>\n')
+
+        for relationId in range(1, num_relations + 1):
+            xmlFile.write(' <relation id="{}" version="1">\n'.format(relationId))
+            for _ in range(random.randint(2, 5)):
+                xmlFile.write('  <member type="way" ref="{}" role="outer"/>\n'.format(random.randint(1, num_ways)))
+            xmlFile.write('  <tag k="type" v="multipolygon"/>\n </relation>\n')
+
+        xmlFile.write('</osm>\n')
+
+    return num_nodes + num_ways + num_relations
+
+
+def benchmark(path, parser):
+
+    # parse the extract and count the elements received
+    counts = {"elements": 0}
+
+    def receiver(data):
+        if 'type' in data:
+            counts["elements"] += 1
+
+    start = time.perf_counter()
+    parse(path, receiver, parser=parser)
+    elapsed = time.perf_counter() - start
+
+    return counts["elements"], elapsed
+
+
+if __name__ == "__main__":
+
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.osm")
+        num_elements = write_synthetic_extract(path, num_nodes)
+        print("SYNTHETIC EXTRACT: {} ELEMENTS, {:.1f} MB".format(num_elements, os.path.getsize(path) / 2**20))
+
+        for parser in ["sax", "expat"]:
+            count, elapsed = benchmark(path, parser)
+            assert count == num_elements
+            print("{:>6}: {:.2f} s, {:,.0f} ELEMENTS/S".format(parser, elapsed, count / elapsed))
@@ -0,0 +1,131 @@
+"""
+The script contains the checkpoints of an OSM import that runs as a chain of invocations, e.g. Lambda
+functions stopped before their 15 minute limit.
+
+The import state is saved as a manifest (manifest.json) with the byte offset of the next element in the xml,
+the element counts, the tag keys, the node store state and the names of the completed CSV parts. The parts are
+put to the part store, where the Neptune loader reads them; the manifest and the node store files are put to
+the state store, where the next invocation gets them to resume from the offset:
+    LocalCheckpointStore: parts/ and state/ directories, e.g. for local runs and tests
+    S3CheckpointStore: <prefix>/ for the parts and <prefix>-checkpoint/ for the state
+
+OsmImportCheckpoint decides when a checkpoint is saved: every `every` elements, or as soon as the remaining
+time of the invocation is below `reserve` seconds, in which case the import is stopped after the checkpoint.
+
+"""
+
+import json
+import os
+import shutil
+
+
+class OsmImportStopped(Exception):
+    # raised at a checkpoint to stop the import until the next invocation
+    pass
+
+
+class LocalCheckpointStore:
+
+    def __init__(self, directory="tmp/checkpoint"):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "parts"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "state"), exist_ok=True)
+
+    def putPart(self, path, name):
+        shutil.copyfile(path, os.path.join(self.directory, "parts", name))
+
+    def deletePart(self, name):
+        if os.path.exists(os.path.join(self.directory, "parts", name)):
+            os.remove(os.path.join(self.directory, "parts", name))
+
+    def putState(self, path, name):
+        shutil.copyfile(path, os.path.join(self.directory, "state", name))
+
+    def getState(self, name, path):
+        # copy the state file to path; False if it does not exist
+        if not os.path.exists(os.path.join(self.directory, "state", name)):
+            return False
+        shutil.copyfile(os.path.join(self.directory, "state", name), path)
+        return True
+
+    def deleteState(self, name):
+        if os.path.exists(os.path.join(self.directory, "state", name)):
+            os.remove(os.path.join(self.directory, "state", name))
+
+
+class S3CheckpointStore:
+
+    def __init__(self, bucket, prefix, client=None):
+
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def putPart(self, path, name):
+        self.client.upload_file(path, self.bucket, "{}/{}".format(self.prefix, name))
+
+    def deletePart(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key="{}/{}".format(self.prefix, name))
+
+    def putState(self, path, name):
+        self.client.upload_file(path, self.bucket, "{}-checkpoint/{}".format(self.prefix, name))
+
+    def getState(self, name, path):
+        # download the state file to path; False if it does not exist
+        from botocore.exceptions import ClientError
+        try:
+            self.client.download_file(self.bucket, "{}-checkpoint/{}".format(self.prefix, name), path)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def deleteState(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key="{}-checkpoint/{}".format(self.prefix, name))
+
+
+class OsmImportCheckpoint:
+
+    def __init__(self, store, every=1000000, remaining_time=None, reserve=120.0):
+
+        self.store = store # LocalCheckpointStore or S3CheckpointStore
+        self.every = every # number of elements between two checkpoints
+        self.remainingTime = remaining_time # function returning the seconds left to the invocation, None if unlimited
+        self.reserve = reserve # seconds needed to save the last checkpoint of the invocation
+
+    def expired(self):
+        return self.remainingTime is not None and self.remainingTime() < self.reserve
+
+    def due(self, elements):
+        # the remaining time is only checked every 1000 elements
+        return elements >= self.every or (elements % 1000 == 0 and self.expired())
+
+    def load(self, directory):
+        # find the manifest of the import in progress; None if the import was not started
+        path = os.path.join(directory, "manifest.json")
+        if not self.store.getState("manifest.json", path):
+            return None
+        with open(path) as manifestFile:
+            return json.load(manifestFile)
+
+    def save(self, directory, manifest):
+        path = os.path.join(directory, "manifest.json")
+        with open(path, "w") as manifestFile:
+            json.dump(manifest, manifestFile)
+        self.store.putState(path, "manifest.json")
+
+    def reset(self, directory):
+        # remove the parts and the state of a previous import, to start the next one from the beginning
+        manifest = self.load(directory)
+        if manifest is None:
+            return
+        for name in manifest["parts"]:
+            self.store.deletePart(name)
+        for name in manifest["nodeStore"]["files"]:
+            self.store.deleteState(name)
+        self.store.deleteState("manifest.json")
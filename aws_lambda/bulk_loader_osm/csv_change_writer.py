@@ -0,0 +1,75 @@
+"""
+The script writes the AWS Neptune bulk load CSVs of an osmChange diff (.osc) instead of a whole extract.
+
+Only the created and modified nodes, ways and relations are written to node.csv, way.csv and relation.csv,
+with the FIRST/LAST/WAY links of the created and modified ways and the MEMBER links of the created and
+modified relations, in the same layout as OsmAWSBulkLoadCSVWriter. The deletions needed before the bulk load
+are written to delete.json:
+    nodes, ways, relations: ids of the deleted elements
+    wayLinks: ids of the deleted, modified and reshaped ways, whose FIRST/LAST/WAY links are deleted
+    relationMembers: ids of the modified relations, whose MEMBER links are deleted
+
+The dataset id of a way comes from its first or last node, and its length, bounding box and end coordinates
+from all its nodes. The nodes of the created and modified ways that are not in the diff are looked up with the
+findNodes function, e.g. from the OSM-NODE nodes already in the database; the geometry columns of a way are left
+empty if any of its nodes is not found.
+
+A modified node may move the ways that use it even if they are not in the diff. These reshaped ways are looked
+up with the findWays function, e.g. from the WAY links already in the database, and written again with their
+geometry and links recomputed; their tag columns are left empty, so the tags in the database are kept.
+
+"""
+
+import json
+
+from csv_writer import OsmAWSBulkLoadCSVWriter
+
+class OsmAWSChangeCSVWriter(OsmAWSBulkLoadCSVWriter):
+
+    def __init__(self, dataset_id="area-unset", directory="tmp", findNodes=None, findWays=None):
+        super().__init__(False, dataset_id, directory)
+        self.findNodes = findNodes # function: list of node ids -> node dictionaries with lat/lon in 'tags'
+        self.findWays = findWays # function: list of node ids -> dictionaries of the ways using them, with 'nodes'
+        self.reshaped = [] # ids of the ways not in the diff written again since some of their nodes moved
+        self.deleted = {"node": [], "way": [], "relation": []}
+        self.modified = {"node": [], "way": [], "relation": []}
+
+    def receive(self, data):
+        if 'type' in data:
+            action = data.get('action', "modify")
+            if action == "delete":
+                self.deleted[data['type']].append(data['id'])
+                return
+            if action == "modify":
+                self.modified[data['type']].append(data['id'])
+        super().receive(data)
+
+    def write(self, data):
+        if self.findWays and self.modified["node"]:
+            # find the ways not in the diff that use the modified nodes, to write their geometry again
+            diffWayIds = {way['id'] for way in self.osmWays} | set(self.deleted["way"])
+            for way in self.findWays(self.modified["node"]):
+                if way['id'] not in diffWayIds:
+                    diffWayIds.add(way['id'])
+                    self.reshaped.append(way['id'])
+                    self.osmWays.append(dict(way, type="way", tags={}))
+
+        if self.findNodes:
+            # find the nodes of the ways that are not in the diff
+            diffNodeIds = {node['id'] for node in self.osmNodes}
+            missingNodeIds = sorted({ref for way in self.osmWays for ref in way['nodes'] if ref not in diffNodeIds})
+            if missingNodeIds:
+                self.referencedNodes = self.findNodes(missingNodeIds)
+
+        super().write(data)
+
+        print("Building OSM change delete list...")
+        deletions = {"nodes": self.deleted["node"], "ways": self.deleted["way"], "relations": self.deleted["relation"],
+                     "wayLinks": self.deleted["way"] + self.modified["way"] + self.reshaped,
+                     "relationMembers": self.modified["relation"]}
+        with open(self.path("delete.json"), "w") as deleteFile:
+            json.dump(deletions, deleteFile)
+
+        print("OSM CHANGE: {} NODES, {} WAYS ({} RESHAPED), {} RELATIONS WRITTEN; {} NODES, {} WAYS, {} RELATIONS DELETED".format(
+            len(self.osmNodes), len(self.osmWays), len(self.reshaped), len(self.osmRelations),
+            len(self.deleted["node"]), len(self.deleted["way"]), len(self.deleted["relation"])))
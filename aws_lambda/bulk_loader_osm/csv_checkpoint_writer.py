@@ -0,0 +1,172 @@
+"""
+The script writes the AWS Neptune bulk load CSVs of an OSM extract in segments that are completed at each
+checkpoint, so that an import stopped at a checkpoint can be resumed by the next invocation, see checkpoint.py.
+
+Rows are written as in the streaming mode of OsmAWSBulkLoadCSVWriter. At a checkpoint the rows of the segment
+become the CSV parts node-0001.csv, way-0001.csv, wayLink-0001.csv, etc., with the tag keys known at the
+checkpoint as header since the tag columns are only ever appended; the parts are put to the part store and
+removed from the directory. The nodes added to the node store since the last checkpoint are put to the state
+store, or the whole sorted store once it was finalized by the first way, with the manifest.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+from csv_writer import OsmAWSBulkLoadCSVWriter
+from checkpoint import OsmImportStopped
+from node_store import OsmNodeStore
+
+
+class OsmAWSCheckpointCSVWriter(OsmAWSBulkLoadCSVWriter):
+
+    def __init__(self, checkpoint, dataset_id="area-unset", directory="tmp", schema="wide", hot_tags=None):
+        self.checkpoint = checkpoint # OsmImportCheckpoint
+        self.manifest = checkpoint.load(directory) or {
+            "segment": 1, "offset": 0, "done": False, "counts": {"node": 0, "way": 0, "relation": 0},
+            "tagKeys": {"node": {}, "way": {}, "relation": {}}, "lastDatasetId": dataset_id, "parts": [],
+            "nodeStore": {"spilled": 0, "inOrder": True, "lastId": None, "sorted": False, "files": []}}
+        super().__init__(True, dataset_id, directory, schema, hot_tags)
+
+    def openStreams(self):
+        # restore the state of the last checkpoint, then open the next segment
+        self.nodeStore = self.restoreNodeStore(self.manifest["nodeStore"])
+        self.lastDatasetId = self.manifest["lastDatasetId"]
+        self.tagKeys = self.manifest["tagKeys"]
+        self.elements = 0 # elements since the last checkpoint
+        if not self.manifest["done"]:
+            self.openSegment()
+
+    def restoreNodeStore(self, state):
+        nodeStore = OsmNodeStore(self.directory)
+        if state["spilled"]:
+            for name in nodeStore.ARRAYS:
+                with open(nodeStore.spillPath(name), "wb") as spillFile:
+                    for fileName in state["files"]:
+                        if fileName.startswith("nodes-{}-".format(name)):
+                            self.checkpoint.store.getState(fileName, self.path(fileName))
+                            with open(self.path(fileName), "rb") as stateFile:
+                                spillFile.write(stateFile.read())
+                            os.remove(self.path(fileName))
+            nodeStore.spilled = state["spilled"]
+            nodeStore.inOrder = state["inOrder"]
+            nodeStore.lastId = state["lastId"]
+        return nodeStore
+
+    def partName(self, name):
+        return "{}-{:04d}.csv".format(name, self.manifest["segment"])
+
+    def openSegment(self):
+        self.rows = {"node": 0, "way": 0, "relation": 0}
+        self.spillFiles = {elementType: self.openSpill(elementType + ".spill", "w") for elementType in self.rows}
+        self.wayLinkFile = self.openCsv(self.partName("wayLink"))
+        self.wayLinkFile.write("~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single)\n")
+        self.relationLinkFile = self.openCsv(self.partName("relationLink"))
+        self.relationLinkFile.write("~id,\t~label,\t~from,\t~to,\trole:String(single),\t__datasetid:String(single)\n")
+
+    def writeElement(self, element):
+        if element['type'] in self.rows:
+            self.rows[element['type']] += 1
+            self.manifest["counts"][element['type']] += 1
+        super().writeElement(element)
+
+    def closeSegment(self):
+        # turn the rows of the segment into CSV parts and put them to the part store
+        self.wayLinkFile.close()
+        self.relationLinkFile.close()
+        parts = []
+        for elementType, spillFile in self.spillFiles.items():
+            spillFile.close()
+            tagKeys = self.tagKeys[elementType]
+            if self.rows[elementType]:
+                with self.openSpill(elementType + ".spill", "r") as spillFile, self.openCsv(self.partName(elementType)) as csvFile:
+                    csvFile.write(self.header(self.COLUMNS[elementType], tagKeys))
+                    for line in spillFile:
+                        count, row = json.loads(line)
+                        csvFile.write(row + ",\t" * (len(tagKeys) - count) + "\n")
+                parts.append(self.partName(elementType))
+            os.remove(self.path(elementType + ".spill"))
+
+        # the link parts are only kept if they have rows
+        if self.rows["way"]:
+            parts.append(self.partName("wayLink"))
+        else:
+            os.remove(self.path(self.partName("wayLink")))
+        if self.rows["relation"]:
+            parts.append(self.partName("relationLink"))
+        else:
+            os.remove(self.path(self.partName("relationLink")))
+
+        for name in parts:
+            self.checkpoint.store.putPart(self.path(name), name)
+            os.remove(self.path(name))
+        self.manifest["parts"] += parts
+
+    def saveNodeStore(self):
+        # put the nodes added since the last checkpoint to the state store, or the whole store once it is sorted
+        nodeStore = self.nodeStore
+        state = self.manifest["nodeStore"]
+        segment = self.manifest["segment"]
+
+        if nodeStore.finalized:
+            if state["sorted"]:
+                return
+            arrays = {"ids": nodeStore.ids, "lats": nodeStore.lats, "lons": nodeStore.lons,
+                      "latCells": nodeStore.latCells, "lonCells": nodeStore.lonCells}
+            files = []
+            for name, values in arrays.items():
+                fileName = "nodes-{}-{:04d}.bin".format(name, segment)
+                np.asarray(values).tofile(self.path(fileName))
+                self.checkpoint.store.putState(self.path(fileName), fileName)
+                os.remove(self.path(fileName))
+                files.append(fileName)
+            for fileName in state["files"]:
+                self.checkpoint.store.deleteState(fileName)
+            state.update({"spilled": len(nodeStore.ids), "inOrder": True, "sorted": True, "files": files})
+            return
+
+        saved = state["spilled"]
+        nodeStore.spill()
+        if nodeStore.spilled == saved:
+            return
+        for name, (_, dtype) in nodeStore.ARRAYS.items():
+            fileName = "nodes-{}-{:04d}.bin".format(name, segment)
+            with open(nodeStore.spillPath(name), "rb") as spillFile, open(self.path(fileName), "wb") as stateFile:
+                spillFile.seek(saved * np.dtype(dtype).itemsize)
+                stateFile.write(spillFile.read())
+            self.checkpoint.store.putState(self.path(fileName), fileName)
+            os.remove(self.path(fileName))
+            state["files"].append(fileName)
+        state.update({"spilled": nodeStore.spilled, "inOrder": nodeStore.inOrder, "lastId": nodeStore.lastId})
+
+    def saveCheckpoint(self, offset):
+        self.closeSegment()
+        self.saveNodeStore()
+        self.manifest.update({"segment": self.manifest["segment"] + 1, "offset": offset,
+                              "tagKeys": self.tagKeys, "lastDatasetId": self.lastDatasetId})
+        self.checkpoint.save(self.directory, self.manifest)
+        print("CHECKPOINT {}: OFFSET {}, {} NODES, {} WAYS, {} RELATIONS".format(
+            self.manifest["segment"] - 1, offset, *self.manifest["counts"].values()))
+
+    def checkpointAt(self, offset):
+        # called by the parser at the byte offset where each element starts, before the element is parsed
+        self.elements += 1
+        if not self.checkpoint.due(self.elements):
+            return
+        self.saveCheckpoint(offset)
+        self.elements = 0
+        if self.checkpoint.expired():
+            self.nodeStore.close()
+            raise OsmImportStopped(offset)
+        self.openSegment()
+
+    def finish(self):
+        self.closeSegment()
+        self.nodeStore.close()
+        self.manifest.update({"segment": self.manifest["segment"] + 1, "offset": None, "done": True,
+                              "tagKeys": self.tagKeys, "lastDatasetId": self.lastDatasetId})
+        self.checkpoint.save(self.directory, self.manifest)
+        print("IMPORT DONE: {} NODES, {} WAYS, {} RELATIONS IN {} PARTS".format(
+            *self.manifest["counts"].values(), len(self.manifest["parts"])))
@@ -0,0 +1,111 @@
+"""
+The script writes the AWS Neptune bulk load CSVs of an OSM extract partitioned by the 0.1 degree grid cell
+of the dataset id (e.g. 33.9N84.3W) instead of one file per element type.
+
+Each cell gets its own directory with node.csv, way.csv, wayLink.csv and, for the relations, relation.csv and
+relationLink.csv; the header of each part only has the tag keys present in the cell. A way is written to the
+cell of its dataset id, i.e. the cell of its first (or else last) node, with all its FIRST/LAST/WAY links, so
+the ways crossing a cell boundary are written once and deleted with the cell by OsmAWSDataDelete. Their links
+to the nodes of the neighbouring cell need that cell to be loaded as well. Relations take the dataset id of
+the extract and are written to the part of that name.
+
+The parts are formatted and written by a process pool when more than 1 worker is set. The Neptune loader can
+load the whole directory with high parallelism, or a single cell directory to reload it on its own.
+
+"""
+
+import os
+from multiprocessing import Pool
+
+from csv_writer import OsmAWSBulkLoadCSVWriter
+from node_store import OsmNodeStore
+
+
+def writePartition(args):
+
+    # write the CSVs of one cell; run in a worker process
+    cell, nodes, ways, relations, directory, schema, hot_tags = args
+    path = os.path.join(directory, cell)
+    os.makedirs(path, exist_ok=True)
+    writer = OsmAWSBulkLoadCSVWriter(False, cell, path, schema, hot_tags)
+
+    def tagKeys(elements):
+        keys = {}
+        for element in elements:
+            for tag in element['tags']:
+                if not (element['type'] == "node" and tag in ('lat', 'lon')):
+                    keys[tag] = True
+        return writer.columnKeys(list(keys))
+
+    if nodes:
+        keys = tagKeys(nodes)
+        with open(writer.path("node.csv"), "w") as nodeFile:
+            nodeFile.write(writer.header(writer.COLUMNS["node"], keys))
+            for node in nodes:
+                nodeFile.write(writer.nodeRow(node, cell, keys) + "\n")
+
+    if ways:
+        keys = tagKeys([way for way, _ in ways])
+        with open(writer.path("way.csv"), "w") as wayFile, open(writer.path("wayLink.csv"), "w") as wayLinkFile:
+            wayFile.write(writer.header(writer.COLUMNS["way"], keys))
+            wayLinkFile.write("~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single)\n")
+            for way, geometry in ways:
+                wayFile.write(writer.wayRow(way, cell, keys, geometry) + "\n")
+                wayLinkFile.writelines(writer.wayLinkRows(way, cell))
+
+    if relations:
+        keys = tagKeys(relations)
+        with open(writer.path("relation.csv"), "w") as relationFile, open(writer.path("relationLink.csv"), "w") as relationLinkFile:
+            relationFile.write(writer.header(writer.COLUMNS["relation"], keys))
+            relationLinkFile.write("~id,\t~label,\t~from,\t~to,\trole:String(single),\t__datasetid:String(single)\n")
+            for relation in relations:
+                relationFile.write(writer.relationRow(relation, cell, keys) + "\n")
+                relationLinkFile.writelines(writer.relationLinkRows(relation, cell))
+
+    return cell, len(nodes), len(ways), len(relations)
+
+
+class OsmAWSPartitionedCSVWriter(OsmAWSBulkLoadCSVWriter):
+
+    def __init__(self, dataset_id="area-unset", directory="tmp", schema="wide", hot_tags=None, workers=1):
+        super().__init__(False, dataset_id, directory, schema, hot_tags)
+        self.schema = schema
+        self.hot_tags = hot_tags
+        self.workers = workers # number of processes writing the cells, 1 to write them in this process
+
+    def write(self, data):
+        datasetid = data[1]
+        partitions = {}
+
+        def partition(cell):
+            if cell not in partitions:
+                partitions[cell] = ([], [], [])
+            return partitions[cell]
+
+        nodeStore = OsmNodeStore(self.directory)
+        for node in self.referencedNodes:
+            nodeStore.add(node['id'], node['tags']['lat'], node['tags']['lon'])
+        for node in self.osmNodes:
+            nodeStore.add(node['id'], node['tags']['lat'], node['tags']['lon'])
+            partition(self.nodeDatasetId(node))[0].append(node)
+        nodeStore.finalize()
+
+        for way in self.osmWays:
+            cell, length, bbox, complete = nodeStore.resolveWay(way['nodes'], datasetid)
+            partition(cell)[1].append((way, self.wayGeometry(way, nodeStore, length, bbox, complete)))
+        nodeStore.close()
+
+        for relation in self.osmRelations:
+            partition(datasetid)[2].append(relation)
+
+        print("Building OSM CSVs of {} cells...".format(len(partitions)))
+        tasks = [(cell, nodes, ways, relations, self.directory, self.schema, self.hot_tags)
+                 for cell, (nodes, ways, relations) in sorted(partitions.items())]
+        if self.workers > 1:
+            with Pool(self.workers) as pool:
+                results = pool.map(writePartition, tasks, chunksize=1)
+        else:
+            results = [writePartition(task) for task in tasks]
+
+        for cell, nodes, ways, relations in results:
+            print("CELL {}: {} NODES, {} WAYS, {} RELATIONS".format(cell, nodes, ways, relations))
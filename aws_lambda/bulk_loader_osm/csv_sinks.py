@@ -0,0 +1,124 @@
+"""
+The script contains the sinks the bulk load CSVs can be written to instead of plain files in a directory.
+
+A sink opens a writable text stream by file name:
+    LocalGzipSink: gzip-compressed files in a local directory, e.g. to check the output in tests
+    S3MultipartSink: gzip-compressed S3 objects written with multipart uploads while the rows are written
+
+The S3 streams compress the rows as they are written and upload a part each time part_size compressed bytes
+are buffered; the parts of all the open streams are uploaded concurrently by a shared thread pool, so the
+uploads overlap the parsing and the CSVs are never stored on the Lambda /tmp storage. The objects are named
+<prefix>/<name>.gz, which the Neptune loader reads as gzip-compressed CSVs. The sink keeps its open streams,
+so that closing it aborts the multipart uploads that were not completed, e.g. when the parsing failed, instead
+of leaving their parts stored (and billed) in the bucket.
+
+"""
+
+import gzip
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class LocalGzipSink:
+
+    def __init__(self, directory="tmp"):
+        self.directory = directory
+
+    def open(self, name):
+        return gzip.open(os.path.join(self.directory, name + ".gz"), "wt", compresslevel=6)
+
+    def close(self):
+        return
+
+
+class S3GzipStream:
+
+    def __init__(self, sink, key):
+        self.sink = sink
+        self.key = key
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31: gzip header and trailer
+        self.buffer = bytearray()
+        self.parts = [] # futures of the uploaded parts, in part number order
+        self.uploadId = sink.client.create_multipart_upload(Bucket=sink.bucket, Key=key)["UploadId"]
+        sink.streams.add(self)
+
+    def write(self, text):
+        self.buffer += self.compressor.compress(text.encode("utf-8"))
+        if len(self.buffer) >= self.sink.partSize:
+            self.uploadPart()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def uploadPart(self):
+        # wait for a free upload slot, so that at most 2 parts per thread are buffered in memory
+        self.sink.slots.acquire()
+        body = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.parts.append(self.sink.executor.submit(self.sink.uploadPart, self.key, self.uploadId,
+                                                    len(self.parts) + 1, body))
+
+    def close(self):
+        try:
+            self.buffer += self.compressor.flush()
+            self.uploadPart() # the last part may be smaller than 5 MB (or empty if no row was written)
+            parts = [{"ETag": part.result(), "PartNumber": i + 1} for i, part in enumerate(self.parts)]
+            self.sink.client.complete_multipart_upload(Bucket=self.sink.bucket, Key=self.key, UploadId=self.uploadId,
+                                                       MultipartUpload={"Parts": parts})
+        except Exception:
+            self.abort()
+            raise
+        self.sink.streams.discard(self)
+
+    def abort(self):
+        # cancel the parts not uploaded yet and wait for the ones in flight, so that no part is stored after the abort
+        for part in self.parts:
+            part.cancel()
+        wait(self.parts)
+        self.sink.client.abort_multipart_upload(Bucket=self.sink.bucket, Key=self.key, UploadId=self.uploadId)
+        self.sink.streams.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class S3MultipartSink:
+
+    def __init__(self, bucket, prefix, client=None, part_size=8 << 20, workers=4):
+
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+
+        self.client = client # boto3 S3 client, or a stand-in with the same multipart methods
+        self.bucket = bucket
+        self.prefix = prefix
+        self.partSize = max(part_size, 5 << 20) # S3 minimum size of the parts before the last one
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(2 * workers)
+        self.streams = set() # streams whose multipart upload is not completed or aborted yet
+
+    def uploadPart(self, key, uploadId, partNumber, body):
+        try:
+            response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=uploadId, PartNumber=partNumber,
+                                               Body=body)
+            return response["ETag"]
+        finally:
+            self.slots.release()
+
+    def open(self, name):
+        return S3GzipStream(self, "{}/{}.gz".format(self.prefix, name))
+
+    def close(self):
+        # abort the uploads of the streams left open, then stop the upload threads
+        for stream in list(self.streams):
+            print("ABORTING THE UNFINISHED UPLOAD OF", stream.key)
+            stream.abort()
+        self.executor.shutdown(wait=True)
@@ -1,14 +1,72 @@
+import gzip
+import json
 import math
+import os
+
+from node_store import OsmNodeStore
+from filter_profiles import PEDESTRIAN_TAGS
+from way_contraction import OsmWayContraction, encodePolyline
+
+GEOHASH_CHARACTERS = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=7):
+    # encode the lat/lon as a geohash; 7 characters are cells of about 150 m
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    bits = []
+    for i in range(5 * precision):
+        # even bits split the longitude, odd bits the latitude
+        interval = bounds[1 - i % 2]
+        value = lon if i % 2 == 0 else lat
+        middle = (interval[0] + interval[1]) / 2
+        bits.append(value >= middle)
+        interval[0 if value >= middle else 1] = middle
+    return "".join(GEOHASH_CHARACTERS[int("".join("1" if bit else "0" for bit in bits[i:i + 5]), 2)] for i in range(0, len(bits), 5))
 
 class OsmAWSBulkLoadCSVWriter:
 
-    def __init__(self):
+    # geometry of each way computed from its nodes: length (ft), bounding box, midpoint between its first and
+    # last nodes, first and last node coordinates and geohash of the midpoint
+    WAY_GEOMETRY = ["__length", "__min_lat", "__min_lon", "__max_lat", "__max_lon", "__mid_lat", "__mid_lon",
+                    "__start_lat", "__start_lon", "__end_lat", "__end_lon"]
+
+    COLUMNS = {"node": "~id,\t~label,\t__datasetid:String(single),\tid:String(single),\tlat:Float(single),\tlon:Float(single)",
+               "way": ",\t".join(["~id,\t~label,\t__datasetid:String(single),\tid:String(single)"] +
+                                 [column + ":Double(single)" for column in WAY_GEOMETRY] + ["__geohash:String(single)"]),
+               "relation": "~id,\t~label,\t__datasetid:String(single),\tid:String(single)"}
+
+    def __init__(self, streaming=False, dataset_id="area-unset", directory="tmp", schema="wide", hot_tags=None, sink=None,
+                 contract=False):
         self.osmNodes = []
         self.osmWays = []
         self.osmRelations = []
+        self.referencedNodes = [] # nodes only used to find the dataset id of the ways, not written to node.csv
+
+        # streaming mode: rows are written as elements arrive instead of keeping every element until the end of xml
+        self.streaming = streaming
+        self.datasetId = dataset_id
+        self.directory = directory
+        self.sink = sink # where the CSVs are written, see csv_sinks.py; files in directory if None
+
+        # wide schema: one column per tag key of the extract; sparse schema: one column per hot tag key that is
+        # present, and the other tags of each element packed as json in a single other_tags column
+        if schema not in ("wide", "sparse"):
+            raise Exception("CSV schema {} is not supported. Choose wide or sparse.".format(schema))
+        self.hotTags = None if schema == "wide" else set(PEDESTRIAN_TAGS if hot_tags is None else hot_tags)
+
+        # contraction: one WAY link per chain of nodes between junctions instead of one per pair of nodes, see
+        # way_contraction.py; the node references of all the ways are needed first, so not in streaming mode
+        if contract and streaming:
+            raise Exception("The ways cannot be contracted in streaming mode.")
+        self.contract = contract
+
+        if self.streaming:
+            self.openStreams()
+
     def receive(self, data):
         if 'type' in data:
-            if data['type'] == "node":
+            if self.streaming:
+                self.writeElement(data)
+            elif data['type'] == "node":
                 self.osmNodes.append(data)
             elif data['type'] == "way":
                 self.osmWays.append(data)
@@ -16,82 +74,206 @@ class OsmAWSBulkLoadCSVWriter:
                 self.osmRelations.append(data)
         else:
             # end of xml; keys of all tags are in data as dictionary
-            self.write(data)
-            
+            if self.streaming:
+                self.finish()
+            else:
+                self.write(data)
+
         # print(data)
-    
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def openCsv(self, name):
+        return open(self.path(name), "w") if self.sink is None else self.sink.open(name)
+
+    def openSpill(self, name, mode):
+        # the spill files are gzip-compressed when the CSVs go to a sink, to keep the local storage small
+        if self.sink is None:
+            return open(self.path(name), mode)
+        return gzip.open(self.path(name), mode + "t", compresslevel=1)
+
+    def columnKeys(self, tagKeys):
+        # tag keys written as columns: all of them, or the hot ones in the sparse schema
+        return tagKeys if self.hotTags is None else [tag for tag in tagKeys if tag in self.hotTags]
+
+    def header(self, columns, tagKeys):
+        if self.hotTags is not None:
+            columns += ",\tother_tags:String(single)"
+        return ",\t".join([columns] + [tag.replace(':','\:')+":String(single)" for tag in tagKeys]) + "\n"
+
+    def tagValues(self, element, tagKeys):
+        values = ['"{}"'.format(element['tags'][tag].replace('"','""')) if tag in element['tags'] else '' for tag in tagKeys]
+        if self.hotTags is not None:
+            otherTags = {tag: value for tag, value in element['tags'].items() if tag not in self.hotTags
+                         and not (element['type'] == "node" and tag in ('lat', 'lon'))}
+            values.insert(0, '"{}"'.format(json.dumps(otherTags, ensure_ascii=False).replace('"','""')) if otherTags else '')
+        return values
+
+    def nodeDatasetId(self, node):
+        return str(math.floor(10*float(node['tags']['lat']))/10) + "N" + str(math.floor(10*float(node['tags']['lon']))/-10) + "W"
+
+    def nodeRow(self, node, datasetid, tagKeys):
+        return ",\t".join(
+            ["n{},\tOSM-NODE,\t{},\t{},\t{},\t{}".format(node['id'], datasetid, node['id'], node['tags']['lat'], node['tags']['lon'])] + \
+            self.tagValues(node, tagKeys))
+
+    def wayGeometry(self, way, nodeStore, length, bbox, complete):
+        # values of the WAY_GEOMETRY and __geohash columns, empty unless all the nodes of the way are in the store,
+        # since a partial length or bounding box would overwrite the values of the whole way in the database
+        if bbox is None or not complete:
+            return [''] * (len(self.WAY_GEOMETRY) + 1)
+        lats, lons = nodeStore.coordinates([way['nodes'][0], way['nodes'][-1]])
+        midLat, midLon = (lats[0] + lats[1]) / 2.0, (lons[0] + lons[1]) / 2.0
+        coordinates = list(bbox) + [midLat, midLon, lats[0], lons[0], lats[1], lons[1]]
+        return ["{:.2f}".format(length)] + ["{:.7f}".format(value) for value in coordinates] + [geohash(midLat, midLon)]
+
+    def wayRow(self, way, datasetid, tagKeys, geometry=None):
+        return ",\t".join(["w{},\tOSM-WAY,\t{},\t{}".format(way['id'], datasetid, way['id'])] +
+                          (geometry or [''] * (len(self.WAY_GEOMETRY) + 1)) + self.tagValues(way, tagKeys))
+
+    def wayLinkRows(self, way, datasetid):
+        rowLinks = ["wf{0},\tFIRST,\tw{0},\tn{1},\t{2},\n".format(way['id'], way['nodes'][0], datasetid),
+                    "wl{0},\tLAST,\tw{0},\tn{1},\t{2},\n".format(way['id'], way['nodes'][-1], datasetid)]
+        for i in range(len(way['nodes']) - 1 ):
+            rowLinks.append("wr{0}-{1},\tWAY,\tn{2},\tn{3},\t{4},\t{0}\n".format(way['id'], i+1, way['nodes'][i], way['nodes'][i+1], datasetid))
+        return rowLinks
+
+    def wayLinkHeader(self):
+        if self.contract:
+            return "~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single),\tlength:Double(single),\tpolyline:String(single)\n"
+        return "~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single)\n"
+
+    def contractedLinkRows(self, way, datasetid, contraction, nodeStore):
+        # WAY links between the junctions of the way, with the length (ft) and the polyline of the nodes between them
+        rowLinks = ["wf{0},\tFIRST,\tw{0},\tn{1},\t{2},\t,\t,\t\n".format(way['id'], way['nodes'][0], datasetid),
+                    "wl{0},\tLAST,\tw{0},\tn{1},\t{2},\t,\t,\t\n".format(way['id'], way['nodes'][-1], datasetid)]
+        for i, segment in enumerate(contraction.segments(way['nodes'])):
+            _, length, _, complete = nodeStore.resolveWay(segment, datasetid)
+            lats, lons = nodeStore.coordinates(segment)
+            geometry = "{:.2f},\t\"{}\"".format(length, encodePolyline(lats, lons)) if complete else ",\t"
+            rowLinks.append("wr{0}-{1},\tWAY,\tn{2},\tn{3},\t{4},\t{0},\t{5}\n".format(
+                way['id'], i+1, segment[0], segment[-1], datasetid, geometry))
+        return rowLinks
+
+    def relationRow(self, relation, datasetid, tagKeys):
+        return ",\t".join(["r{0},\tOSM-RELATION,\t{1},\t{0}".format(relation['id'], datasetid)] + self.tagValues(relation, tagKeys))
+
+    def relationLinkRows(self, relation, datasetid):
+        rowLinks = []
+        for i in range(len(relation['members'])):
+            rowLinks.append("rm{0}-{1},\tMEMBER,\tr{0},\t{2}{3},\t{4},\t{5}\n".format(relation['id'], i+1,
+                                                                                      relation['members'][i]['type'][0],
+                                                                                      relation['members'][i]['ref'],
+                                                                                      relation['members'][i]['role'],
+                                                                                      datasetid))
+        return rowLinks
+
     def write(self, data):
         tags = data[0]
-        # datasetid = data[1]
-        datasetIds = {}
+        datasetid = data[1]
+        nodeStore = OsmNodeStore(self.directory)
+        for node in self.referencedNodes:
+            nodeStore.add(node['id'], node['tags']['lat'], node['tags']['lon'])
         print("Building OSM-Node CSV...")
-        nodeFile = open("tmp/node.csv", "w")
-        nodeHeader = ",\t".join(["~id,\t~label,\t__datasetid:String(single),\tid:String(single),\tlat:Float(single),\tlon:Float(single)"] \
-                                +[tag.replace(':','\:')+":String(single)" for tag in tags['node']]) + "\n"
+        nodeFile = self.openCsv("node.csv")
+        tags = {elementType: self.columnKeys(tagKeys) for elementType, tagKeys in tags.items()}
+        nodeHeader = self.header(self.COLUMNS["node"], tags['node'])
         nodeFile.write(nodeHeader)
         for node in self.osmNodes:
-            datasetid = str(math.floor(10*float(node['tags']['lat']))/10) + "N" + str(math.floor(10*float(node['tags']['lon']))/-10) + "W"
-            datasetIds[node['id']] = datasetid
-            # row = "n{},\tOSM-NODE,\t{},\t{},\t{},\t{},\t".\
-            #     format(node['id'], datasetid, node['id'], node['tags']['lat'], node['tags']['lon']) + \
-            #         ",\t".join('"{}"'.format(node['tags'][tag].replace('"','""')) \
-            #                    if tag in node['tags'] else '' for tag in tags['node']) + "\n"
-            row = ",\t".join(
-                ["n{},\tOSM-NODE,\t{},\t{},\t{},\t{}".format(node['id'], datasetid, node['id'], node['tags']['lat'], node['tags']['lon'])] + \
-                ['"{}"'.format(node['tags'][tag].replace('"','""')) if tag in node['tags'] else '' for tag in tags['node']]) + "\n"
-            nodeFile.write(row)
+            datasetid = self.nodeDatasetId(node)
+            nodeStore.add(node['id'], node['tags']['lat'], node['tags']['lon'])
+            nodeFile.write(self.nodeRow(node, datasetid, tags['node']) + "\n")
         nodeFile.close()
+        nodeStore.finalize()
+        if self.contract:
+            contraction = OsmWayContraction(self.osmWays, [node['id'] for node in self.osmNodes if len(node['tags']) > 2])
 
         print("Building OSM-Way CSVs...")
-        wayFile = open("tmp/way.csv", "w")
-        wayLinkFile = open("tmp/wayLink.csv", "w")
-        wayHeader = ",\t".join(["~id,\t~label,\t__datasetid:String(single),\tid:String(single)"] + \
-                               [tag.replace(':','\:')+":String(single)" for tag in tags['way']]) + "\n"
-        wayLinkHeader = "~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single)\n"
+        wayFile = self.openCsv("way.csv")
+        wayLinkFile = self.openCsv("wayLink.csv")
+        wayHeader = self.header(self.COLUMNS["way"], tags['way'])
+        wayLinkHeader = self.wayLinkHeader()
         wayFile.write(wayHeader)
         wayLinkFile.write(wayLinkHeader)
         for way in self.osmWays:
-            if way['nodes'][0] in datasetIds:
-                datasetid = datasetIds[way['nodes'][0]]
-            elif way['nodes'][-1] in datasetIds:
-                datasetid = datasetIds[way['nodes'][-1]]
+            datasetid, length, bbox, complete = nodeStore.resolveWay(way['nodes'], data[1])
+            wayFile.write(self.wayRow(way, datasetid, tags['way'], self.wayGeometry(way, nodeStore, length, bbox, complete)) + "\n")
+            if self.contract:
+                wayLinkFile.writelines(self.contractedLinkRows(way, datasetid, contraction, nodeStore))
             else:
-                datasetid = data[1]
-            row = ",\t".join(
-                ["w{},\tOSM-WAY,\t{},\t{}".format(way['id'], datasetid, way['id'])] + \
-                ['"{}"'.format(way['tags'][tag].replace('"','""')) if tag in way['tags'] else '' for tag in tags['way']]) + "\n"
-            wayFile.write(row)
-            rowLink = "wf{0},\tFIRST,\tw{0},\tn{1},\t{2},\n".format(way['id'], way['nodes'][0], datasetid)
-            wayLinkFile.write(rowLink)
-            rowLink = "wl{0},\tLAST,\tw{0},\tn{1},\t{2},\n".format(way['id'], way['nodes'][-1], datasetid)
-            wayLinkFile.write(rowLink)
-            for i in range(len(way['nodes']) - 1 ):
-                rowLink = "wr{0}-{1},\tWAY,\tn{2},\tn{3},\t{4},\t{0}\n".format(way['id'], i+1, way['nodes'][i], way['nodes'][i+1], datasetid)
-                wayLinkFile.write(rowLink)
+                wayLinkFile.writelines(self.wayLinkRows(way, datasetid))
         wayFile.close()
         wayLinkFile.close()
+        nodeStore.close()
 
         print("Building OSM-Relation CSVs...")
-        relationFile = open("tmp/relation.csv", "w")
-        relationLinkFile = open("tmp/relationLink.csv", "w")
-        relationHeader = ",\t".join(["~id,\t~label,\t__datasetid:String(single),\tid:String(single)"] + \
-                                    [tag.replace(':','\:')+":String(single)" for tag in tags['relation']]) + "\n"
+        relationFile = self.openCsv("relation.csv")
+        relationLinkFile = self.openCsv("relationLink.csv")
+        relationHeader = self.header(self.COLUMNS["relation"], tags['relation'])
 
         relationLinkHeader = "~id,\t~label,\t~from,\t~to,\trole:String(single),\t__datasetid:String(single)\n"
         relationFile.write(relationHeader)
         relationLinkFile.write(relationLinkHeader)
         for relation in self.osmRelations:
-            row = ",\t".join(
-                ["r{0},\tOSM-RELATION,\t{1},\t{0},\t".format(relation['id'], data[1])] + \
-                ['"{}"'.format(relation['tags'][tag].replace('"','""')) if tag in relation['tags'] else '' for tag in tags['relation']]) + "\n"
-            relationFile.write(row)
-            for i in range(len(relation['members'])):
-                
-                rowLink = "rm{0}-{1},\tMEMBER,\tr{0},\t{2}{3},\t{4},\t{5}\n".format(relation['id'], i+1, 
-                                                                                    relation['members'][i]['type'][0],
-                                                                                    relation['members'][i]['ref'],
-                                                                                    relation['members'][i]['role'],
-                                                                                    datasetid)
-                relationLinkFile.write(rowLink)
+            relationFile.write(self.relationRow(relation, relation.get('datasetid', data[1]), tags['relation']) + "\n")
+            relationLinkFile.writelines(self.relationLinkRows(relation, datasetid))
         relationFile.close()
-        relationLinkFile.close()
\ No newline at end of file
+        relationLinkFile.close()
+
+    def openStreams(self):
+        # node, way and relation rows are spilled with the tag values known so far, one json line per row,
+        # since their headers depend on the tag keys of the whole extract; link files have fixed headers
+        self.nodeStore = OsmNodeStore(self.directory)
+        self.lastDatasetId = self.datasetId # relation links take the dataset id of the last node or way, as in write()
+        self.tagKeys = {"node": {}, "way": {}, "relation": {}} # tag key -> column index, in the order first seen
+        self.spillFiles = {elementType: self.openSpill(elementType + ".spill", "w") for elementType in self.tagKeys}
+
+        self.wayLinkFile = self.openCsv("wayLink.csv")
+        self.wayLinkFile.write("~id,\t~label,\t~from,\t~to,\t__datasetid:String(single),\tway-id:String(single)\n")
+        self.relationLinkFile = self.openCsv("relationLink.csv")
+        self.relationLinkFile.write("~id,\t~label,\t~from,\t~to,\trole:String(single),\t__datasetid:String(single)\n")
+
+    def writeElement(self, element):
+        elementType = element['type']
+        tagKeys = self.tagKeys[elementType]
+        for tag in element['tags']:
+            if tag not in tagKeys and not (elementType == "node" and tag in ('lat', 'lon')) \
+                    and (self.hotTags is None or tag in self.hotTags):
+                tagKeys[tag] = len(tagKeys)
+
+        if elementType == "node":
+            datasetid = self.nodeDatasetId(element)
+            self.nodeStore.add(element['id'], element['tags']['lat'], element['tags']['lon'])
+            self.lastDatasetId = datasetid
+            row = self.nodeRow(element, datasetid, tagKeys)
+        elif elementType == "way":
+            self.nodeStore.finalize() # ways follow the nodes in the xml
+            datasetid, length, bbox, complete = self.nodeStore.resolveWay(element['nodes'], self.datasetId)
+            self.lastDatasetId = datasetid
+            row = self.wayRow(element, datasetid, tagKeys, self.wayGeometry(element, self.nodeStore, length, bbox, complete))
+            self.wayLinkFile.writelines(self.wayLinkRows(element, datasetid))
+        elif elementType == "relation":
+            row = self.relationRow(element, element.get('datasetid', self.datasetId), tagKeys)
+            self.relationLinkFile.writelines(self.relationLinkRows(element, self.lastDatasetId))
+        else:
+            return
+
+        self.spillFiles[elementType].write(json.dumps([len(tagKeys), row]) + "\n")
+
+    def finish(self):
+        # assemble the final files from the spill files, padding the rows written before the last tag keys were seen
+        self.wayLinkFile.close()
+        self.relationLinkFile.close()
+        self.nodeStore.close()
+
+        for elementType, spillFile in self.spillFiles.items():
+            print("Building OSM-{} CSV...".format(elementType.capitalize()))
+            spillFile.close()
+            tagKeys = self.tagKeys[elementType]
+            with self.openSpill(elementType + ".spill", "r") as spillFile, self.openCsv(elementType + ".csv") as csvFile:
+                csvFile.write(self.header(self.COLUMNS[elementType], tagKeys))
+                for line in spillFile:
+                    count, row = json.loads(line)
+                    csvFile.write(row + ",\t" * (len(tagKeys) - count) + "\n")
+            os.remove(self.path(elementType + ".spill"))
@@ -6,6 +6,8 @@ based on the input data_set_id.
 
 from neo4j import GraphDatabase, RoutingControl
 
+from batched_delete import BatchedDelete
+
 
 class OsmAWSDataDelete:
 
@@ -17,41 +19,34 @@ class OsmAWSDataDelete:
 		self.URI = QUERY_URL
 		self.AUTH = ("username", "password") # not used
 
+	def label_group(self, label):
+
+		# batched delete group of the nodes of the label and the associated links, by the data_set_id as an attribute lookup
+		return {"name": label, "match": "MATCH (n:`{}` {{__datasetid: $id}})".format(label), "parameters": {"id": self.data_set_id}}
+
 	def delete_nodes(self):
 
-		# delete nodes and the associated links based on the data_set_id as an attribute lookup
-		query1 = "MATCH (n:`OSM-NODE` {{__datasetid: '{}'}}) ".format(self.data_set_id)
-		query2 = "DETACH DELETE n"
-		query = query1 + query2
-		self.driver.execute_query(query)
+		# delete nodes and the associated links in batches
+		BatchedDelete(self.driver).run([self.label_group("OSM-NODE")])
 
 	def delete_ways(self):
 
-		# delete ways and the associated links based on the data_set_id as an attribute lookup
-		query1 = "MATCH (n:`OSM-WAY` {{__datasetid: '{}'}}) ".format(self.data_set_id)
-		query2 = "DETACH DELETE n"
-		query = query1 + query2
-		self.driver.execute_query(query)
+		# delete ways and the associated links in batches
+		BatchedDelete(self.driver).run([self.label_group("OSM-WAY")])
 
 	def delete_relations(self):
 
-		# delete relations and the associated links based on the data_set_id as an attribute lookup
-		query1 = "MATCH (n:`OSM-RELATION` {{__datasetid: '{}'}}) ".format(self.data_set_id)
-		query2 = "DETACH DELETE n"
-		query = query1 + query2
-		self.driver.execute_query(query)
+		# delete relations and the associated links in batches
+		BatchedDelete(self.driver).run([self.label_group("OSM-RELATION")])
 
 	
 	def delete_nodes_data(self):
 
-		# delete OSM nodes based on the input data_set_id
-		self.delete_nodes()
-
-		# delete OSM ways based on the input data_set_id
-		self.delete_ways()
+		# delete OSM relations, ways and nodes based on the input data_set_id in batches, one label after the other
+		# since the MEMBER, FIRST, LAST and WAY links between them would make concurrent batches conflict
+		deleted = BatchedDelete(self.driver).run_in_order([self.label_group(label) for label in ["OSM-RELATION", "OSM-WAY", "OSM-NODE"]])
 
-		# delete OSM relations based on the input data_set_id
-		self.delete_relations()
+		print("DELETED:", deleted)
 
 		return
 
@@ -61,4 +56,52 @@ class OsmAWSDataDelete:
 		with GraphDatabase.driver(self.URI, auth=self.AUTH, encrypted=True) as self.driver:
 			self.delete_nodes_data()
 
-		return
\ No newline at end of file
+		return
+
+
+class OsmAWSChangeDelete:
+
+	def __init__(self, deletions, QUERY_URL, batch_size=500):
+
+		self.deletions = deletions # delete list of an osmChange diff, see csv_change_writer.py
+		self.batch_size = batch_size # maximum number of ids sent in a single UNWIND statement
+
+		# set up the python driver to send data to graph database
+		self.URI = QUERY_URL
+		self.AUTH = ("username", "password") # not used
+
+	def execute_batch(self, query, ids):
+
+		# execute the UNWIND query with the ids split into chunks of batch_size
+		for start in range(0, len(ids), self.batch_size):
+			self.driver.execute_query(query, ids=ids[start:start + self.batch_size])
+
+	def delete_way_links(self):
+
+		# delete the FIRST/LAST links of the deleted and modified ways, and the WAY links between their nodes
+		query = "UNWIND $ids AS way_id MATCH (n:`OSM-WAY` {id: way_id})-[r:FIRST|LAST]->() DELETE r"
+		self.execute_batch(query, self.deletions["wayLinks"])
+		query = "UNWIND $ids AS way_id MATCH (:`OSM-NODE`)-[r:WAY {`way-id`: way_id}]->(:`OSM-NODE`) DELETE r"
+		self.execute_batch(query, self.deletions["wayLinks"])
+
+	def delete_relation_members(self):
+
+		# delete the MEMBER links of the modified relations
+		query = "UNWIND $ids AS relation_id MATCH (n:`OSM-RELATION` {id: relation_id})-[r:MEMBER]->() DELETE r"
+		self.execute_batch(query, self.deletions["relationMembers"])
+
+	def delete_elements(self):
+
+		# delete the deleted relations, ways and nodes and their remaining links
+		for label, key in [("OSM-RELATION", "relations"), ("OSM-WAY", "ways"), ("OSM-NODE", "nodes")]:
+			query = "UNWIND $ids AS element_id MATCH (n:`{}` {{id: element_id}}) DETACH DELETE n".format(label)
+			self.execute_batch(query, self.deletions[key])
+
+	def create_transaction(self):
+
+		with GraphDatabase.driver(self.URI, auth=self.AUTH, encrypted=True) as self.driver:
+			self.delete_way_links()
+			self.delete_relation_members()
+			self.delete_elements()
+
+		return
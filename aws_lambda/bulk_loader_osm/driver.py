@@ -5,9 +5,18 @@ to a graph database for storage: AWS Bulk Loader.
 """
 
 import xml.sax
+from neo4j import GraphDatabase
 
 from osm_sax_python import OsmDataHandler
+from osm_expat_python import OsmExpatParser
+from osm_pbf_python import OsmPbfReader
 from csv_writer import OsmAWSBulkLoadCSVWriter as AWSBulkLoad
+from csv_change_writer import OsmAWSChangeCSVWriter
+from csv_partitioned_writer import OsmAWSPartitionedCSVWriter
+from csv_checkpoint_writer import OsmAWSCheckpointCSVWriter
+from checkpoint import OsmImportStopped
+from filter_profiles import OsmFilter
+from tile_scheduler import OsmTileDedupe
 
 
 def coroutine(func):
@@ -18,7 +27,19 @@ def coroutine(func):
     return start
 
 
-def main(infile, dataset_id="area-unset", ignore_tags=False):
+def parse(infile, receiver, dataset_id="area-unset", ignore_tags=False, parser="sax", workers=1):
+
+    # parse the xml (or pbf) with the selected backend and send each element to the receiver function
+    if parser == "expat":
+        OsmExpatParser(receiver, dataset_id, ignore_tags).parse(infile)
+        return
+
+    if parser == "pbf":
+        OsmPbfReader(receiver, dataset_id, ignore_tags, workers).parse(infile)
+        return
+
+    if parser != "sax":
+        raise Exception("Parser {} is not supported. Choose sax, expat or pbf.".format(parser))
 
     @coroutine
     def printer():
@@ -26,20 +47,136 @@ def main(infile, dataset_id="area-unset", ignore_tags=False):
             event = yield
             # print(event)
 
-    # send data to AWS S3 for Bulk Load
-    AWSBulkLoadObj = AWSBulkLoad()
-
     @coroutine
     def querywriter():
         while True:
             event = yield
 
             # send data to CSV Writer
-            AWSBulkLoadObj.receive(event)
+            receiver(event)
                 
 
-    # parse and send data to a graph database
     xml.sax.parse(infile, OsmDataHandler(printer(), querywriter(), dataset_id, ignore_tags))
 
     return
 
+
+def main(infile, dataset_id="area-unset", ignore_tags=False, streaming=False, directory="tmp", parser="sax", workers=1,
+         profile="all", schema="wide", hot_tags=None, partitioned=False, sink=None,
+         contract=False):
+
+    # send data to AWS S3 for Bulk Load; in streaming mode the CSV rows are written as the elements are parsed;
+    # the sparse schema packs the tags that are not hot_tags in one column, see csv_writer.py;
+    # partitioned mode writes the CSVs of each grid cell to its own directory, see csv_partitioned_writer.py;
+    # the CSVs are written to the sink instead of the directory if set, see csv_sinks.py;
+    # contract merges the WAY links between the junction nodes, see way_contraction.py
+    if partitioned and sink is not None:
+        raise Exception("The partitioned CSVs are written to the directory, not to a sink.")
+    if partitioned:
+        AWSBulkLoadObj = OsmAWSPartitionedCSVWriter(dataset_id, directory, schema, hot_tags, workers)
+    else:
+        AWSBulkLoadObj = AWSBulkLoad(streaming, dataset_id, directory, schema, hot_tags, sink, contract)
+    receiver = AWSBulkLoadObj.receive
+
+    # keep only the elements and tags of the filter profile, see filter_profiles.py
+    if profile != "all":
+        receiver = OsmFilter(receiver, profile, directory).receive
+
+    # parse and send data to a graph database; the sink is closed even if the parsing fails, so that it aborts
+    # the uploads of the CSVs left unfinished
+    try:
+        parse(infile, receiver, dataset_id, ignore_tags, parser, workers)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    return
+
+
+def main_checkpointed(infile, checkpoint, dataset_id="area-unset", directory="tmp", schema="wide", hot_tags=None,
+                      infile_offset=0):
+
+    # parse the xml from the offset of the last checkpoint and write the CSV parts until the end of the xml, or
+    # until the checkpoint stops the import; infile_offset is the offset of infile in the xml, e.g. the start
+    # of a range download from the offset; returns the manifest of the import, see checkpoint.py
+    AWSCheckpointObj = OsmAWSCheckpointCSVWriter(checkpoint, dataset_id, directory, schema, hot_tags)
+    if AWSCheckpointObj.manifest["done"]:
+        return AWSCheckpointObj.manifest
+
+    try:
+        OsmExpatParser(AWSCheckpointObj.receive, dataset_id, False).parse(
+            infile, AWSCheckpointObj.manifest["offset"], AWSCheckpointObj.checkpointAt, infile_offset)
+    except OsmImportStopped:
+        pass
+
+    return AWSCheckpointObj.manifest
+
+
+def main_tiles(scheduler, tiles, dataset_id="area-unset", directory="tmp", parser="expat", profile="all", schema="wide",
+               hot_tags=None, sink=None):
+
+    # write the CSVs of the tiles fetched by the scheduler, with the elements on the tile boundaries written once,
+    # see tile_scheduler.py; all the tiles must be fetched, run the scheduler again to resume the failed ones
+    missing = [tile['key'] for tile in tiles if not scheduler.isDone(tile)]
+    if missing:
+        raise Exception("{} OSM tiles are not fetched: {}".format(len(missing), ", ".join(missing)))
+
+    AWSBulkLoadObj = AWSBulkLoad(True, dataset_id, directory, schema, hot_tags, sink)
+    receiver = AWSBulkLoadObj.receive
+    if profile != "all":
+        receiver = OsmFilter(receiver, profile, directory).receive
+
+    # the relations are written with the grid cell of their first tile, the nodes and ways with the cell of their nodes
+    dedupe = OsmTileDedupe(receiver, directory)
+    try:
+        for tile in tiles:
+            parse(scheduler.tilePath(tile), lambda data, cell=tile['cell']: dedupe.receive(data, cell), tile['cell'], parser=parser)
+        dedupe.finish(dataset_id)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    return
+
+
+def find_nodes_neptune(query_url):
+
+    # find OSM-NODE nodes already in the database by id, for the ways of an osmChange diff
+    def findNodes(nodeIds):
+        query = "MATCH (n:`OSM-NODE`) WHERE n.id IN $ids RETURN n.id AS id, n.lat AS lat, n.lon AS lon"
+        with GraphDatabase.driver(query_url, auth=("username", "password"), encrypted=True) as driver:
+            records, _, _ = driver.execute_query(query, ids=nodeIds)
+        return [{'id': record["id"], 'tags': {'lat': str(record["lat"]), 'lon': str(record["lon"])}} for record in records]
+
+    return findNodes
+
+
+def find_ways_neptune(query_url):
+
+    # find the OSM-WAY nodes already in the database that use some nodes, with their node ids in order from
+    # their WAY links wr<way id>-<index>, for the nodes moved by an osmChange diff
+    def findWays(nodeIds):
+        query = "MATCH (n:`OSM-NODE`)-[l:WAY]-(:`OSM-NODE`) WHERE n.id IN $ids WITH DISTINCT l.`way-id` AS wayId " \
+                "MATCH (a:`OSM-NODE`)-[link:WAY {`way-id`: wayId}]->(b:`OSM-NODE`) " \
+                "RETURN wayId, id(link) AS linkId, a.id AS first, b.id AS last"
+        with GraphDatabase.driver(query_url, auth=("username", "password"), encrypted=True) as driver:
+            records, _, _ = driver.execute_query(query, ids=nodeIds)
+        links = {}
+        for record in records:
+            links.setdefault(record["wayId"], []).append((int(record["linkId"].rsplit("-", 1)[1]), record["first"], record["last"]))
+        ways = []
+        for wayId, wayLinks in links.items():
+            wayLinks.sort()
+            ways.append({'id': wayId, 'nodes': [wayLinks[0][1]] + [last for _, _, last in wayLinks]})
+        return ways
+
+    return findWays
+
+
+def main_change(infile, dataset_id="area-unset", directory="tmp", findNodes=None, findWays=None):
+
+    # write the CSVs and the delete list of the elements created, modified or deleted by an osmChange diff
+    AWSChangeObj = OsmAWSChangeCSVWriter(dataset_id, directory, findNodes, findWays)
+    parse(infile, AWSChangeObj.receive, dataset_id, parser="expat")
+
+    return
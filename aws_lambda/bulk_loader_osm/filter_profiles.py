@@ -0,0 +1,113 @@
+"""
+The script contains the tag filter profiles applied to the OSM elements while they are parsed, to keep only
+the elements and tags used by the pedestrian network instead of the whole extract.
+
+A profile keeps the ways having one of the listed values for one of the listed keys, the nodes referenced by
+these ways, and the relations if set; only the listed tag keys are kept on the elements ("all" tags if None).
+    all: every element and tag, no filtering
+    pedestrian: footways, paths, steps, pedestrian streets and their sidewalks/crossings
+    sidewalk: only the footway=sidewalk/crossing ways queried by the waze and navigator lambdas
+
+Ways come after the nodes in the file, so the filter writes every node to a spill file as it arrives and sends
+only the nodes referenced by the kept ways to the receiver at the end of the xml, before the kept ways and
+relations. The referenced node ids are kept as a sorted int64 array.
+
+"""
+
+import json
+import os
+from array import array
+
+import numpy as np
+
+
+PEDESTRIAN_TAGS = {"highway", "footway", "crossing", "crossing:markings", "crossing:signals", "name", "surface",
+                   "smoothness", "width", "incline", "kerb", "tactile_paving", "wheelchair", "ramp", "handrail",
+                   "step_count", "lit", "sidewalk", "access", "foot", "traffic_signals"}
+
+PROFILES = {
+    "all": None,
+    "pedestrian": {
+        "ways": {"highway": {"footway", "pedestrian", "path", "steps", "living_street", "corridor"},
+                 "footway": {"sidewalk", "crossing"}},
+        "tags": PEDESTRIAN_TAGS,
+        "relations": False,
+    },
+    "sidewalk": {
+        "ways": {"footway": {"sidewalk", "crossing"}},
+        "tags": PEDESTRIAN_TAGS,
+        "relations": False,
+    },
+}
+
+
+class OsmFilter:
+
+    MAIN_ELEMENTS = ["node", "way", "relation"]
+
+    def __init__(self, receiver, profile, directory="tmp"):
+
+        if profile not in PROFILES or PROFILES[profile] is None:
+            raise Exception("Filter profile {} is not supported. Choose one of: {}.".format(
+                profile, ", ".join(name for name in PROFILES if PROFILES[name] is not None)))
+
+        self.receiver = receiver # function receiving the kept elements, e.g. OsmAWSBulkLoadCSVWriter.receive
+        self.profile = PROFILES[profile]
+        self.directory = directory
+        self.refs = array("q") # node ids referenced by the kept ways
+        self.counts = {elementType: [0, 0] for elementType in self.MAIN_ELEMENTS} # received, kept
+        self.spillFiles = {elementType: open(self.spillPath(elementType), "w") for elementType in self.MAIN_ELEMENTS}
+
+    def spillPath(self, elementType):
+        return os.path.join(self.directory, "filter-{}.spill".format(elementType))
+
+    def keepWay(self, way):
+        return any(way['tags'].get(key) in values for key, values in self.profile["ways"].items())
+
+    def filterTags(self, element):
+        keys = self.profile["tags"]
+        if keys is not None:
+            element['tags'] = {key: value for key, value in element['tags'].items()
+                               if key in keys or (element['type'] == "node" and key in ('lat', 'lon'))}
+        return element
+
+    def receive(self, data):
+        if 'type' not in data:
+            # end of xml; send the kept elements, then the end of xml with the tag keys that are left
+            self.finish(data[1])
+            return
+
+        elementType = data['type']
+        self.counts[elementType][0] += 1
+        if elementType == "way":
+            if not self.keepWay(data):
+                return
+            self.refs.extend(int(ref) for ref in data['nodes'])
+        elif elementType == "relation" and not self.profile["relations"]:
+            return
+        self.spillFiles[elementType].write(json.dumps(self.filterTags(data)) + "\n")
+
+    def finish(self, dataset_id):
+        refs = np.unique(np.frombuffer(self.refs, dtype=np.int64)) if len(self.refs) else np.zeros(0, dtype=np.int64)
+        self.refs = None
+        tags = {"node":set(),"way":set(),"relation":set()}
+
+        for elementType in self.MAIN_ELEMENTS:
+            self.spillFiles[elementType].close()
+            with open(self.spillPath(elementType)) as spillFile:
+                for line in spillFile:
+                    element = json.loads(line)
+                    if elementType == "node":
+                        position = np.searchsorted(refs, int(element['id']))
+                        if position == len(refs) or refs[position] != int(element['id']):
+                            continue
+                    tags[elementType].update(element['tags'])
+                    self.counts[elementType][1] += 1
+                    self.receiver(element)
+            os.remove(self.spillPath(elementType))
+
+        tags["node"].difference_update(('lat', 'lon'))
+        for elementType, (received, kept) in self.counts.items():
+            print("FILTER: {} OF {} OSM {}S KEPT".format(kept, received, elementType.upper()))
+
+        self.receiver((tags, dataset_id))
@@ -1,7 +1,11 @@
 import json
-import requests
-from driver import main
-from delete_data_aws import OsmAWSDataDelete
+import os
+import shutil
+from driver import main, main_change, main_checkpointed, find_nodes_neptune, find_ways_neptune
+from delete_data_aws import OsmAWSDataDelete, OsmAWSChangeDelete
+from csv_sinks import S3MultipartSink
+from checkpoint import OsmImportCheckpoint, S3CheckpointStore
+from neptune_loader import NeptuneLoaderClient
 import boto3
 
 def lambda_handler(event, context):
@@ -33,12 +37,133 @@ def lambda_handler(event, context):
             # with open("/tmp/data.osm", "wb") as binary_file:
             #     binary_file.write(osm_response.content)
     
-            # Get complete xml from S3
+            # optional format input parameter: xml (default), pbf, or osc for an osmChange diff
+            osm_format = event["queryStringParameters"].get("format", "xml")
+
+            # optional profile input parameter to filter the elements: all (default), pedestrian or sidewalk
+            profile = event["queryStringParameters"].get("profile", "all")
+
+            # optional schema input parameter of the CSVs: wide (default, one column per tag key) or sparse
+            schema = event["queryStringParameters"].get("schema", "wide")
+
+            # optional partitioned input parameter: true to write the CSVs of each 0.1 degree grid cell to osm-cells/<cell>/
+            partitioned = event["queryStringParameters"].get("partitioned", "false") == "true"
+            directory = "/tmp/cells" if partitioned else "/tmp"
+            os.makedirs(directory, exist_ok=True)
+
+            # optional sink input parameter: tmp (default) to upload the CSVs from /tmp, or s3 to stream them
+            # gzip-compressed to osm-updated/<name>.csv.gz with multipart uploads while the file is parsed
+            sink = S3MultipartSink(LOAD_BUCKET, "osm-updated") if event["queryStringParameters"].get("sink") == "s3" else None
+
+            # optional contract input parameter: true to write one WAY link per chain of nodes between junctions,
+            # the whole extract is then kept in memory instead of streaming the rows
+            contract = event["queryStringParameters"].get("contract", "false") == "true"
+
+            print("OSM FORMAT:", osm_format)
+            print("FILTER PROFILE:", profile)
+            print("CSV SCHEMA:", schema)
+            print("CSV SINK:", "s3" if sink else "tmp")
+
+            # Get complete xml (or pbf) from S3
             s3 = boto3.client('s3')        
-            with open("/tmp/data.osm", 'wb') as data:
-                s3.download_fileobj(LOAD_BUCKET, "osm-updated.xml", data)
+
+            # optional checkpoint input parameter: true to import the xml in a chain of invocations, each of them
+            # resuming from the checkpoint of the last one (resume=true) and writing CSV parts to osm-checkpointed/
+            if event["queryStringParameters"].get("checkpoint") == "true":
+
+                # the chain only writes the CSVs of the whole xml to /tmp, the other modes cannot be resumed
+                ignored = [name for name, used in [("format", osm_format != "xml"), ("profile", profile != "all"),
+                                                   ("partitioned", partitioned), ("sink", sink is not None),
+                                                   ("contract", contract)] if used]
+                if ignored:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 
+                                'Access-Control-Allow-Headers': 'Content-Type', 
+                                'Access-Control-Allow-Origin':'*', 
+                                'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
+                        'body': json.dumps("ERROR: The checkpoint input parameter cannot be combined with: {}".format(", ".join(ignored)))
+                    }
+
+                checkpoint = OsmImportCheckpoint(S3CheckpointStore(LOAD_BUCKET, "osm-checkpointed", s3),
+                                                 remaining_time=lambda: context.get_remaining_time_in_millis() / 1000)
+                if event["queryStringParameters"].get("resume") != "true":
+                    checkpoint.reset("/tmp")
+                manifest = checkpoint.load("/tmp")
+                offset = manifest["offset"] if manifest else 0
+
+                # only download the xml from the offset of the last checkpoint
+                with open("/tmp/data.osm", 'wb') as data:
+                    if offset:
+                        body = s3.get_object(Bucket=LOAD_BUCKET, Key="osm-updated.xml", Range="bytes={}-".format(offset))["Body"]
+                        shutil.copyfileobj(body, data)
+                    else:
+                        s3.download_fileobj(LOAD_BUCKET, "osm-updated.xml", data)
+
+                manifest = main_checkpointed("/tmp/data.osm", checkpoint, dataset_id=data_set_id, directory="/tmp",
+                                             schema=schema, infile_offset=offset)
+
+                if not manifest["done"]:
+                    # invoke the next link of the chain with the same request
+                    resumeEvent = dict(event, queryStringParameters=dict(event["queryStringParameters"], resume="true"))
+                    boto3.client('lambda').invoke(FunctionName=context.function_name, InvocationType="Event",
+                                                  Payload=json.dumps(resumeEvent))
+                    message = "CHECKPOINT: OSM dataset {} imported up to offset {}".format(data_set_id, manifest["offset"])
+                else:
+                    message = "FINISHED: Uploaded OSM dataset: {} in {} parts".format(data_set_id, len(manifest["parts"]))
+
+                return {
+                    'statusCode': 200 if manifest["done"] else 202,
+                    'headers': {'Content-Type': 'application/json', 
+                            'Access-Control-Allow-Headers': 'Content-Type', 
+                            'Access-Control-Allow-Origin':'*', 
+                            'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
+                    'body': json.dumps(message)
+                }
+
+            if osm_format == "osc":
+                with open("/tmp/data.osc", 'wb') as data:
+                    s3.download_fileobj(LOAD_BUCKET, "osm-change.osc", data)
+
+                # write the rows of the changed elements only, and delete the elements and links replaced by the diff
+                main_change("/tmp/data.osc", dataset_id=data_set_id, directory="/tmp",
+                            findNodes=find_nodes_neptune(QUERY_URL), findWays=find_ways_neptune(QUERY_URL))
+                with open("/tmp/delete.json") as deleteFile:
+                    OsmAWSChangeDelete(json.load(deleteFile), QUERY_URL).create_transaction()
+
+                for name in ["node", "way", "relation", "wayLink", "relationLink"]:
+                    s3.upload_file("/tmp/{}.csv".format(name), LOAD_BUCKET, "osm-change/{}.csv".format(name))
+
+                # load the replacement rows right away, since the elements they replace are already deleted:
+                # the node, way and relation CSVs first, then the link CSVs with the vertex loads as dependencies
+                loader = NeptuneLoaderClient(LOADER_URL)
+                loader.submit_vertices_edges(
+                    [BULKLOAD_SOURCE+"/osm-change/"+name+".csv" for name in ["node", "way", "relation"]],
+                    [BULKLOAD_SOURCE+"/osm-change/"+name+".csv" for name in ["wayLink", "relationLink"]])
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 
+                            'Access-Control-Allow-Headers': 'Content-Type', 
+                            'Access-Control-Allow-Origin':'*', 
+                            'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
+                    'body': json.dumps({"message": "FINISHED: Uploaded and submitted the load of OSM changes: {}".format(data_set_id),
+                                        "loads": [loader.responses[load_id] for load_id in loader.load_ids]})
+                }
+            elif osm_format == "pbf":
+                with open("/tmp/data.osm.pbf", 'wb') as data:
+                    s3.download_fileobj(LOAD_BUCKET, "osm-updated.osm.pbf", data)
+    
+                main("/tmp/data.osm.pbf", dataset_id=data_set_id, streaming=not contract, directory=directory, parser="pbf",
+                     profile=profile, schema=schema, partitioned=partitioned, sink=sink,
+                     contract=contract)
+            else:
+                with open("/tmp/data.osm", 'wb') as data:
+                    s3.download_fileobj(LOAD_BUCKET, "osm-updated.xml", data)
     
-            main("/tmp/data.osm", dataset_id=data_set_id)
+                main("/tmp/data.osm", dataset_id=data_set_id, streaming=not contract, directory=directory, parser="expat",
+                     profile=profile, schema=schema, partitioned=partitioned, sink=sink,
+                     contract=contract)
     
             # s3.upload_file("/tmp/node.csv", LOAD_BUCKET, "osm/node-{}.csv".format(bbox))
             # s3.upload_file("/tmp/way.csv", LOAD_BUCKET, "osm/way-{}.csv".format(bbox))
@@ -46,11 +171,17 @@ def lambda_handler(event, context):
             # s3.upload_file("/tmp/wayLink.csv", LOAD_BUCKET, "osm/wayLink-{}.csv".format(bbox))
             # s3.upload_file("/tmp/relationLink.csv", LOAD_BUCKET, "osm/relationLink-{}.csv".format(bbox))
             
-            s3.upload_file("/tmp/node.csv", LOAD_BUCKET, "osm-updated/node.csv")
-            s3.upload_file("/tmp/way.csv", LOAD_BUCKET, "osm-updated/way.csv")
-            s3.upload_file("/tmp/relation.csv", LOAD_BUCKET, "osm-updated/relation.csv")
-            s3.upload_file("/tmp/wayLink.csv", LOAD_BUCKET, "osm-updated/wayLink.csv")
-            s3.upload_file("/tmp/relationLink.csv", LOAD_BUCKET, "osm-updated/relationLink.csv")
+            if partitioned:
+                # one prefix per cell, so that the bulk load source can be osm-cells or a single osm-cells/<cell>
+                for cell in os.listdir(directory):
+                    for name in os.listdir(os.path.join(directory, cell)):
+                        s3.upload_file(os.path.join(directory, cell, name), LOAD_BUCKET, "osm-cells/{}/{}".format(cell, name))
+            elif sink is None:
+                s3.upload_file("/tmp/node.csv", LOAD_BUCKET, "osm-updated/node.csv")
+                s3.upload_file("/tmp/way.csv", LOAD_BUCKET, "osm-updated/way.csv")
+                s3.upload_file("/tmp/relation.csv", LOAD_BUCKET, "osm-updated/relation.csv")
+                s3.upload_file("/tmp/wayLink.csv", LOAD_BUCKET, "osm-updated/wayLink.csv")
+                s3.upload_file("/tmp/relationLink.csv", LOAD_BUCKET, "osm-updated/relationLink.csv")
 
             return {
                 'statusCode': 200,
@@ -63,29 +194,28 @@ def lambda_handler(event, context):
     
         if method == "PUT":
     
-            bulkLoad_json = {
-                "source" : BULKLOAD_SOURCE+"/osm",
-                "format" : "csv",
-                "iamRoleArn" : "arn:aws:iam::760336115441:role/neptune-s3-read-access",
-                "region" : "us-east-2",
-                "failOnError" : "FALSE",
-                "parallelism" : "MEDIUM",
-                "updateSingleCardinalityProperties" : "TRUE",
-                "queueRequest" : "TRUE",
-                "dependencies" : []
-            }
-                
-            bulkLoad_response = requests.post(LOADER_URL, json=bulkLoad_json)
-    
-            print(type(bulkLoad_response.json()))
-    
+            # optional source input parameter: S3 prefix of the CSVs, e.g. osm-change for an osmChange diff
+            source = (event["queryStringParameters"] or {}).get("source", "osm")
+
+            # optional chain input parameter: true to load the node, way and relation CSVs of the source first,
+            # then the link CSVs with the vertex loads as dependencies
+            chain = (event["queryStringParameters"] or {}).get("chain") == "true"
+
+            loader = NeptuneLoaderClient(LOADER_URL)
+            if chain:
+                loader.submit_vertices_edges(
+                    [BULKLOAD_SOURCE+"/"+source+"/"+name+".csv" for name in ["node", "way", "relation"]],
+                    [BULKLOAD_SOURCE+"/"+source+"/"+name+".csv" for name in ["wayLink", "relationLink"]])
+            else:
+                loader.submit(BULKLOAD_SOURCE+"/"+source)
+
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 
                         'Access-Control-Allow-Headers': 'Content-Type', 
                         'Access-Control-Allow-Origin':'*', 
                         'Access-Control-Allow-Methods': 'OPTIONS,PUT,POST,DELETE'},
-                'body': json.dumps(bulkLoad_response.json())
+                'body': json.dumps([loader.responses[load_id] for load_id in loader.load_ids] if chain else loader.responses[loader.load_ids[0]])
             }
         
         if method == "DELETE":
@@ -96,7 +226,7 @@ def lambda_handler(event, context):
             print("DATA SET ID:", data_set_id)
     
             # delete OSM nodes data stored on the AWS Neptune database using data_set_id
-            OsmAWSDataDeleteObj = OsmAWSDataDelete(data_set_id, env, QUERY_URL)
+            OsmAWSDataDeleteObj = OsmAWSDataDelete(data_set_id, QUERY_URL)
             OsmAWSDataDeleteObj.create_transaction()
     
             return {
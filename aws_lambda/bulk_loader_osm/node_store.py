@@ -0,0 +1,157 @@
+"""
+The script contains a compact store of the OSM nodes used to resolve the dataset id, length and
+bounding box of each way from the ids of its nodes.
+
+Each node is kept as an int64 id, float64 lat/lon and the int16 row/column of its 0.1 degree grid cell
+(about 28 bytes per node instead of a dictionary entry and a dataset id string). The lat/lon keep the values
+of the xml, since they are written as the coordinates of the ways, and the cell is found from them when the
+node is added, so nodes close to a grid cell boundary keep the same dataset id as before. Nodes are appended to typed arrays while the xml is parsed and written to spill files once
+spill_size nodes are buffered; the spill files are memory-mapped when the store is finalized. The ids are
+sorted once at the end if they were not received in order, and looked up with a binary search.
+
+"""
+
+import math
+import os
+from array import array
+
+import numpy as np
+
+
+class OsmNodeStore:
+
+    ARRAYS = {"ids": ("q", np.int64), "lats": ("d", np.float64), "lons": ("d", np.float64),
+              "latCells": ("h", np.int16), "lonCells": ("h", np.int16)}
+
+    def __init__(self, directory="tmp", spill_size=1 << 22):
+
+        self.directory = directory # where the spill files are written
+        self.spillSize = spill_size # number of nodes buffered in memory before they are spilled
+        self.earthRadius = 6371008.8 # mean radius (m) of the earth
+        self.meterToFeet = 3.28084 # 1 meter is 3.28084 feet
+
+        self.buffers = {name: array(typecode) for name, (typecode, _) in self.ARRAYS.items()}
+        self.spilled = 0 # number of nodes in the spill files
+        self.inOrder = True # the ids were received in ascending order
+        self.lastId = None
+        self.finalized = False
+
+    def spillPath(self, name):
+        return os.path.join(self.directory, "nodes-{}.bin".format(name))
+
+    def add(self, nodeId, lat, lon):
+
+        # append the node; the lat/lon are the strings of the xml attributes
+        if self.finalized:
+            raise Exception("Node {} added after the node store was finalized.".format(nodeId))
+
+        nodeId = int(nodeId)
+        if self.lastId is not None and nodeId < self.lastId:
+            self.inOrder = False
+        self.lastId = nodeId
+
+        lat = float(lat)
+        lon = float(lon)
+        self.buffers["ids"].append(nodeId)
+        self.buffers["lats"].append(lat)
+        self.buffers["lons"].append(lon)
+        self.buffers["latCells"].append(math.floor(10*lat))
+        self.buffers["lonCells"].append(math.floor(10*lon))
+
+        if len(self.buffers["ids"]) >= self.spillSize:
+            self.spill()
+
+    def spill(self):
+
+        # append the buffered nodes to the spill files and empty the buffers
+        for name, buffer in self.buffers.items():
+            with open(self.spillPath(name), "ab" if self.spilled else "wb") as spillFile:
+                buffer.tofile(spillFile)
+            del buffer[:]
+
+        self.spilled = os.path.getsize(self.spillPath("ids")) // 8
+
+    def finalize(self):
+
+        # turn the buffers or the spill files into arrays sorted by id
+        if self.finalized:
+            return
+
+        if self.spilled:
+            self.spill()
+            arrays = {name: np.memmap(self.spillPath(name), dtype=dtype, mode="r+")
+                      for name, (_, dtype) in self.ARRAYS.items()}
+        else:
+            arrays = {name: np.array(buffer, dtype=dtype) for (name, buffer), (_, dtype)
+                      in zip(self.buffers.items(), self.ARRAYS.values())}
+        self.buffers = None
+
+        if not self.inOrder:
+            order = np.argsort(arrays["ids"], kind="stable")
+            for name, values in arrays.items():
+                values[:] = values[order]
+
+        self.ids = arrays["ids"]
+        self.lats = arrays["lats"]
+        self.lons = arrays["lons"]
+        self.latCells = arrays["latCells"]
+        self.lonCells = arrays["lonCells"]
+        self.finalized = True
+
+        print("OSM NODE STORE: {} NODES, {} MB".format(len(self.ids), sum(values.nbytes for values in arrays.values()) // 2**20))
+
+    def find(self, nodeIds):
+
+        # find the positions of the node ids in the store and whether each of them was found
+        nodeIds = np.asarray(nodeIds, dtype=np.int64)
+        indices = np.searchsorted(self.ids, nodeIds)
+        indices = np.minimum(indices, len(self.ids) - 1)
+        found = self.ids[indices] == nodeIds if len(self.ids) else np.zeros(len(nodeIds), dtype=bool)
+
+        return indices, found
+
+    def datasetId(self, index):
+        return str(int(self.latCells[index])/10) + "N" + str(int(self.lonCells[index])/-10) + "W"
+
+    def resolveWay(self, nodeRefs, defaultDatasetId):
+
+        # find the dataset id of the first or else the last node of the way, the length (ft) along its nodes
+        # in the store, its bounding box (min lat, min lon, max lat, max lon), None if no node is in the store,
+        # and whether all its nodes are in the store, otherwise the length and bounding box only cover a part of it
+        indices, found = self.find([int(ref) for ref in nodeRefs])
+
+        if found[0]:
+            datasetid = self.datasetId(indices[0])
+        elif found[-1]:
+            datasetid = self.datasetId(indices[-1])
+        else:
+            datasetid = defaultDatasetId
+
+        complete = bool(found.all())
+        if not found.any():
+            return datasetid, 0.0, None, complete
+
+        lats = self.lats[indices[found]]
+        lons = self.lons[indices[found]]
+
+        # equirectangular distances between the consecutive nodes, accurate within a few ft for way segments
+        meanLats = np.radians((lats[:-1] + lats[1:]) / 2.0)
+        dx = np.radians(np.diff(lons)) * np.cos(meanLats)
+        dy = np.radians(np.diff(lats))
+        length = float(np.sum(np.hypot(dx, dy))) * self.earthRadius * self.meterToFeet
+
+        return datasetid, length, (float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())), complete
+
+    def coordinates(self, nodeRefs):
+
+        # find the lat/lon of the nodes in the store, in the order of nodeRefs; the nodes not in the store are left out
+        indices, found = self.find([int(ref) for ref in nodeRefs])
+        return self.lats[indices[found]], self.lons[indices[found]]
+
+    def close(self):
+
+        # release the memory-mapped arrays and remove the spill files
+        self.ids = self.lats = self.lons = self.latCells = self.lonCells = None
+        if self.spilled:
+            for name in self.ARRAYS:
+                os.remove(self.spillPath(name))
@@ -0,0 +1,110 @@
+"""
+OpenStreetMap (OSM) XML data parser using the pyexpat parser directly.
+
+The script produces the same node, way and relation dictionaries as OsmDataHandler in osm_sax_python.py,
+and the same (tags, dataset_id) tuple at the end of the xml, but the expat callbacks are set directly on the
+parser and the dictionaries are passed to the receiver function without going through the SAX handler
+dispatch and the coroutines; character data is not reported at all.
+
+The parser also reads osmChange diffs: the elements inside the create, modify and delete blocks get an
+'action' key with the name of the block, and the (tags, dataset_id) tuple is sent at the closing osmChange tag.
+Deleted nodes may come without lat/lon, which are None then.
+
+The parse can start at the byte offset of a node, way or relation saved by a checkpoint function, which is
+called with the byte offset where each of these elements starts; an osm tag is fed to the parser first. The
+offsets are in the whole xml: infile may only hold the xml from infile_offset on, e.g. a range download.
+
+The callbacks are closures over local variables rather than methods, since they are called for every
+nd and tag element of the extract.
+
+"""
+
+from xml.parsers import expat
+
+
+class OsmExpatParser:
+
+    MAIN_ELEMENTS = {"node", "way", "relation"}
+    CHANGE_ACTIONS = {"create", "modify", "delete"}
+
+    def __init__(self, receiver, dataset_id, ignore_tags):
+
+        self.receiver = receiver # function receiving each element, e.g. OsmAWSBulkLoadCSVWriter.receive
+        self.dataset_id = dataset_id
+        self.ignore_tags = ignore_tags
+        self.tags = {"node":set(),"way":set(),"relation":set()}
+
+    def parse(self, infile, start=0, checkpoint=None, infile_offset=0):
+
+        receiver = self.receiver
+        ignore_tags = self.ignore_tags
+        tags = self.tags
+        main_elements = self.MAIN_ELEMENTS
+        change_actions = self.CHANGE_ACTIONS
+        state = [None, None] # element being parsed, osmChange block it is in
+        prefix = b"<osm>" if start else b""
+
+        # Call when an element starts
+        def startElement(name, attributes):
+
+            currElement = state[0]
+
+            if name == "nd":
+                if currElement is None:
+                    raise Exception("Property of element started without element.")
+                currElement['nodes'].append(attributes["ref"])
+
+            elif name == "tag":
+                if currElement is None:
+                    raise Exception("Property of element started without element.")
+                if not ignore_tags:
+                    currElement['tags'][attributes['k']] = attributes['v']
+                    tags[currElement['type']].add(attributes['k'])
+
+            elif name in main_elements:
+                if currElement is not None:
+                    raise Exception("New element started before last element ended.")
+                if checkpoint is not None:
+                    checkpoint(start + parser.CurrentByteIndex - len(prefix))
+                if name == "node":
+                    state[0] = {'type': name, 'id': attributes['id'],
+                                'tags': {'lat':attributes.get('lat'), 'lon': attributes.get('lon')}}
+                elif name == "way":
+                    state[0] = {'type': name, 'id': attributes['id'], 'tags': {}, 'nodes': []}
+                else:
+                    state[0] = {'type': name, 'id': attributes['id'], 'tags': {}, 'members': []}
+                if state[1] is not None:
+                    state[0]['action'] = state[1]
+
+            elif name == "member":
+                if currElement is None:
+                    raise Exception("Property of element started without element.")
+                currElement['members'].append({
+                    'type': attributes['type'],
+                    'ref': attributes['ref'],
+                    'role': attributes['role']
+                })
+
+            elif name in change_actions:
+                state[1] = name
+
+        # Call when an elements ends
+        def endElement(name):
+
+            if name in main_elements:
+                receiver(state[0])
+                state[0] = None
+            elif name in change_actions:
+                state[1] = None
+            elif name == 'osm' or name == 'osmChange':
+                receiver((tags, self.dataset_id))
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = startElement
+        parser.EndElementHandler = endElement
+
+        with open(infile, "rb") as xmlFile:
+            if start:
+                parser.Parse(prefix, False)
+                xmlFile.seek(start - infile_offset)
+            parser.ParseFile(xmlFile)
@@ -0,0 +1,301 @@
+"""
+OpenStreetMap (OSM) PBF data reader in pure Python, without osmium or the protobuf library.
+
+The script decodes the fileblock structure of a .osm.pbf file: each blob header is preceded by its length
+as a 4-byte big-endian integer, and each OSMData blob holds a zlib (or lzma) compressed PrimitiveBlock with
+its own string table, coordinate granularity and offsets. Nodes, dense nodes, ways and relations of the
+primitive groups are converted to the same dictionaries as OsmDataHandler in osm_sax_python.py: ids, refs
+and lat/lon are strings, and the lat/lon are written with up to 7 decimals as in the OSM XML. The (tags,
+dataset_id) tuple is sent at the end like the closing osm tag of the XML.
+
+The blocks are independent of each other, so they can be decoded by worker processes; the elements are
+still sent to the receiver in the order of the file. For the format, see:
+    https://wiki.openstreetmap.org/wiki/PBF_Format
+
+"""
+
+import lzma
+import struct
+import zlib
+from multiprocessing import Pool
+
+
+MEMBER_TYPES = ["node", "way", "relation"]
+
+
+def readVarint(buffer, pos):
+
+    # decode a base 128 varint starting at pos, return the value and the position after it
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def iterFields(buffer):
+
+    # iterate over the (field number, value) pairs of a protobuf message; length-delimited values are bytes
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        key, pos = readVarint(buffer, pos)
+        wireType = key & 0x7
+        if wireType == 0:
+            value, pos = readVarint(buffer, pos)
+        elif wireType == 2:
+            length, pos = readVarint(buffer, pos)
+            value = buffer[pos:pos + length]
+            pos += length
+        elif wireType == 1:
+            value = buffer[pos:pos + 8]
+            pos += 8
+        elif wireType == 5:
+            value = buffer[pos:pos + 4]
+            pos += 4
+        else:
+            raise Exception("Protobuf wire type {} is not supported.".format(wireType))
+        yield key >> 3, value
+
+
+def packedVarints(buffer):
+
+    # decode a packed repeated varint field
+    values = []
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        value, pos = readVarint(buffer, pos)
+        values.append(value)
+    return values
+
+
+def zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def signed(value):
+    # int32/int64 fields are encoded as 64-bit two's complement varints
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def deltaDecode(values):
+
+    # decode a packed sint64 field whose values are deltas of the previous value
+    result = []
+    current = 0
+    for value in values:
+        current += zigzag(value)
+        result.append(current)
+    return result
+
+
+def formatCoordinate(nanodegrees):
+
+    # write the coordinate in degrees with up to 7 decimals as in the OSM XML, e.g. 33.8123456 or -84.4
+    sign = "-" if nanodegrees < 0 else ""
+    units = (abs(nanodegrees) + 50) // 100 # 1e-7 degrees
+    text = "{}{}.{:07d}".format(sign, units // 10**7, units % 10**7).rstrip("0").rstrip(".")
+    return text if text != "-0" else "0"
+
+
+def decompressBlob(blob):
+
+    # find the uncompressed data of a Blob message
+    for field, value in iterFields(blob):
+        if field == 1:
+            return bytes(value)
+        elif field == 3:
+            return zlib.decompress(value)
+        elif field == 4:
+            return lzma.decompress(value)
+        elif field in (5, 6, 7):
+            raise Exception("Blob compression {} is not supported.".format(field))
+    return b""
+
+
+def decodeTags(keys, vals, strings):
+    return {strings[key]: strings[val] for key, val in zip(keys, vals)}
+
+
+def decodeBlock(blob, ignore_tags=False):
+
+    # decode a PrimitiveBlock into a list of element dictionaries
+    data = memoryview(decompressBlob(blob))
+    strings = []
+    groups = []
+    granularity = 100
+    latOffset = 0
+    lonOffset = 0
+
+    for field, value in iterFields(data):
+        if field == 1:
+            strings = [bytes(s).decode("utf-8") for f, s in iterFields(value) if f == 1]
+        elif field == 2:
+            groups.append(value)
+        elif field == 17:
+            granularity = value
+        elif field == 19:
+            latOffset = signed(value)
+        elif field == 20:
+            lonOffset = signed(value)
+
+    def coordinates(lat, lon):
+        return {'lat': formatCoordinate(latOffset + granularity * lat),
+                'lon': formatCoordinate(lonOffset + granularity * lon)}
+
+    elements = []
+    for group in groups:
+        for field, value in iterFields(group):
+            if field == 1:
+                elements.append(decodeNode(value, strings, coordinates, ignore_tags))
+            elif field == 2:
+                elements.extend(decodeDenseNodes(value, strings, coordinates, ignore_tags))
+            elif field == 3:
+                elements.append(decodeWay(value, strings, ignore_tags))
+            elif field == 4:
+                elements.append(decodeRelation(value, strings, ignore_tags))
+
+    return elements
+
+
+def decodeNode(message, strings, coordinates, ignore_tags):
+    nodeId, keys, vals, lat, lon = 0, [], [], 0, 0
+    for field, value in iterFields(message):
+        if field == 1:
+            nodeId = zigzag(value)
+        elif field == 2:
+            keys = packedVarints(value)
+        elif field == 3:
+            vals = packedVarints(value)
+        elif field == 8:
+            lat = zigzag(value)
+        elif field == 9:
+            lon = zigzag(value)
+    tags = coordinates(lat, lon)
+    if not ignore_tags:
+        tags.update(decodeTags(keys, vals, strings))
+    return {'type': "node", 'id': str(nodeId), 'tags': tags}
+
+
+def decodeDenseNodes(message, strings, coordinates, ignore_tags):
+    ids, lats, lons, keysVals = [], [], [], []
+    for field, value in iterFields(message):
+        if field == 1:
+            ids = deltaDecode(packedVarints(value))
+        elif field == 8:
+            lats = deltaDecode(packedVarints(value))
+        elif field == 9:
+            lons = deltaDecode(packedVarints(value))
+        elif field == 10:
+            keysVals = packedVarints(value)
+
+    nodes = []
+    pos = 0
+    for nodeId, lat, lon in zip(ids, lats, lons):
+        tags = coordinates(lat, lon)
+        # keys_vals holds the key/value string ids of each node, followed by 0; it is empty if no node has tags
+        while pos < len(keysVals) and keysVals[pos] != 0:
+            if not ignore_tags:
+                tags[strings[keysVals[pos]]] = strings[keysVals[pos + 1]]
+            pos += 2
+        pos += 1
+        nodes.append({'type': "node", 'id': str(nodeId), 'tags': tags})
+    return nodes
+
+
+def decodeWay(message, strings, ignore_tags):
+    wayId, keys, vals, refs = 0, [], [], []
+    for field, value in iterFields(message):
+        if field == 1:
+            wayId = signed(value)
+        elif field == 2:
+            keys = packedVarints(value)
+        elif field == 3:
+            vals = packedVarints(value)
+        elif field == 8:
+            refs = deltaDecode(packedVarints(value))
+    tags = {} if ignore_tags else decodeTags(keys, vals, strings)
+    return {'type': "way", 'id': str(wayId), 'tags': tags, 'nodes': [str(ref) for ref in refs]}
+
+
+def decodeRelation(message, strings, ignore_tags):
+    relationId, keys, vals, roles, memberIds, types = 0, [], [], [], [], []
+    for field, value in iterFields(message):
+        if field == 1:
+            relationId = signed(value)
+        elif field == 2:
+            keys = packedVarints(value)
+        elif field == 3:
+            vals = packedVarints(value)
+        elif field == 8:
+            roles = packedVarints(value)
+        elif field == 9:
+            memberIds = deltaDecode(packedVarints(value))
+        elif field == 10:
+            types = packedVarints(value)
+    tags = {} if ignore_tags else decodeTags(keys, vals, strings)
+    members = [{'type': MEMBER_TYPES[memberType], 'ref': str(memberId), 'role': strings[role]}
+               for role, memberId, memberType in zip(roles, memberIds, types)]
+    return {'type': "relation", 'id': str(relationId), 'tags': tags, 'members': members}
+
+
+def decodeBlockArgs(args):
+    return decodeBlock(*args)
+
+
+class OsmPbfReader:
+
+    def __init__(self, receiver, dataset_id, ignore_tags, workers=1):
+
+        self.receiver = receiver # function receiving each element, e.g. OsmAWSBulkLoadCSVWriter.receive
+        self.dataset_id = dataset_id
+        self.ignore_tags = ignore_tags
+        self.workers = workers # number of processes decoding the blocks, 1 to decode them in this process
+        self.tags = {"node":set(),"way":set(),"relation":set()}
+
+    def iterBlobs(self, infile):
+
+        # read the fileblocks and yield the OSMData blobs; the OSMHeader blob is not needed for the elements
+        with open(infile, "rb") as pbfFile:
+            while True:
+                size = pbfFile.read(4)
+                if not size:
+                    break
+                header = pbfFile.read(struct.unpack(">I", size)[0])
+                blobType = ""
+                dataSize = 0
+                for field, value in iterFields(header):
+                    if field == 1:
+                        blobType = bytes(value).decode("utf-8")
+                    elif field == 3:
+                        dataSize = value
+                blob = pbfFile.read(dataSize)
+                if blobType == "OSMData":
+                    yield blob
+
+    def send(self, elements):
+        for element in elements:
+            if not self.ignore_tags:
+                self.tags[element['type']].update(tag for tag in element['tags'] if element['type'] != "node"
+                                                  or tag not in ('lat', 'lon'))
+            self.receiver(element)
+
+    def parse(self, infile):
+
+        # decode the blocks in order, in worker processes if more than 1 worker is set
+        blobs = ((blob, self.ignore_tags) for blob in self.iterBlobs(infile))
+
+        if self.workers > 1:
+            with Pool(self.workers) as pool:
+                for elements in pool.imap(decodeBlockArgs, blobs):
+                    self.send(elements)
+        else:
+            for args in blobs:
+                self.send(decodeBlockArgs(args))
+
+        self.receiver((self.tags, self.dataset_id))
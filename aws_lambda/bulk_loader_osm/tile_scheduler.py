@@ -0,0 +1,235 @@
+"""
+The script imports a study area from the OSM API in tiles, replacing the requests of osm_import_curls.py that
+were sent one tile at a time with a fixed sleep between them.
+
+The 0.1 degree grid cells of the study area are planned into tiles on an integer grid, so that the tiles of
+a cell cover it exactly once. The tiles are fetched by a thread pool with a bounded number of requests in
+flight, spaced by an adaptive rate limiter: the interval between the requests is doubled (or set to the
+Retry-After of the response) when the endpoint throttles with HTTP 429, 509 or 5xx, and shrinks back after
+each success. Each fetched tile is saved to the tiles directory and recorded in its state.json, so a run
+that stopped on failed tiles is resumed by running it again: only the tiles not recorded as done are fetched.
+
+The OSM API returns the ways crossing a tile with all their nodes, so the elements on the tile boundaries
+are in several tiles. OsmTileDedupe passes each node, way and relation id once to the CSV writer, through an
+id set per element type, once all the tiles are parsed (see main_tiles in driver.py). Each relation keeps the
+grid cell of the first tile it is in as its 'datasetid', so that the relations are deleted with their cell.
+
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+class OsmTileThrottled(Exception):
+
+    def __init__(self, message, retryAfter=None):
+        super().__init__(message)
+        self.retryAfter = retryAfter # seconds to wait from the Retry-After header of the response, if any
+
+
+def planTiles(studyArea, tileSize=0.02):
+
+    # split the bbox of each grid cell into tiles of tileSize degrees; the tile bounds are computed from their
+    # index instead of adding tileSize up, so the last tile ends at the bound of the cell
+    tiles = []
+    for cell, bbox in studyArea.items():
+        rows = math.ceil(round((bbox['max_lat'] - bbox['min_lat']) / tileSize, 6))
+        columns = math.ceil(round((bbox['max_lon'] - bbox['min_lon']) / tileSize, 6))
+        for row in range(rows):
+            minLat = round(bbox['min_lat'] + row * tileSize, 7)
+            maxLat = round(min(bbox['min_lat'] + (row + 1) * tileSize, bbox['max_lat']), 7)
+            for column in range(columns):
+                minLon = round(bbox['min_lon'] + column * tileSize, 7)
+                maxLon = round(min(bbox['min_lon'] + (column + 1) * tileSize, bbox['max_lon']), 7)
+                tiles.append({"key": "{}-{}-{}".format(cell, row, column), "cell": cell,
+                              "bbox": "{},{},{},{}".format(minLon, minLat, maxLon, maxLat)})
+    return tiles
+
+
+class AdaptiveRateLimiter:
+
+    def __init__(self, interval=1.0, minInterval=0.1, maxInterval=60.0, decrease=0.9):
+        self.interval = interval # seconds between the starts of two requests
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.decrease = decrease # factor of the interval after a success
+        self.nextStart = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        # reserve the next start time, then sleep outside of the lock until then
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.nextStart)
+            self.nextStart = start + self.interval
+        time.sleep(start - now)
+
+    def success(self):
+        with self.lock:
+            self.interval = max(self.minInterval, self.interval * self.decrease)
+
+    def throttled(self, retryAfter=None):
+        with self.lock:
+            self.interval = min(self.maxInterval, max(self.interval * 2, retryAfter or 0))
+            self.nextStart = max(self.nextStart, time.monotonic() + (retryAfter or self.interval))
+
+
+class OsmApiTileSource:
+
+    THROTTLE_STATUSES = {429, 509}
+
+    def __init__(self, url="https://api.openstreetmap.org/api/0.6/map", headers=None, session=None, timeout=120):
+        self.url = url
+        self.headers = headers or {}
+        self.session = session or requests # requests session, or the requests module
+        self.timeout = timeout
+
+    def __call__(self, tile):
+        # fetch the osm xml of the tile bbox
+        response = self.session.get(self.url, params={"bbox": tile['bbox']}, headers=self.headers, timeout=self.timeout)
+        if response.status_code in self.THROTTLE_STATUSES or response.status_code >= 500:
+            retryAfter = response.headers.get("Retry-After")
+            raise OsmTileThrottled("Tile {} throttled with HTTP {}".format(tile['key'], response.status_code),
+                                   float(retryAfter) if retryAfter and retryAfter.isdigit() else None)
+        if response.status_code != 200:
+            raise Exception("ERROR: Tile {} failed with HTTP {}: {}".format(tile['key'], response.status_code, response.text[:200]))
+        return response.content
+
+
+class OsmTileScheduler:
+
+    def __init__(self, fetchTile, directory="tmp", workers=4, limiter=None, retries=3):
+        self.fetchTile = fetchTile # function returning the osm xml bytes of a tile, e.g. OsmApiTileSource
+        self.directory = os.path.join(directory, "tiles")
+        self.workers = workers # number of requests in flight
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.retries = retries # attempts of a tile after the first one
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.state = self.loadState()
+
+    def statePath(self):
+        return os.path.join(self.directory, "state.json")
+
+    def tilePath(self, tile):
+        return os.path.join(self.directory, "{}.osm".format(tile['key']))
+
+    def loadState(self):
+        if os.path.exists(self.statePath()):
+            with open(self.statePath()) as stateFile:
+                return json.load(stateFile)
+        return {"done": {}, "failed": {}}
+
+    def saveState(self):
+        # replace the state file at once, so an interrupted run leaves the previous state
+        with self.lock:
+            with open(self.statePath() + ".part", "w") as stateFile:
+                json.dump(self.state, stateFile)
+            os.replace(self.statePath() + ".part", self.statePath())
+
+    def isDone(self, tile):
+        return tile['key'] in self.state["done"] and os.path.exists(self.tilePath(tile))
+
+    def fetch(self, tile):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                data = self.fetchTile(tile)
+            except OsmTileThrottled as e:
+                self.limiter.throttled(e.retryAfter)
+                if attempt == self.retries:
+                    raise
+                continue
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+                continue
+            self.limiter.success()
+            break
+
+        with open(self.tilePath(tile) + ".part", "wb") as tileFile:
+            tileFile.write(data)
+        os.replace(self.tilePath(tile) + ".part", self.tilePath(tile))
+
+        with self.lock:
+            self.state["done"][tile['key']] = len(data)
+            self.state["failed"].pop(tile['key'], None)
+        self.saveState()
+
+    def run(self, tiles):
+        # fetch the tiles that are not done yet; return the keys of the tiles that failed
+        pending = [tile for tile in tiles if not self.isDone(tile)]
+        print("OSM TILES: {} OF {} TO FETCH WITH {} WORKERS".format(len(pending), len(tiles), self.workers))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.fetch, tile): tile for tile in pending}
+            for future in as_completed(futures):
+                tile = futures[future]
+                try:
+                    future.result()
+                    print("TILE {} {}: DONE".format(tile['key'], tile['bbox']))
+                except Exception as e:
+                    print("TILE {} {}: FAILED: {}".format(tile['key'], tile['bbox'], e))
+                    with self.lock:
+                        self.state["failed"][tile['key']] = str(e)
+        self.saveState()
+
+        failed = [tile['key'] for tile in tiles if not self.isDone(tile)]
+        print("OSM TILES: {} DONE, {} FAILED".format(len(tiles) - len(failed), len(failed)))
+        return failed
+
+
+class OsmTileDedupe:
+
+    MAIN_ELEMENTS = ["node", "way", "relation"]
+
+    def __init__(self, receiver, directory="tmp"):
+        self.receiver = receiver # function receiving each element once, e.g. OsmAWSBulkLoadCSVWriter.receive
+        self.directory = directory
+        self.ids = {elementType: set() for elementType in self.MAIN_ELEMENTS} # ids already kept
+        self.counts = {elementType: [0, 0] for elementType in self.MAIN_ELEMENTS} # received, kept
+        self.spillFiles = {elementType: open(self.spillPath(elementType), "w") for elementType in self.MAIN_ELEMENTS}
+
+    def spillPath(self, elementType):
+        return os.path.join(self.directory, "tiles-{}.spill".format(elementType))
+
+    def receive(self, data, cell=None):
+        if 'type' not in data:
+            # end of the xml of a tile; the end of xml is sent by finish once all the tiles are parsed
+            return
+
+        elementType = data['type']
+        self.counts[elementType][0] += 1
+        elementId = int(data['id'])
+        if elementId in self.ids[elementType]:
+            return
+        self.ids[elementType].add(elementId)
+        if elementType == "relation" and cell is not None:
+            data['datasetid'] = cell # grid cell of the tile the relation is first found in
+        self.spillFiles[elementType].write(json.dumps(data) + "\n")
+
+    def finish(self, dataset_id):
+        # send the kept nodes, then ways and relations, so that a streaming writer has all the nodes of the ways
+        tags = {"node":set(),"way":set(),"relation":set()}
+        for elementType in self.MAIN_ELEMENTS:
+            self.spillFiles[elementType].close()
+            with open(self.spillPath(elementType)) as spillFile:
+                for line in spillFile:
+                    element = json.loads(line)
+                    tags[elementType].update(element['tags'])
+                    self.counts[elementType][1] += 1
+                    self.receiver(element)
+            os.remove(self.spillPath(elementType))
+        self.ids = None
+
+        tags["node"].difference_update(('lat', 'lon'))
+        for elementType, (received, kept) in self.counts.items():
+            print("TILES: {} OF {} OSM {}S KEPT".format(kept, received, elementType.upper()))
+
+        self.receiver((tags, dataset_id))
@@ -0,0 +1,61 @@
+"""
+The script contains the contraction of the OSM ways into edges between junction nodes, used by the CSV writer
+instead of one WAY edge per pair of consecutive nodes.
+
+A node is a junction if it is the first or last node of a way, if it is referenced more than once by the ways
+(shared by several ways, or twice by the same way), or if it has tags, e.g. a crossing or traffic signals.
+The other nodes of a way only shape its geometry: each chain of them is contracted into a single WAY edge
+between the junctions before and after it, with the geometry of the chain as an encoded polyline and its
+length. For the polyline format, see:
+    https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+
+"""
+
+import numpy as np
+
+
+def encodePolyline(lats, lons, precision=5):
+
+    # encode the coordinates as a polyline; each value is the zigzag varint of the delta from the previous one,
+    # in 5-bit chunks offset by 63
+    factor = 10 ** precision
+    values = np.column_stack([np.round(np.asarray(lats) * factor), np.round(np.asarray(lons) * factor)]).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    chars = []
+    for delta in deltas.tolist():
+        value = ~(delta << 1) if delta < 0 else delta << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+
+    return "".join(chars)
+
+
+class OsmWayContraction:
+
+    def __init__(self, ways, taggedNodeIds=()):
+
+        # count the references of each node over all the ways
+        refs = np.fromiter((int(ref) for way in ways for ref in way['nodes']), dtype=np.int64)
+        ids, counts = np.unique(refs, return_counts=True)
+        ends = np.fromiter((int(way['nodes'][i]) for way in ways if way['nodes'] for i in (0, -1)), dtype=np.int64)
+        tagged = np.fromiter((int(nodeId) for nodeId in taggedNodeIds), dtype=np.int64)
+
+        self.junctions = np.unique(np.concatenate([ids[counts > 1], ends, tagged])) # sorted junction node ids
+        print("WAY CONTRACTION: {} JUNCTIONS OF {} NODES".format(len(self.junctions), len(ids)))
+
+    def isJunction(self, nodeRefs):
+        nodeIds = np.asarray([int(ref) for ref in nodeRefs], dtype=np.int64)
+        indices = np.minimum(np.searchsorted(self.junctions, nodeIds), max(len(self.junctions) - 1, 0))
+        return self.junctions[indices] == nodeIds if len(self.junctions) else np.zeros(len(nodeIds), dtype=bool)
+
+    def segments(self, nodeRefs):
+
+        # split the node refs of a way at its junctions; consecutive segments share their junction node
+        junction = self.isJunction(nodeRefs)
+        junction[0] = junction[-1] = True
+        cuts = np.flatnonzero(junction).tolist()
+
+        return [nodeRefs[start:end + 1] for start, end in zip(cuts[:-1], cuts[1:])]
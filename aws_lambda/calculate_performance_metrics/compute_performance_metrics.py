@@ -21,10 +21,14 @@ from trip_evaluation import calculate_deviations
 
 class ComputePMDMetrics:
 
-    def __init__(self, env: str, pmd_data: dict[str, list[dict]], query_url:str) -> None:
+    def __init__(self, env: str, pmd_data: dict[str, list[dict]], query_url:str, index_bucket: str = "",
+                 checked_cells: set[str] = None) -> None:
 
         self.env = env # dev, prod
         self.query_url = query_url
+        self.index_bucket = index_bucket # S3 bucket where the intersection boxes are kept
+        # grid cells whose intersection boxes were already checked against the crosswalks during the invocation
+        self.checked_cells = checked_cells if checked_cells is not None else set()
         self.pmd_data = pmd_data # a dictionary
 
     
@@ -77,7 +81,8 @@ class ComputePMDMetrics:
                 continue # continue to the next trip request
             
             # compute metrics for the monitored trip and tracked journey found
-            metric = calculate_deviations(self.env, monitored_trip, tracked_journey, self.query_url)
+            metric = calculate_deviations(self.env, monitored_trip, tracked_journey, self.query_url, self.index_bucket,
+                                          self.checked_cells)
 
             # store the metrics computed
             if metric["completed"] == True:
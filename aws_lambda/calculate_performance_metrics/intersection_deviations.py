@@ -1,27 +1,27 @@
-import sys
-sys.path.append("/mnt/fs1") # import shapely library from AWS EFS
-
-from shapely.geometry import Point, LineString
-from shapely.geometry.polygon import Polygon
-from shapely.ops import nearest_points
-from pyproj import Geod
+import boto3
+import numpy as np
 
+from geometry import point_in_polygon
 from graph_database_driver import GraphDatabaseDriver
+from intersection_index import IntersectionBoxIndex
+
+
+# keep the traffic light intersection boxes of each grid cell for all the deviated points of the run, and for the
+# following runs of a warm lambda as long as the signature of the crosswalks they were built from is the same,
+# which is checked once per grid cell and invocation
+intersection_indexes = {}
 
 
 class IntersectionDeviations:
 
-    def __init__(self, env: str, deviated_coords: Point, query_url: str) -> None:
+    def __init__(self, env: str, deviated_coords: tuple[float, float], query_url: str) -> None:
 
         self.env = env
         self.query_url = query_url
         self.deviated_coords = deviated_coords
 
-        # set WGS84 geospatial CRS
-        self.wgs84_geod = Geod(ellps = "WGS84")
-
-        self.meter_to_feet = 3.28084 # 1 meter is 3.28084 feet
         self.buffer_length = 20.0 # ft
+        self.index_prefix = "intersection-boxes/" # S3 key prefix of the intersection boxes
 
         self.study_area = {
             "34.0N84.4W": {"min_lat": 34.0, "max_lat": 34.1, "min_lon": -84.4, "max_lon": -84.3},
@@ -45,14 +45,14 @@ class IntersectionDeviations:
 
         datasetid = ""
 
-        # set up the square to check if the deviated_coords point is in the square
+        # set up the square to check if the deviated_coords (lat, lon) point is in the square
+        lat, lon = self.deviated_coords
         for key, cell in self.study_area.items():
 
             grid_points = [(cell["min_lat"], cell["min_lon"]), (cell["max_lat"], cell["min_lon"]),
                            (cell["max_lat"], cell["max_lon"]), (cell["min_lat"], cell["max_lon"])]
 
-            square = Polygon(grid_points)
-            inbox = square.contains(self.deviated_coords)
+            inbox = point_in_polygon(lat, lon, grid_points)
 
             if inbox:
 
@@ -73,11 +73,18 @@ class IntersectionDeviations:
 
     def retrieve_crosswalk_nodes(self, datasetid: str) -> list:
 
-        # retrieve OSM crosswalk nodes that represent traffic light intersections within a grid cell
-        crosswalk_query1 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(crosswalk:`OSM-WAY` "
-        crosswalk_query2 = "{{footway: 'crossing', crossing: 'traffic_signals', __datasetid: '{}'}})-"
-        crosswalk_query3 = "[:LAST]-(node2:`OSM-NODE`) RETURN crosswalk, node1, node2"
-        crosswalk_query = crosswalk_query1 + crosswalk_query2 + crosswalk_query3
+        # retrieve OSM crosswalk nodes that represent traffic light intersections within a grid cell, with the start
+        # and end coordinates written on the OSM-WAY node by the bulk loader, else with their FIRST and LAST nodes
+        crosswalk_query1 = "MATCH (crosswalk:`OSM-WAY` {{footway: 'crossing', crossing: 'traffic_signals', __datasetid: '{0}'}}) "
+        crosswalk_query2 = "WHERE crosswalk.__start_lat IS NOT NULL RETURN crosswalk, "
+        crosswalk_query3 = "{{lat: crosswalk.__start_lat, lon: crosswalk.__start_lon}} AS node1, "
+        crosswalk_query4 = "{{lat: crosswalk.__end_lat, lon: crosswalk.__end_lon}} AS node2 UNION ALL "
+        crosswalk_query5 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(crosswalk:`OSM-WAY` "
+        crosswalk_query6 = "{{footway: 'crossing', crossing: 'traffic_signals', __datasetid: '{0}'}})-"
+        crosswalk_query7 = "[:LAST]-(node2:`OSM-NODE`) WHERE crosswalk.__start_lat IS NULL RETURN crosswalk, "
+        crosswalk_query8 = "{{lat: node1.lat, lon: node1.lon}} AS node1, {{lat: node2.lat, lon: node2.lon}} AS node2"
+        crosswalk_query = crosswalk_query1 + crosswalk_query2 + crosswalk_query3 + crosswalk_query4 + \
+            crosswalk_query5 + crosswalk_query6 + crosswalk_query7 + crosswalk_query8
         crosswalk_query = crosswalk_query.format(datasetid)
         
         driverObj = GraphDatabaseDriver(self.env, self.query_url)
@@ -86,133 +93,110 @@ class IntersectionDeviations:
         return crosswalk_records
 
 
-    def sort_crosswalk_nodes(self, crosswalk_records: list) -> tuple[list, list, list]:
+    def find_crosswalk_signature(self, datasetid: str) -> tuple[int, str]:
+
+        # count the OSM crosswalk nodes that represent traffic light intersections within a grid cell 
+        # and find their largest id, to make sure the saved intersection boxes are still valid
+        crosswalk_query1 = "MATCH (crosswalk:`OSM-WAY` "
+        crosswalk_query2 = "{{footway: 'crossing', crossing: 'traffic_signals', __datasetid: '{}'}}) "
+        crosswalk_query3 = "RETURN count(crosswalk) AS count, max(crosswalk.id) AS max_id"
+        crosswalk_query = crosswalk_query1 + crosswalk_query2 + crosswalk_query3
+        crosswalk_query = crosswalk_query.format(datasetid)
+
+        driverObj = GraphDatabaseDriver(self.env, self.query_url)
+        record = driverObj.run_query("CHECK", crosswalk_query)
+
+        return record[0]["count"], record[0]["max_id"]
+
 
-        # order crosswalk nodes that represent traffic light intersections w.r.t. the deviated point
-        crosswalk_nodes = []
-        crosswalk_distances = []
+    def build_intersection_index(self, datasetid: str, signature: tuple[int, str]) -> IntersectionBoxIndex:
 
+        # draw the buffered square boxes of the traffic light intersections once from the crosswalks of the grid cell
         first_crosswalk_latlon = []
         last_crosswalk_latlon = []
 
-        for crosswalk_record in crosswalk_records:
+        for crosswalk_record in self.retrieve_crosswalk_nodes(datasetid):
 
-            crosswalk = crosswalk_record.data()["crosswalk"]
+            # find the start and end points in lat/lon of the crosswalk
+            record_data = crosswalk_record.data()
+            start_node = record_data["node1"]
+            end_node = record_data["node2"]
 
-            # find start and end points in lat/lon of the crosswalk
-            start_node = crosswalk_record.data()["node1"]
-            start_node_lat = start_node["lat"]
-            start_node_lon = start_node["lon"]
+            first_crosswalk_latlon.append((start_node["lat"], start_node["lon"]))
+            last_crosswalk_latlon.append((end_node["lat"], end_node["lon"]))
 
-            end_node = crosswalk_record.data()["node2"]
-            end_node_lat = end_node["lat"]
-            end_node_lon = end_node["lon"]
+        first_latlon = np.array(first_crosswalk_latlon, dtype=float).reshape(-1, 2)
+        last_latlon = np.array(last_crosswalk_latlon, dtype=float).reshape(-1, 2)
+        intersection_index = IntersectionBoxIndex.build_traffic_signal_boxes(first_latlon[:, 0], first_latlon[:, 1],
+                                                                             last_latlon[:, 0], last_latlon[:, 1],
+                                                                             self.buffer_length, signature)
 
-            # create the crosswalk line
-            crosswalk_line = LineString(((start_node_lat, start_node_lon), (end_node_lat, end_node_lon)))
+        return intersection_index
 
-            # find the nearest point on the crosswalk line to the deviated point
-            near_points = nearest_points(crosswalk_line, self.deviated_coords)
 
-            # determine the distance in meters between the two points
-            lat1 = near_points[0].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon1 = near_points[0].y # x if use (lon, lat) as inputs to Point and LineString above
-            lat2 = near_points[1].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon2 = near_points[1].y # x if use (lon, lat) as inputs to Point and LineString above
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+    def find_intersection_index(self, datasetid: str, index_bucket: str = "",
+                                checked_cells: set[str] = None) -> IntersectionBoxIndex:
 
-            # convert the distance from meters to feet
-            distance = self.meter_to_feet * dist
+        # reuse the boxes in memory without querying the crosswalks again once the grid cell was checked this invocation
+        intersection_index = intersection_indexes.get(datasetid)
 
-            # store the crosswalk node and the computed distance
-            crosswalk_nodes.append(crosswalk)
-            crosswalk_distances.append(distance)
+        if checked_cells is not None and datasetid in checked_cells and intersection_index is not None:
+            return intersection_index
 
-            # store the lat/lon of start and end points of the crosswalk node
-            first_crosswalk_latlon.append((start_node_lat, start_node_lon))
-            last_crosswalk_latlon.append((end_node_lat, end_node_lon))
-        
-        # order the crosswalk nodes found based on the computed distances
-        sorted_crosswalk_nodes = [val for (_, val) in sorted(zip(crosswalk_distances, crosswalk_nodes), key=lambda x: x[0])]
-
-        # order the first and last points of the crosswalk nodes based on the computed distances
-        sorted_first_crosswalk_latlon = [val for (_, val) in sorted(zip(crosswalk_distances, first_crosswalk_latlon), key=lambda x: x[0])]
-        sorted_last_crosswalk_latlon = [val for (_, val) in sorted(zip(crosswalk_distances, last_crosswalk_latlon), key=lambda x: x[0])]
+        # find the traffic light intersection boxes of the grid cell in memory first, then in the S3 bucket if given,
+        # and draw them from the crosswalks if they are not found or if the crosswalks have changed since then
+        signature = self.find_crosswalk_signature(datasetid)
 
-        return sorted_crosswalk_nodes, sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon
+        if intersection_index is not None:
 
+            if intersection_index.signature == signature:
+                return intersection_index
 
-    def find_square_box_points(self, buffered_distance: float, close_first_crosswalk_latlon: tuple, 
-                               close_last_crosswalk_latlon: tuple, far_first_crosswalk_latlon: tuple, 
-                               far_last_crosswalk_latlon: tuple) -> Polygon:
+            print("THE INTERSECTION BOXES IN MEMORY ARE OUT OF DATE FOR GRID CELL:", datasetid)
+            intersection_index = None
 
-            # form the square based on the 4 points found
-            points = [close_first_crosswalk_latlon, close_last_crosswalk_latlon,
-                      far_first_crosswalk_latlon, far_last_crosswalk_latlon]
-            square = Polygon(points)
+        if index_bucket:
 
-            # find centroid of the square
-            centroid = square.centroid # Point
+            s3_client = boto3.client("s3")
+            key = self.index_prefix + datasetid + "-traffic-signals.npz"
+            intersection_index = IntersectionBoxIndex.load_s3(s3_client, index_bucket, key)
 
-            # draw intersection square with the buffered distance
-            buffered_square = centroid.buffer(buffered_distance, cap_style = 3)
+            if intersection_index is not None and intersection_index.signature != signature:
 
-            return buffered_square
+                print("THE SAVED INTERSECTION BOXES ARE OUT OF DATE FOR GRID CELL:", datasetid)
+                intersection_index = None
 
+        if intersection_index is None:
 
-    def check_deviated_intersection(self, sorted_crosswalk_nodes: list, sorted_first_crosswalk_latlon: list, 
-                                    sorted_last_crosswalk_latlon: list) -> bool:
+            intersection_index = self.build_intersection_index(datasetid, signature)
 
-        # check to see if the deviated point is inside a buffered square box
-        inbox = False
+            if index_bucket:
+                intersection_index.save_s3(s3_client, index_bucket, key)
 
-        if len(sorted_crosswalk_nodes) >= 4: # sufficient to check 4 closest crosswalk nodes
+        intersection_indexes[datasetid] = intersection_index
 
-            # find the length of the nearest crosswalk
-            lat1 = sorted_first_crosswalk_latlon[0][0]
-            lon1 = sorted_first_crosswalk_latlon[0][1]
-            lat2 = sorted_last_crosswalk_latlon[0][0]
-            lon2 = sorted_last_crosswalk_latlon[0][1]
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+        if checked_cells is not None:
+            checked_cells.add(datasetid)
 
-            # convert the distance from meters to feet and divide by 2 to get half of the square length plus buffer
-            buffered_distance = self.meter_to_feet * dist / 2.0 + self.buffer_length
+        return intersection_index
 
-            # draw intersection square with the buffered_distance
-            close_first_crosswalk_latlon = sorted_first_crosswalk_latlon[0]
-            close_last_crosswalk_latlon = sorted_last_crosswalk_latlon[0]
-            far_first_crosswalk_latlon = sorted_first_crosswalk_latlon[3]
-            far_last_crosswalk_latlon = sorted_last_crosswalk_latlon[3]
-            buffered_square = self.find_square_box_points(buffered_distance, close_first_crosswalk_latlon, 
-                                                          close_last_crosswalk_latlon, far_first_crosswalk_latlon, 
-                                                          far_last_crosswalk_latlon)
-            
-            # check to see if the deviated point is in the square box
-            inbox = buffered_square.contains(self.deviated_coords)
-        
-        return inbox
-    
 
     @classmethod
-    def find_intersection_deviations_class(cls, env: str, lat: float, lon: float, query_url: str) -> bool:
+    def find_intersection_deviations_class(cls, env: str, lat: float, lon: float, query_url: str, 
+                                           index_bucket: str = "", checked_cells: set[str] = None) -> bool:
 
         # form the deviated point
-        deviated_coords = Point(lat, lon)
+        deviated_coords = (lat, lon)
 
         # initialize the class object
         deviatedObj = cls(env, deviated_coords, query_url)
 
-        # retrieve OSM-WAY crosswalk nodes that represent traffic light intersections
+        # find the intersection boxes drawn from the OSM-WAY crosswalk nodes that represent traffic light intersections
         datasetid = deviatedObj.find_study_area_cell()
-        crosswalk_records = deviatedObj.retrieve_crosswalk_nodes(datasetid)
-
-        # sort crosswalk traffic light intersections based on the deviated point of interest
-        sorted_crosswalk_nodes, sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon \
-        = deviatedObj.sort_crosswalk_nodes(crosswalk_records)
+        intersection_index = deviatedObj.find_intersection_index(datasetid, index_bucket, checked_cells)
 
         # determine if the deviation occurs near a traffic light intersection
-        inbox = deviatedObj.check_deviated_intersection(sorted_crosswalk_nodes, sorted_first_crosswalk_latlon, 
-                                                        sorted_last_crosswalk_latlon)
+        inbox = intersection_index.contains(lat, lon)
 
 
         return inbox
\ No newline at end of file
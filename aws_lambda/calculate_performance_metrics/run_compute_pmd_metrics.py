@@ -34,7 +34,9 @@ class PMDMetricsRun:
         self.env = env # dev, prod
         self.week = week # e.g. 20240401
         self.s3_bucket_output = public_bucket # a public bucket
+        self.s3_bucket = s3_bucket # PMD data bucket, also keeps the intersection boxes of the grid cells
         self.query_url = query_url
+        self.checked_cells = set() # grid cells whose crosswalk signature was checked during the invocation
         # initialize s3 client
         self.s3_client = boto3.client("s3")
 
@@ -151,7 +153,8 @@ class PMDMetricsRun:
     def compute_pmd_metrics(self, pmd_data: dict[str, list[dict]], date: str) -> dict[str, Any]:
 
         # compute the metrics based on the PMD data for the day
-        computePMDMetricsObj = ComputePMDMetrics(self.env, pmd_data, self.query_url)
+        computePMDMetricsObj = ComputePMDMetrics(self.env, pmd_data, self.query_url, self.s3_bucket,
+                                                 self.checked_cells)
         unique_users_count = computePMDMetricsObj.compute_unique_users_count()
         trips_requested_count = computePMDMetricsObj.compute_trips_requested_count()
         trips_completed_deviated_count = computePMDMetricsObj.compute_trips_completed_deviated_count()
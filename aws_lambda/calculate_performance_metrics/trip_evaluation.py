@@ -64,7 +64,7 @@ def minimum_distance(pointlist, lat, lon):
             min_i = i
     return (min_dist, min_i)
 
-def calculate_deviations(env, monitoredTrip, trackedJourney, query_url):
+def calculate_deviations(env, monitoredTrip, trackedJourney, query_url, index_bucket="", checked_cells=None):
     
     legs = monitoredTrip["itinerary"]["legs"]
     locs = trackedJourney["locations"]
@@ -100,7 +100,7 @@ def calculate_deviations(env, monitoredTrip, trackedJourney, query_url):
                         # determine if the deviated link occurs at a traffic light intersection
                         deviated_lat = deviatedLink["lat"]
                         deviated_lon = deviatedLink["lon"]
-                        inbox = IntersectionDeviations.find_intersection_deviations_class(env, deviated_lat, deviated_lon, query_url)
+                        inbox = IntersectionDeviations.find_intersection_deviations_class(env, deviated_lat, deviated_lon, query_url, index_bucket, checked_cells)
 
                         if inbox:
                             print("User deviation found at a traffic light intersection at lat/lon:", 
@@ -1,7 +1,10 @@
 import json
-import requests
 import boto3
-import time
+
+from neptune_loader import NeptuneLoaderClient
+
+
+WAIT_RESERVE = 30.0 # seconds of the invocation kept to invoke the next lambda function after waiting for the load
 
 
 def lambda_handler(event, context):
@@ -20,55 +23,62 @@ def lambda_handler(event, context):
     LOAD_BUCKET = event['stageVariables']['LOAD_BUCKET']
     BULKLOAD_SOURCE = "s3://"+LOAD_BUCKET
 
-    # create the S3 client
-    s3_client = boto3.client("s3")
-    
-    # copy the file on S3 root bucket to impedance folder
-    bucket = LOAD_BUCKET
-    old_filepath = "/" + bucket + "/" + filename
-    new_filepath = "impedance" + "/" + filename
-
-    response = s3_client.copy_object(
-        Bucket = bucket,
-        CopySource = old_filepath,
-        Key = new_filepath,
-    )
-
-    # delete the old file
-    response = s3_client.delete_object(
-        Bucket = bucket,
-        Key = filename,
-    )
-
-    bulkLoad_json = {
-            "source" : BULKLOAD_SOURCE+"/impedance",
-            "format" : "csv",
-            "iamRoleArn" : "arn:aws:iam::760336115441:role/neptune-s3-read-access",
-            "region" : "us-east-2",
-            "failOnError" : "FALSE",
-            "parallelism" : "MEDIUM",
-            "updateSingleCardinalityProperties" : "TRUE",
-            "queueRequest" : "TRUE",
-            "dependencies" : []
-        }
-
-    bulkLoad_response = requests.post(LOADER_URL, json=bulkLoad_json)
-
-    print("Bulk Load Response:", bulkLoad_response.json())
-    
-    time.sleep(15) # wait 15 seconds before executing the search query lambda function
-
-    # set up locations for new impedance links if needed
-    print("Setting up location of the impedance links for search query as needed")
+    loader = NeptuneLoaderClient(LOADER_URL)
+
+    # optional load_id input parameter: the load submitted by the invocation this one follows up on
+    load_id = event["queryStringParameters"].get("load_id")
+
+    if load_id is None:
+
+        # create the S3 client
+        s3_client = boto3.client("s3")
+
+        # copy the file on S3 root bucket to impedance folder
+        bucket = LOAD_BUCKET
+        old_filepath = "/" + bucket + "/" + filename
+        new_filepath = "impedance" + "/" + filename
+
+        response = s3_client.copy_object(
+            Bucket = bucket,
+            CopySource = old_filepath,
+            Key = new_filepath,
+        )
+
+        # delete the old file
+        response = s3_client.delete_object(
+            Bucket = bucket,
+            Key = filename,
+        )
+
+        load_id = loader.submit(BULKLOAD_SOURCE+"/impedance")
+
+    # wait for the impedance links to be loaded before executing the search query lambda function, as long as
+    # the invocation has time left to invoke the next lambda function
+    timeout = max(0.0, context.get_remaining_time_in_millis() / 1000.0 - WAIT_RESERVE)
+    status = loader.wait(load_id, timeout=timeout)
     lambda_client = boto3.client("lambda")
 
-    invoke_response = lambda_client.invoke(FunctionName="search-query-impedance",
-                                           InvocationType="Event",
-                                           Payload='{{ "env": "{}" }}'.format(env))
-    print(invoke_response)
-    print("Done setting up location on impedance links on AWS Neptune database")
+    if status in loader.PENDING_STATUSES:
+        # the load is not finished yet, keep waiting for it in a new invocation with the same request
+        print("The bulk load {} of the impedance links is {}, waiting in a new invocation".format(load_id, status))
+        resumeEvent = dict(event, queryStringParameters=dict(event["queryStringParameters"], load_id=load_id))
+        lambda_client.invoke(FunctionName=context.function_name, InvocationType="Event",
+                             Payload=json.dumps(resumeEvent))
+
+    elif status == "LOAD_COMPLETED":
+        # set up locations for new impedance links if needed
+        print("Setting up location of the impedance links for search query as needed")
+
+        invoke_response = lambda_client.invoke(FunctionName="search-query-impedance",
+                                               InvocationType="Event",
+                                               Payload='{{ "env": "{}" }}'.format(env))
+        print(invoke_response)
+        print("Done setting up location on impedance links on AWS Neptune database")
+
+    else:
+        raise Exception("ERROR: The bulk load {} of the impedance links is {}, the search query is not executed".format(load_id, status))
 
     return {
         "statusCode": 200,
-        "body": bulkLoad_response.json()
+        "body": dict(loader.responses.get(load_id, {"payload": {"loadId": load_id}}), status=status)
     }
\ No newline at end of file
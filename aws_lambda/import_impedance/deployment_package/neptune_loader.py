@@ -0,0 +1,114 @@
+"""
+The script contains a client of the AWS Neptune bulk loader endpoint (LOADER_URL), shared by the lambda
+functions that load CSV files from S3.
+
+The client submits the load jobs with the settings used across the project, keeps the loadId of each job,
+and polls the status of a job with a backoff until it is finished, so that follow-up work can start when
+the data is loaded instead of after a fixed sleep. Edge loads can be submitted with the loadIds of the vertex
+loads as dependencies, so that the loader only starts them once the vertices are loaded. For the API, see:
+    https://docs.aws.amazon.com/neptune/latest/userguide/load-api-reference.html
+
+"""
+
+import time
+
+import requests
+
+
+class NeptuneLoaderClient:
+
+    # statuses of a job that is not finished yet
+    PENDING_STATUSES = {"LOAD_NOT_STARTED", "LOAD_IN_QUEUE", "LOAD_IN_PROGRESS"}
+
+    def __init__(self, loader_url, iam_role_arn="arn:aws:iam::760336115441:role/neptune-s3-read-access",
+                 region="us-east-2", session=None):
+
+        self.loader_url = loader_url.rstrip("/")
+        self.iam_role_arn = iam_role_arn
+        self.region = region
+        self.session = session or requests # requests session, or the requests module
+        self.load_ids = [] # loadIds of the submitted jobs, in submit order
+        self.responses = {} # loader response of each submitted job by loadId
+
+
+    def load_request(self, source, dependencies=None, **options):
+
+        # bulk load request of the source with the default settings; options override them, e.g. parallelism="HIGH"
+        request = {
+            "source" : source,
+            "format" : "csv",
+            "iamRoleArn" : self.iam_role_arn,
+            "region" : self.region,
+            "failOnError" : "FALSE",
+            "parallelism" : "MEDIUM",
+            "updateSingleCardinalityProperties" : "TRUE",
+            "queueRequest" : "TRUE",
+            "dependencies" : list(dependencies or [])
+        }
+        request.update(options)
+
+        return request
+
+
+    def submit(self, source, dependencies=None, **options):
+
+        # submit a load job of the S3 source (a prefix or a single file); return its loadId
+        response = self.session.post(self.loader_url, json=self.load_request(source, dependencies, **options))
+        response_json = response.json()
+        print("Bulk load response:", response_json)
+
+        if "payload" not in response_json or "loadId" not in response_json["payload"]:
+            raise Exception("ERROR: The bulk load of {} is not accepted: {}".format(source, response_json))
+
+        load_id = response_json["payload"]["loadId"]
+        self.load_ids.append(load_id)
+        self.responses[load_id] = response_json
+
+        return load_id
+
+
+    def submit_vertices_edges(self, vertex_sources, edge_sources, **options):
+
+        # submit the vertex loads, then the edge loads depending on all of them; return the loadIds of both
+        vertex_load_ids = [self.submit(source, **options) for source in vertex_sources]
+        edge_load_ids = [self.submit(source, vertex_load_ids, **options) for source in edge_sources]
+
+        return vertex_load_ids, edge_load_ids
+
+
+    def status(self, load_id):
+
+        # overall status of the job, e.g. LOAD_IN_PROGRESS or LOAD_COMPLETED
+        response = self.session.get("{}/{}".format(self.loader_url, load_id))
+        response_json = response.json()
+
+        # an error response, e.g. an unknown loadId, has a code and a detailedMessage instead of the payload
+        if "overallStatus" not in response_json.get("payload", {}):
+            raise Exception("ERROR: The status of the bulk load {} is not available: {}".format(load_id, response_json))
+
+        return response_json["payload"]["overallStatus"]["status"]
+
+
+    def wait(self, load_id, timeout=600.0, interval=1.0, max_interval=30.0):
+
+        # poll the status of the job with an exponential backoff until it is finished or the timeout is reached;
+        # return the last status
+        start = time.time()
+        while True:
+            status = self.status(load_id)
+            print("Bulk load {}: {}".format(load_id, status))
+            if status not in self.PENDING_STATUSES or time.time() - start + interval > timeout:
+                return status
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+
+    def wait_all(self, load_ids=None, timeout=600.0, interval=1.0, max_interval=30.0):
+
+        # wait for the jobs (all the submitted ones by default) in order; return the last status of each of them
+        start = time.time()
+        statuses = {}
+        for load_id in (self.load_ids if load_ids is None else load_ids):
+            statuses[load_id] = self.wait(load_id, max(0.0, timeout - (time.time() - start)), interval, max_interval)
+
+        return statuses
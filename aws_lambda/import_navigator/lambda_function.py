@@ -19,12 +19,15 @@ import json
 
 from retrieve_navigator_data_s3 import RetrieveNavigatorDataS3
 from preprocess import PreprocessNavigatorData
-from graph_database_driver import GraphDatabaseDriver
+from footway_geometry_cache import FootwayGeometryCache
 from query_writer_navigator import NavigatorEventQueries
 
 
 code_pipeline = boto3.client("codepipeline")
 
+# keep the sidewalk and crosswalk segments of the recently used grid cells between the invocations of a warm container
+footway_cache = FootwayGeometryCache()
+
 
 def put_job_success(job, message):
     """Notify CodePipeline of a successful job
@@ -115,26 +118,14 @@ def lambda_handler(event, context):
             comments = preprocessObj.preprocess_comments()
             properties = preprocessObj.preprocess_properties()
 
-            # retrieve all sidewalk and crosswalk nodes from OSM first for attachments, their start and end nodes are also retrieved
-            sidewalk_query1 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(sidewalk:`OSM-WAY` {{footway: 'sidewalk', __datasetid: '{}'}})-"
-            sidewalk_query2 = "[:LAST]-(node2:`OSM-NODE`) RETURN sidewalk, node1, node2"
-            sidewalk_query = sidewalk_query1 + sidewalk_query2
-            sidewalk_query = sidewalk_query.format(data_set_id)
-
-            crosswalk_query1 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(crosswalk:`OSM-WAY` {{footway: 'crossing', __datasetid: '{}'}})-"
-            crosswalk_query2 = "[:LAST]-(node2:`OSM-NODE`) RETURN crosswalk, node1, node2"
-            crosswalk_query = crosswalk_query1 + crosswalk_query2
-            crosswalk_query = crosswalk_query.format(data_set_id)
-            
-            driverObj = GraphDatabaseDriver(QUERY_URL)
-            sidewalk_records = driverObj.run_query("CHECK", sidewalk_query)
-            crosswalk_records = driverObj.run_query("CHECK", crosswalk_query)
+            # find the sidewalk and crosswalk segments of the grid cell for attachments, from the cache if still valid
+            sidewalk_index, crosswalk_index = footway_cache.find_indexes(QUERY_URL, data_set_id)
             
             # ingest or update scheduled and unscheduled event nodes and links
             print("Parsing NaviGAtor scheduled and unscheduled event nodes and links to AWS Neptune database")
             navigatorObj = NavigatorEventQueries(QUERY_URL, method, scheduled_events, unscheduled_events, 
-                                                 comments, properties, sidewalk_records, crosswalk_records, 
-                                                 data_set_id)
+                                                 comments, properties, [], [], data_set_id,
+                                                 sidewalk_index, crosswalk_index)
             navigatorObj.create_transaction()
             print("Done parsing NaviGAtor events nodes and links to AWS Neptune database")
             print("Whole process is completed for the request:", method)
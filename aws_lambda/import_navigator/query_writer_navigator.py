@@ -9,28 +9,21 @@ For more information on the openCypher queries, visit:
 
 """
 
-import os
-import sys
-sys.path.append("/mnt/fs1") # import shapely library from AWS EFS
-
 import time
-from shapely.geometry import Point, LineString
-from shapely.geometry.polygon import Polygon
-from shapely.ops import nearest_points
-from pyproj import Geod
 from neo4j import GraphDatabase, RoutingControl
 
 from set_impedance_factors import set_unscheduled_events_impedance, set_scheduled_events_impedance
+from spatial_index import SegmentGridIndex
+from geometry import point_segment_distances, point_in_polygon
+from batched_delete import BatchedDelete
 
 
 class NavigatorEventQueries:
 
     def __init__(self, query_url, method, scheduled_events, unscheduled_events, 
                  comments, properties, sidewalk_records, crosswalk_records, 
-                 data_set_id):
+                 data_set_id, sidewalk_index=None, crosswalk_index=None):
         
-        print("Python Libraries on AWS EFS:", os.listdir("/mnt/fs1"))
-
         self.method = method # API request method: POST, DELETE
         self.scheduled_events = scheduled_events # dataframe
         self.unscheduled_events = unscheduled_events # dataframe
@@ -38,13 +31,11 @@ class NavigatorEventQueries:
         self.properties = properties # dataframe
         self.sidewalk_records = sidewalk_records # OSM-WAY nodes and their start/end OSM-NODE nodes
         self.crosswalk_records = crosswalk_records # OSM-WAY nodes and their start/end OSM-NODE nodes
+        self.sidewalk_index = sidewalk_index # spatial index over the sidewalk segments, built from the records if None
+        self.crosswalk_index = crosswalk_index # spatial index over the crosswalk segments, built from the records if None
         self.datasetid = data_set_id # a grid cell name, e.g. 34.0N84.4W
         self.event_holdtime = 900000 # holding event data for 15 minutes or 900000 ms for DELETE request
         self.attach_radius = 50.0 # distance (ft) boundary for sidewalk/crosswalk node attachments
-        self.meter_to_feet = 3.28084 # 1 meter is 3.28084 feet
-
-        # set WGS84 geospatial CRS
-        self.wgs84_geod = Geod(ellps = "WGS84")
 
         if self.method == "POST":
             
@@ -68,9 +59,8 @@ class NavigatorEventQueries:
 
             # set up the square of the current grid cell
             grid = self.study_area[self.datasetid]
-            grid_points = [(grid["min_lat"], grid["min_lon"]), (grid["max_lat"], grid["min_lon"]),
+            self.square = [(grid["min_lat"], grid["min_lon"]), (grid["max_lat"], grid["min_lon"]),
                            (grid["max_lat"], grid["max_lon"]), (grid["min_lat"], grid["max_lon"])]
-            self.square = Polygon(grid_points)
 
         self.event_node_label = "NAVIGATOR-EVENT"
         self.comment_node_label = "NAVIGATOR-EVENT-COMMENT"
@@ -149,7 +139,7 @@ class NavigatorEventQueries:
 
         def is_in_square_box(row):
             # determine if the point is in the square based on its lat and lon
-            inbox = self.square.contains(Point(float(row["latitude"]), float(row["longitude"])))
+            inbox = point_in_polygon(float(row["latitude"]), float(row["longitude"]), self.square)
             return inbox
 
         # call is_in_square_box to filter out events that are outside of the square grid
@@ -212,92 +202,46 @@ class NavigatorEventQueries:
         return
     
 
-    def sort_sidewalk_crosswalk_nodes(self, event):
-
-        # order sidewalk and crosswalk nodes w.r.t. the current event node location
-        lat = float(event["latitude"])
-        lon = float(event["longitude"])
-        # event_coords = (lat, lon)
-        event_coords = Point(lat, lon)
-
-        sidewalk_nodes = []
-        sidewalk_distances = []
-        crosswalk_nodes = []
-        crosswalk_distances = []
-
-        for sidewalk_record in self.sidewalk_records:
-
-            sidewalk = sidewalk_record.data()["sidewalk"]
-
-            # find start and end points in lat/lon of the sidewalk
-            start_node = sidewalk_record.data()["node1"]
-            start_node_lat = start_node["lat"]
-            start_node_lon = start_node["lon"]
-
-            end_node = sidewalk_record.data()["node2"]
-            end_node_lat = end_node["lat"]
-            end_node_lon = end_node["lon"]
-
-            # create the sidewalk line
-            sidewalk_line = LineString(((start_node_lat, start_node_lon), (end_node_lat, end_node_lon)))
+    def build_spatial_indexes(self):
 
-            # find the nearest point on the sidewalk line to the waze alert
-            near_points = nearest_points(sidewalk_line, event_coords)
+        # index the sidewalk and crosswalk segments once so each event only visits its nearby segments,
+        # unless the indexes are given already
+        if self.sidewalk_index is None:
+            self.sidewalk_index = SegmentGridIndex(self.sidewalk_records, "sidewalk")
 
-            # determine the distance in meters between the two points
-            lat1 = near_points[0].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon1 = near_points[0].y # x if use (lon, lat) as inputs to Point and LineString above
-            lat2 = near_points[1].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon2 = near_points[1].y # x if use (lon, lat) as inputs to Point and LineString above
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+        if self.crosswalk_index is None:
+            self.crosswalk_index = SegmentGridIndex(self.crosswalk_records, "crosswalk")
 
-            # convert the distance from meters to feet
-            distance = self.meter_to_feet * dist
-
-            # store the sidewalk node and the computed distance
-            sidewalk_nodes.append(sidewalk)
-            sidewalk_distances.append(distance)
-
-        for crosswalk_record in self.crosswalk_records:
-
-            crosswalk = crosswalk_record.data()["crosswalk"]
-
-            # find start and end points in lat/lon of the crosswalk
-            start_node = crosswalk_record.data()["node1"]
-            start_node_lat = start_node["lat"]
-            start_node_lon = start_node["lon"]
+        return
 
-            end_node = crosswalk_record.data()["node2"]
-            end_node_lat = end_node["lat"]
-            end_node_lon = end_node["lon"]
 
-            # create the crosswalk line
-            crosswalk_line = LineString(((start_node_lat, start_node_lon), (end_node_lat, end_node_lon)))
+    def sort_sidewalk_crosswalk_nodes(self, event):
 
-            # find the nearest point on the crosswalk line to the waze alert
-            near_points = nearest_points(crosswalk_line, event_coords)
+        # order sidewalk and crosswalk nodes within the attachment radius w.r.t. the current event node location
+        lat = float(event["latitude"])
+        lon = float(event["longitude"])
 
-            # determine the distance in meters between the two points
-            lat1 = near_points[0].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon1 = near_points[0].y # x if use (lon, lat) as inputs to Point and LineString above
-            lat2 = near_points[1].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon2 = near_points[1].y # x if use (lon, lat) as inputs to Point and LineString above
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+        # compute the distances in ft to all the candidate sidewalks at once, ordered by distance
+        indices = self.sidewalk_index.query(lat, lon, self.attach_radius)
+        distances, order = point_segment_distances(lat, lon,
+                                                   self.sidewalk_index.start_lat[indices],
+                                                   self.sidewalk_index.start_lon[indices],
+                                                   self.sidewalk_index.end_lat[indices],
+                                                   self.sidewalk_index.end_lon[indices])
 
-            # convert the distance from meters to feet
-            distance = self.meter_to_feet * dist
+        sorted_sidewalk_nodes = [self.sidewalk_index.ways[index] for index in indices[order]]
+        sorted_sidewalk_distances = distances[order].tolist()
 
-            # store the crosswalk node and the computed distance
-            crosswalk_nodes.append(crosswalk)
-            crosswalk_distances.append(distance)
+        # compute the distances in ft to all the candidate crosswalks at once, ordered by distance
+        indices = self.crosswalk_index.query(lat, lon, self.attach_radius)
+        distances, order = point_segment_distances(lat, lon,
+                                                   self.crosswalk_index.start_lat[indices],
+                                                   self.crosswalk_index.start_lon[indices],
+                                                   self.crosswalk_index.end_lat[indices],
+                                                   self.crosswalk_index.end_lon[indices])
 
-        # order the sidewalk nodes found based on the computed distances
-        sorted_sidewalk_nodes = [val for (_, val) in sorted(zip(sidewalk_distances, sidewalk_nodes), key=lambda x: x[0])]
-        sorted_sidewalk_distances = sorted(sidewalk_distances)
-        
-        # order the crosswalk nodes found based on the computed distances
-        sorted_crosswalk_nodes = [val for (_, val) in sorted(zip(crosswalk_distances, crosswalk_nodes), key=lambda x: x[0])]
-        sorted_crosswalk_distances = sorted(crosswalk_distances)
+        sorted_crosswalk_nodes = [self.crosswalk_index.ways[index] for index in indices[order]]
+        sorted_crosswalk_distances = distances[order].tolist()
 
         return sorted_sidewalk_nodes, sorted_sidewalk_distances, sorted_crosswalk_nodes, sorted_crosswalk_distances
     
@@ -671,6 +615,9 @@ class NavigatorEventQueries:
 
     def generate_post_query(self):
 
+        # index the sidewalk and crosswalk segments once for all the events
+        self.build_spatial_indexes()
+
         # filter event rows that do not need to be processed
         if not self.unscheduled_events.empty:
             unscheduled_events = self.filter_events(self.unscheduled_events)
@@ -694,12 +641,12 @@ class NavigatorEventQueries:
         time_limit = current_time_ms - self.event_holdtime 
         
         # delete event nodes and links that have last modified time less than the time limit; modified_date in EST/EDT
-        query1 = "MATCH (event:`{}`)-[relation:`{}`]->(comment_property) WHERE event.__modified_date_ms < {} ".\
-            format(self.event_node_label, self.event_node_label, time_limit)
-        query2 = "DETACH DELETE event, relation, comment_property"
-        query = query1 + query2
-
-        self.driver.execute_query(query)
+        # in batches of events, each deleted with its comment and property nodes
+        match = "MATCH (event:`{}`)-[:`{}`]->(comment_property) WHERE event.__modified_date_ms < $time_limit".\
+            format(self.event_node_label, self.event_node_label)
+        tail = "MATCH (event)-[:`{}`]->(comment_property)".format(self.event_node_label)
+        BatchedDelete(self.driver).delete("NAVIGATOR EVENT", match, "event", "event, comment_property", tail,
+                                          {"time_limit": time_limit})
 
         return
 
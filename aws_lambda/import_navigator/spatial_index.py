@@ -0,0 +1,230 @@
+"""
+The script consists of a uniform grid spatial index over the OSM-WAY sidewalk/crosswalk segments
+of a grid cell, where each segment is drawn between the FIRST and LAST OSM-NODE of the OSM-WAY node.
+
+The index is built once per invocation from the sidewalk/crosswalk records retrieved from the
+AWS Neptune database, and returns the candidate segments around a waze alert or NaviGAtor event location so that
+distances are only computed for the segments that could be within the attachment radius.
+The segment end points are also kept in NumPy arrays to be passed to the distance functions in geometry.py.
+
+The script also consists of a uniform grid index over the centroids of the GT/CE-SIDEWALK nodes used by the
+bulk load approach, to find the sidewalk node nearest to a waze alert in memory instead of computing
+and storing the distances to every sidewalk node in the database for each alert.
+
+"""
+
+import math
+import numpy as np
+
+
+class SegmentGridIndex:
+
+    def __init__(self, records, way_key, bucket_size=0.0025):
+
+        self.way_key = way_key # "sidewalk" or "crosswalk" as returned by the record
+        self.bucket_size = bucket_size # width and height of a bucket in degrees, roughly 900 ft in latitude
+        self.meter_to_feet = 3.28084 # 1 meter is 3.28084 feet
+        self.meters_per_lat_degree = 110574.0 # shortest length (m) of a degree of latitude on WGS84
+        self.meters_per_lon_degree = 111319.49 # length (m) of a degree of longitude on WGS84 at the equator
+        self.search_margin = 1.05 # widen the search box by 5% so no segment within the radius is missed
+
+        self.ways = [] # OSM-WAY nodes
+        self.first_latlon = [] # (lat, lon) of the FIRST OSM-NODE of each OSM-WAY node
+        self.last_latlon = [] # (lat, lon) of the LAST OSM-NODE of each OSM-WAY node
+        self.buckets = {} # (row, col) of the bucket -> indices of the segments overlapping the bucket
+
+        for record in records:
+
+            # convert the record once instead of for every waze alert or event
+            record_data = record.data()
+            start_node = record_data["node1"]
+            end_node = record_data["node2"]
+
+            self.add_segment(record_data[self.way_key], (start_node["lat"], start_node["lon"]),
+                             (end_node["lat"], end_node["lon"]))
+
+        self.build_arrays()
+
+
+    def find_bucket(self, lat, lon):
+
+        # find the row and column of the bucket that contains the lat/lon
+        row = math.floor(lat / self.bucket_size)
+        col = math.floor(lon / self.bucket_size)
+
+        return row, col
+
+
+    def add_segment(self, way, first_latlon, last_latlon):
+
+        # store the segment and register it in every bucket overlapped by its bounding box
+        index = len(self.ways)
+
+        min_lat = min(first_latlon[0], last_latlon[0])
+        max_lat = max(first_latlon[0], last_latlon[0])
+        min_lon = min(first_latlon[1], last_latlon[1])
+        max_lon = max(first_latlon[1], last_latlon[1])
+
+        self.ways.append(way)
+        self.first_latlon.append(first_latlon)
+        self.last_latlon.append(last_latlon)
+
+        min_row, min_col = self.find_bucket(min_lat, min_lon)
+        max_row, max_col = self.find_bucket(max_lat, max_lon)
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                self.buckets.setdefault((row, col), []).append(index)
+
+        return
+
+
+    def build_arrays(self):
+
+        # store the segment end points and bounding boxes in arrays for vectorized lookups
+        self.start_lat = np.array([latlon[0] for latlon in self.first_latlon], dtype=float)
+        self.start_lon = np.array([latlon[1] for latlon in self.first_latlon], dtype=float)
+        self.end_lat = np.array([latlon[0] for latlon in self.last_latlon], dtype=float)
+        self.end_lon = np.array([latlon[1] for latlon in self.last_latlon], dtype=float)
+
+        self.min_lat = np.minimum(self.start_lat, self.end_lat)
+        self.max_lat = np.maximum(self.start_lat, self.end_lat)
+        self.min_lon = np.minimum(self.start_lon, self.end_lon)
+        self.max_lon = np.maximum(self.start_lon, self.end_lon)
+
+        return
+
+
+    def find_search_box(self, lat, lon, radius):
+
+        # find a lat/lon box that contains every point within the radius (ft) of the lat/lon
+        radius_m = self.search_margin * radius / self.meter_to_feet
+
+        lat_delta = radius_m / self.meters_per_lat_degree
+        max_abs_lat = min(abs(lat) + lat_delta, 89.9) # a degree of longitude is shortest at the highest latitude
+        lon_delta = radius_m / (self.meters_per_lon_degree * math.cos(math.radians(max_abs_lat)))
+
+        return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+    def query(self, lat, lon, radius):
+
+        # find indices of the segments that could be within the radius (ft) of the lat/lon
+        min_lat, max_lat, min_lon, max_lon = self.find_search_box(lat, lon, radius)
+        min_row, min_col = self.find_bucket(min_lat, min_lon)
+        max_row, max_col = self.find_bucket(max_lat, max_lon)
+
+        candidates = set()
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                candidates.update(self.buckets.get((row, col), ()))
+
+        # keep the segments whose bounding box overlaps the search box, in the order of the records
+        indices = np.fromiter(sorted(candidates), dtype=np.intp, count=len(candidates))
+        overlaps = (self.max_lat[indices] >= min_lat) & (self.min_lat[indices] <= max_lat) \
+            & (self.max_lon[indices] >= min_lon) & (self.min_lon[indices] <= max_lon)
+
+        return indices[overlaps]
+
+
+class CentroidGridIndex:
+
+    def __init__(self, records, bucket_size=0.0025):
+
+        self.bucket_size = bucket_size # width and height of a bucket in degrees, roughly 900 ft in latitude
+
+        self.ids = [] # ID(sidewalk) of the GT/CE-SIDEWALK nodes
+        self.datasetids = [] # __datasetid of the GT/CE-SIDEWALK nodes
+        latitudes = []
+        longitudes = []
+        buckets = {}
+
+        for record in records:
+
+            lat = record["sidewalk.sidewalksimLinkCentroidLatitude"]
+            lon = record["sidewalk.sidewalksimLinkCentroidLongitude"]
+
+            if lat is None or lon is None:
+                continue # the node cannot be located without a centroid
+
+            buckets.setdefault(self.find_bucket(lat, lon), []).append(len(self.ids))
+            self.ids.append(record["ID(sidewalk)"])
+            self.datasetids.append(record["sidewalk.__datasetid"])
+            latitudes.append(lat)
+            longitudes.append(lon)
+
+        # store the centroids and the indices of each bucket in arrays for vectorized lookups
+        self.lat = np.array(latitudes, dtype=float)
+        self.lon = np.array(longitudes, dtype=float)
+        self.buckets = {bucket: np.array(indices, dtype=np.intp) for bucket, indices in buckets.items()}
+
+
+    def find_bucket(self, lat, lon):
+
+        # find the row and column of the bucket that contains the lat/lon
+        row = math.floor(lat / self.bucket_size)
+        col = math.floor(lon / self.bucket_size)
+
+        return row, col
+
+
+    def find_ring_indices(self, row, col, ring):
+
+        # find indices of the centroids in the buckets at the given ring around the bucket (row, col)
+        if ring == 0:
+            ring_buckets = [(row, col)]
+        else:
+            ring_buckets = [(row - ring, col + d_col) for d_col in range(-ring, ring + 1)] \
+                + [(row + ring, col + d_col) for d_col in range(-ring, ring + 1)] \
+                + [(row + d_row, col - ring) for d_row in range(-ring + 1, ring)] \
+                + [(row + d_row, col + ring) for d_row in range(-ring + 1, ring)]
+
+        bucket_indices = [self.buckets.get(bucket) for bucket in ring_buckets]
+        bucket_indices = [indices for indices in bucket_indices if indices is not None]
+
+        if not bucket_indices:
+            return np.array([], dtype=np.intp)
+
+        return np.sort(np.concatenate(bucket_indices))
+
+
+    def find_nearest_in(self, lat, lon, indices):
+
+        # find the index and the distance of the nearest centroid among the indices, 
+        # using the sum of the absolute lat and lon differences as the distance
+        distances = np.abs(self.lat[indices] - lat) + np.abs(self.lon[indices] - lon)
+        nearest = np.argmin(distances) # first of the ties, the indices are sorted
+
+        return int(indices[nearest]), float(distances[nearest])
+
+
+    def nearest(self, lat, lon):
+
+        # find the index of the centroid nearest to the lat/lon, None if no centroid is stored
+        if not self.ids:
+            return None
+
+        row, col = self.find_bucket(lat, lon)
+        best = (math.inf, None) # (distance, index)
+        ring = 0
+
+        while True:
+
+            if (2 * ring + 1) ** 2 > len(self.buckets):
+
+                # the rings cover more buckets than the ones stored, compare with every centroid instead
+                index, distance = self.find_nearest_in(lat, lon, np.arange(len(self.ids)))
+                return index
+
+            indices = self.find_ring_indices(row, col, ring)
+
+            if len(indices) > 0:
+                index, distance = self.find_nearest_in(lat, lon, indices)
+                best = min(best, (distance, index))
+
+            # centroids outside the rings visited are more than ring * bucket_size away in lat or lon
+            if best[0] <= ring * self.bucket_size:
+                return best[1]
+
+            ring += 1
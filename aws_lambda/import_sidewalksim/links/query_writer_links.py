@@ -16,6 +16,7 @@ import pandas as pd
 from neo4j import GraphDatabase, RoutingControl
 
 from presigned_url_s3 import generate_presigned_url
+from batched_delete import BatchedDelete
 
 
 class SidewalkSimLinksQueries:
@@ -269,16 +270,12 @@ class SidewalkSimLinksQueries:
 	
 	def generate_delete_query(self):
 
-		# delete sidewalksim links nodes and edges based on the __datasetid; label = GT/CE-SIDEWALK
-		query1 = "MATCH (n:`GT/CE-SIDEWALK` {{`__datasetid`: '{}'}}) ".format(self.data_set_id)
-		query2 = "DETACH DELETE n"
-		query = query1 + query2
-		self.driver.execute_query(query)
-
-		# delete sidewalksim links nodes and edges based on the __datasetid; label = OSM-NODE
-		query1 = "MATCH (n:`OSM-NODE` {{`__datasetid`: '{}'}}) ".format(self.data_set_id)
-		query = query1 + query2
-		self.driver.execute_query(query)
+		# delete sidewalksim links nodes and edges based on the __datasetid; labels = GT/CE-SIDEWALK, OSM-NODE
+		# in batches, one label after the other since the NODE-A/NODE-B links between them would make
+		# concurrent batches conflict
+		groups = [{"name": label, "match": "MATCH (n:`{}` {{`__datasetid`: $id}})".format(label),
+				   "parameters": {"id": self.data_set_id}} for label in ["GT/CE-SIDEWALK", "OSM-NODE"]]
+		BatchedDelete(self.driver).run_in_order(groups)
 
 		return
 
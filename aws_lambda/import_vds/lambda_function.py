@@ -1,6 +1,6 @@
 import json
-import requests
 from process_vds import createBulkLoadCSV
+from neptune_loader import NeptuneLoaderClient
 from pytz import timezone
 import datetime
 
@@ -16,21 +16,10 @@ def lambda_handler(event, context):
     QUERY_URL = event['stageVariables']['QUERY_URL']
     NAVIGATOR_BUCKET = event['stageVariables']['NAVIGATOR_BUCKET']
 
-    BULKLOAD_JSON = {
-        "source" : "s3://"+NAVIGATOR_BUCKET+"/bulk_loader",
-        "format" : "csv",
-        "iamRoleArn" : "arn:aws:iam::760336115441:role/neptune-s3-read-access",
-        "region" : "us-east-2",
-        "failOnError" : "FALSE",
-        "parallelism" : "MEDIUM",
-        "updateSingleCardinalityProperties" : "TRUE",
-        "queueRequest" : "TRUE",
-        "dependencies" : []
-    }
-
     createBulkLoadCSV(FILENAME,NAVIGATOR_BUCKET)    
         
-    bulkLoad_response = requests.post(LOADER_URL, json=BULKLOAD_JSON)
+    loader = NeptuneLoaderClient(LOADER_URL)
+    load_id = loader.submit("s3://"+NAVIGATOR_BUCKET+"/bulk_loader")
 
     return {
         'statusCode': 200,
@@ -38,5 +27,5 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Headers': 'Content-Type', 
                 'Access-Control-Allow-Origin':'*', 
                 'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
-        'body': json.dumps(bulkLoad_response.json())
+        'body': json.dumps(loader.responses[load_id])
     }
@@ -0,0 +1,93 @@
+"""
+The script contains a batched delete engine for the AWS Neptune database, shared by the DELETE requests of
+the OSM bulk loader, SidewalkSim, Waze and NaviGAtor.
+
+A single MATCH ... DETACH DELETE over a whole data set is one transaction, which times out or runs out of
+memory on large grid cells. The engine deletes the matched nodes in batches instead:
+
+    <match> WITH DISTINCT <variable> LIMIT <batch_size> [<tail>] DETACH DELETE <targets> RETURN count(*)
+
+until a batch deletes nothing. Each batch is retried with a backoff when it fails with a transient error,
+e.g. a lost connection or a concurrent modification conflict; other errors are raised at once. The groups of
+a delete (e.g. one per label) run concurrently on the driver, which is thread-safe, when they are disjoint:
+groups whose nodes are linked to each other (e.g. OSM relations, ways and nodes) are deleted in order instead,
+since their batches would keep conflicting on the shared links. Each group prints its progress.
+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchedDelete:
+
+    def __init__(self, driver, batch_size=1000, workers=3, retries=3, backoff=1.0):
+
+        self.driver = driver # neo4j driver connected to the Neptune database
+        self.batch_size = batch_size # maximum number of matched nodes deleted in a single transaction
+        self.workers = workers # number of groups deleted concurrently
+        self.retries = retries # number of times a failed batch is retried
+        self.backoff = backoff # seconds waited before the first retry, doubled for each next retry
+
+
+    @staticmethod
+    def is_transient(error):
+
+        # retryable errors of the driver (e.g. a lost connection) and concurrent modification conflicts of Neptune
+        # may pass on a retry; other errors, e.g. a syntax error, would fail the same way again
+        is_retryable = getattr(error, "is_retryable", None)
+
+        return (callable(is_retryable) and is_retryable()) or "ConcurrentModificationException" in str(error)
+
+
+    def execute_batch(self, query, parameters):
+
+        # execute a batch, retrying it when it fails; return the number of deleted rows
+        for attempt in range(self.retries + 1):
+            try:
+                records, _, _ = self.driver.execute_query(query, parameters)
+                return records[0]["deleted"] if records else 0
+            except Exception as error:
+                if attempt == self.retries or not self.is_transient(error):
+                    raise
+                print("DELETE BATCH FAILED, RETRY {} OF {}: {}".format(attempt + 1, self.retries, error))
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+    def delete(self, name, match, variable="n", targets=None, tail="", parameters=None):
+
+        # delete the nodes matched by the match clause in batches until none is left; targets are the deleted
+        # variables (the matched variable by default), tail is an optional clause between the batch and the delete
+        query = "{} WITH DISTINCT {} LIMIT {} {} DETACH DELETE {} RETURN count(*) AS deleted".format(
+            match, variable, self.batch_size, tail, targets or variable)
+
+        total = 0
+        batches = 0
+        while True:
+            deleted = self.execute_batch(query, parameters or {})
+            if not deleted:
+                break
+            total += deleted
+            batches += 1
+            print("DELETE {}: BATCH {}, {} DELETED".format(name, batches, total))
+
+        print("DELETE {}: DONE, {} DELETED IN {} BATCHES".format(name, total, batches))
+
+        return total
+
+
+    def run(self, groups):
+
+        # delete the disjoint groups concurrently; groups are dictionaries of the delete() arguments with a name
+        # return the number of deleted rows of each group by name
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(groups)))) as executor:
+            futures = {group["name"]: executor.submit(self.delete, **group) for group in groups}
+
+        return {name: future.result() for name, future in futures.items()}
+
+
+    def run_in_order(self, groups):
+
+        # delete the groups one after the other, e.g. the nodes linked to the ones of the next group first;
+        # return the number of deleted rows of each group by name
+        return {group["name"]: self.delete(**group) for group in groups}
@@ -0,0 +1,269 @@
+"""
+The script consists of a polygon index over the intersection boxes of a grid cell (__datasetid), built once
+from the OSM-WAY crosswalk segments instead of drawing the box around every waze alert or deviated point.
+
+An intersection box is drawn for each crosswalk from the 4 crosswalks nearest to its middle point,
+the same way the box used to be drawn around a point from its 4 nearest crosswalks:
+    crosswalk: the rough square formed by the end points of the nearest and the 4th nearest crosswalks,
+        if the 4th nearest crosswalk is within the intersection distance (waze alerts)
+    traffic signals: the square centered on the rough square above, with half of the length of the nearest
+        crosswalk plus a buffer as half of its side (deviated points near traffic light intersections)
+
+The nearest crosswalks are found among the candidates of a SegmentGridIndex over the crosswalks of the grid
+cell rather than by measuring the distances to every crosswalk of the cell from each crosswalk.
+
+The boxes are registered in the buckets of a uniform grid overlapped by their bounding boxes, so checking if
+a point is inside an intersection box only tests the few boxes of its bucket. The crosswalk boxes are also kept
+under their (nearest, 4th nearest) crosswalk pair: a waze alert is only tested against the box of its own pair
+of nearest crosswalks, drawn on first use if no crosswalk drew it, so it is in a box exactly when the box drawn
+around the alert used to contain it.
+
+The boxes are saved as a compressed NumPy file to be kept in the S3 bucket, along with the signature of the
+crosswalks they were built from:
+    s3://<bucket>/intersection-boxes/<__datasetid>-<variant>.npz
+
+"""
+
+import io
+import json
+import math
+import numpy as np
+from botocore.exceptions import ClientError
+
+from geometry import METER_TO_FEET, find_local_scales, project_local, point_segment_distances, point_in_polygon
+from spatial_index import SegmentGridIndex
+
+
+class IntersectionBoxIndex:
+
+    def __init__(self, boxes=None, signature=None, bucket_size=0.0025, pairs=None, crosswalks=None):
+
+        self.bucket_size = bucket_size # width and height of a bucket in degrees, roughly 900 ft in latitude
+        self.signature = signature # (count, largest id) of the crosswalks the boxes were built from, if known
+        self.crosswalks = crosswalks # (start_lat, start_lon, end_lat, end_lon) arrays of the crosswalks, if kept
+
+        self.boxes = [] # intersection boxes as lists of 4 (lat, lon) vertices
+        self.buckets = {} # (row, col) of the bucket -> indices of the boxes overlapping the bucket
+        self.pairs = {} # (nearest, 4th nearest) crosswalks -> index of the box drawn from them
+
+        for index, box in enumerate(boxes if boxes is not None else []):
+            self.add_box(box, pairs[index] if pairs is not None else None)
+
+
+    def find_bucket(self, lat, lon):
+
+        # find the row and column of the bucket that contains the lat/lon
+        row = math.floor(lat / self.bucket_size)
+        col = math.floor(lon / self.bucket_size)
+
+        return row, col
+
+
+    def add_box(self, box, pair=None):
+
+        # store the box and register it in every bucket overlapped by its bounding box, and under its crosswalk pair
+        index = len(self.boxes)
+        box = [(float(lat), float(lon)) for lat, lon in box]
+
+        min_row, min_col = self.find_bucket(min(lat for lat, _ in box), min(lon for _, lon in box))
+        max_row, max_col = self.find_bucket(max(lat for lat, _ in box), max(lon for _, lon in box))
+
+        self.boxes.append(box)
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                self.buckets.setdefault((row, col), []).append(index)
+
+        if pair is not None:
+            self.pairs[pair] = index
+
+        return index
+
+
+    def contains(self, lat, lon):
+
+        # determine if the lat/lon is inside any intersection box of its bucket
+        for index in self.buckets.get(self.find_bucket(lat, lon), ()):
+
+            if point_in_polygon(lat, lon, self.boxes[index]):
+                return True
+
+        return False
+
+
+    def contains_pair(self, lat, lon, close, far):
+
+        # determine if the lat/lon is inside the box drawn from its own nearest and 4th nearest crosswalks, as the box
+        # used to be drawn around each waze alert; a pair that no crosswalk has drawn is drawn from the crosswalks kept
+        index = self.pairs.get((close, far))
+
+        if index is None:
+
+            if self.crosswalks is None:
+                return False
+
+            index = self.add_box(self.draw_crosswalk_box(*self.crosswalks, close, far), (close, far))
+
+        return point_in_polygon(lat, lon, self.boxes[index])
+
+
+    @staticmethod
+    def draw_crosswalk_box(start_lat, start_lon, end_lat, end_lon, close, far):
+
+        # the rough square formed by the end points of the nearest and the 4th nearest crosswalks
+        return [(start_lat[close], start_lon[close]), (end_lat[close], end_lon[close]),
+                (start_lat[far], start_lon[far]), (end_lat[far], end_lon[far])]
+
+
+    @staticmethod
+    def find_nearest_crosswalks(start_lat, start_lon, end_lat, end_lon, search_distance=300.0, max_distance=math.inf,
+                                count=4):
+
+        # find the crosswalks nearest to the middle point of each crosswalk and their distances (ft), ordered by distance;
+        # the candidates come from a grid index over the crosswalks, searched within a radius doubled until it holds
+        # the count nearest crosswalks, all the crosswalks or max_distance, so the order is the one of the whole cell
+        crosswalk_index = SegmentGridIndex([], "crosswalk")
+
+        for index in range(len(start_lat)):
+            crosswalk_index.add_segment(index, (start_lat[index], start_lon[index]), (end_lat[index], end_lon[index]))
+
+        crosswalk_index.build_arrays()
+
+        for index in range(len(start_lat)):
+
+            middle_lat = (start_lat[index] + end_lat[index]) / 2.0
+            middle_lon = (start_lon[index] + end_lon[index]) / 2.0
+            radius = search_distance
+
+            while True:
+
+                candidates = crosswalk_index.query(middle_lat, middle_lon, radius)
+                distances, order = point_segment_distances(middle_lat, middle_lon, start_lat[candidates],
+                                                           start_lon[candidates], end_lat[candidates], end_lon[candidates])
+
+                if (len(order) >= count and distances[order[count - 1]] <= radius) or radius >= max_distance \
+                        or len(candidates) == len(start_lat):
+                    break
+
+                radius = min(2.0 * radius, max_distance)
+
+            yield distances[order], candidates[order]
+
+
+    @classmethod
+    def build_crosswalk_boxes(cls, start_lat, start_lon, end_lat, end_lon, box_distance=300.0, signature=None):
+
+        # draw the rough intersection squares used for the waze alerts from the crosswalk end points, keeping the
+        # crosswalks to draw the boxes of the pairs found around the alerts only
+        boxes = []
+        pairs = [] # (nearest, 4th nearest) crosswalks of the boxes
+        drawn = set()
+
+        for distances, nearest in cls.find_nearest_crosswalks(start_lat, start_lon, end_lat, end_lon,
+                                                              box_distance, box_distance):
+
+            if len(nearest) < 4 or distances[3] > box_distance:
+                continue # not enough crosswalks around to form an intersection
+
+            close, far = int(nearest[0]), int(nearest[3])
+
+            if (close, far) in drawn:
+                continue
+
+            drawn.add((close, far))
+            pairs.append((close, far))
+            boxes.append(cls.draw_crosswalk_box(start_lat, start_lon, end_lat, end_lon, close, far))
+
+        print("INTERSECTION BOXES DRAWN FROM {} CROSSWALKS: {}".format(len(start_lat), len(boxes)))
+
+        return cls(boxes, signature, pairs=pairs, crosswalks=(start_lat, start_lon, end_lat, end_lon))
+
+
+    @classmethod
+    def build_traffic_signal_boxes(cls, start_lat, start_lon, end_lat, end_lon, buffer_length=20.0, signature=None):
+
+        # draw the buffered intersection squares used for the deviated points from the traffic signal crosswalks
+        boxes = []
+        drawn = set() # (nearest, 4th nearest) crosswalks of the boxes already drawn
+
+        for _, nearest in cls.find_nearest_crosswalks(start_lat, start_lon, end_lat, end_lon):
+
+            if len(nearest) < 4:
+                continue # not enough crosswalks around to form an intersection
+
+            close, far = int(nearest[0]), int(nearest[3])
+
+            if (close, far) in drawn:
+                continue
+
+            drawn.add((close, far))
+
+            # center the square on the 4 end points, half of its side is half of the nearest crosswalk plus the buffer
+            center_lat = (start_lat[close] + end_lat[close] + start_lat[far] + end_lat[far]) / 4.0
+            center_lon = (start_lon[close] + end_lon[close] + start_lon[far] + end_lon[far]) / 4.0
+            x, y = project_local(start_lat[close], start_lon[close], end_lat[close], end_lon[close])
+            half_side = METER_TO_FEET * math.hypot(x, y) / 2.0 + buffer_length
+
+            # convert half of the side from ft to degrees of latitude and longitude at the center
+            lat_scale, lon_scale = find_local_scales(center_lat)
+            half_side_m = half_side / METER_TO_FEET
+            lat_delta = math.degrees(half_side_m / lat_scale)
+            lon_delta = math.degrees(half_side_m / lon_scale)
+
+            boxes.append([(center_lat - lat_delta, center_lon - lon_delta), (center_lat + lat_delta, center_lon - lon_delta),
+                          (center_lat + lat_delta, center_lon + lon_delta), (center_lat - lat_delta, center_lon + lon_delta)])
+
+        print("TRAFFIC SIGNAL INTERSECTION BOXES DRAWN FROM {} CROSSWALKS: {}".format(len(start_lat), len(boxes)))
+
+        return cls(boxes, signature)
+
+
+    def to_bytes(self):
+
+        # write the box vertices and the signature to a compressed NumPy file in memory
+        boxes = np.array(self.boxes, dtype=float).reshape(-1, 4, 2)
+        signature = np.array(json.dumps(self.signature))
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, boxes=boxes, signature=signature)
+
+        return buffer.getvalue()
+
+
+    @classmethod
+    def from_bytes(cls, content):
+
+        # read the box vertices and the signature from a compressed NumPy file
+        arrays = np.load(io.BytesIO(content))
+        signature = json.loads(str(arrays["signature"]))
+        signature = tuple(signature) if signature is not None else None
+
+        return cls(arrays["boxes"].tolist(), signature)
+
+
+    def save_s3(self, s3_client, bucket, key):
+
+        # upload the index to the S3 bucket
+        s3_client.put_object(Body=self.to_bytes(), Bucket=bucket, Key=key)
+        print("INTERSECTION BOXES SAVED TO S3 BUCKET:", key)
+
+        return
+
+
+    @classmethod
+    def load_s3(cls, s3_client, bucket, key):
+
+        # download the index from the S3 bucket, None if it has not been saved yet
+        try:
+
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+
+        except ClientError as error:
+
+            if error.response["Error"]["Code"] != "NoSuchKey":
+                raise
+
+            print("NO INTERSECTION BOXES FOUND IN S3 BUCKET:", key)
+            return None
+
+        return cls.from_bytes(response["Body"].read())
@@ -22,15 +22,43 @@ The AWS CodePipeline framework is implemented with the current repository, pleas
 
 import boto3
 import json
-import requests
 from datetime import datetime
 
-from graph_database_driver import GraphDatabaseDriver
+from footway_geometry_cache import FootwayGeometryCache
 from query_writer_waze import WazeAlertsQueries
+from waze_feed_fetcher import WazeFeedFetcher
+from waze_snapshot_cache import WazeSnapshotCache
 
 
 code_pipeline = boto3.client("codepipeline")
 
+# define the Waze endpoints where data could be retrieved; total 14 URLs
+WAZE_URLS = {
+    "34.0N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/f81ba212-edd3-4642-a8a3-17827f9b88d4?format=1",
+    "33.8N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/00681a08-252c-46be-b256-94cbc716c3fa?format=1",
+    "33.9N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/978ab657-9526-442c-bdae-78e6ee4910b0?format=1",
+    "33.8N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9a6ecef1-746f-4586-a0c8-d9d450390163?format=1",
+    "34.0N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/35ac99d3-7c4a-4c36-910b-608858735923?format=1",
+    "33.9N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/23a8c3f8-6ac7-4729-8c6d-7315b3ac0140?format=1",
+    "33.8N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/6a708742-3e7c-4965-a2d4-98b62a94e5d9?format=1",
+    "34.0N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c3675753-18d3-4523-be4c-3185349493f0?format=1",
+    "33.9N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/29219ce8-5074-4ceb-8db4-71144509dc25?format=1",
+    "34.0N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/a770cf40-9b08-41bb-ae6a-5fe9427abad2?format=1",
+    "34.0N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/002176a3-9b2b-4ffa-a45f-266363bb0a9f?format=1",
+    "33.9N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/eb0f5ce7-a394-4cbf-9d50-28b757313fbb?format=1",
+    "33.9N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c0681289-9f5d-48c3-b4fb-3ab4de15beea?format=1",
+    "33.8N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9d31c342-3b32-417c-8498-e6b93fa15777?format=1",
+}
+
+# keep the fetcher between the invocations of a warm container to reuse its connections and feed state
+feed_fetcher = WazeFeedFetcher(WAZE_URLS)
+
+# keep the previous Waze snapshot of each grid cell between the invocations of a warm container
+snapshot_cache = WazeSnapshotCache(boto3.client("s3"))
+
+# keep the sidewalk and crosswalk segments of the recently used grid cells between the invocations of a warm container
+footway_cache = FootwayGeometryCache()
+
 
 def put_job_success(job, message):
     """Notify CodePipeline of a successful job
@@ -108,30 +136,29 @@ def lambda_handler(event, context):
 
         if method == "POST":
 
-            # defined the Waze endpoints where data could be retrieved; total 14 URLs
-            urls = {
-                "34.0N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/f81ba212-edd3-4642-a8a3-17827f9b88d4?format=1",
-                "33.8N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/00681a08-252c-46be-b256-94cbc716c3fa?format=1",
-                "33.9N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/978ab657-9526-442c-bdae-78e6ee4910b0?format=1",
-                "33.8N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9a6ecef1-746f-4586-a0c8-d9d450390163?format=1",
-                "34.0N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/35ac99d3-7c4a-4c36-910b-608858735923?format=1",
-                "33.9N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/23a8c3f8-6ac7-4729-8c6d-7315b3ac0140?format=1",
-                "33.8N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/6a708742-3e7c-4965-a2d4-98b62a94e5d9?format=1",
-                "34.0N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c3675753-18d3-4523-be4c-3185349493f0?format=1",
-                "33.9N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/29219ce8-5074-4ceb-8db4-71144509dc25?format=1",
-                "34.0N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/a770cf40-9b08-41bb-ae6a-5fe9427abad2?format=1",
-                "34.0N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/002176a3-9b2b-4ffa-a45f-266363bb0a9f?format=1",
-                "33.9N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/eb0f5ce7-a394-4cbf-9d50-28b757313fbb?format=1",
-                "33.9N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c0681289-9f5d-48c3-b4fb-3ab4de15beea?format=1",
-                "33.8N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9d31c342-3b32-417c-8498-e6b93fa15777?format=1",
-            }
+            # get Waze alerts data from the Waze URL of the grid of interest based on the data_set_id in json
+            feed = feed_fetcher.fetch_all([data_set_id])[data_set_id]
 
-            # extract the url for the grid of interest based on the data_set_id
-            url = urls[data_set_id]
-            
-            # get Waze alerts data from the Waze URLs in json
-            waze_response = requests.get(url)
-            data = waze_response.json()
+            if feed["status"] == "error":
+                raise Exception("Waze feed request failed: " + feed["error"])
+
+            if feed["status"] != "changed":
+                print("THE WAZE FEED HAS NOT CHANGED SINCE THE PREVIOUS RUN FOR STUDY AREA:", data_set_id)
+                status = {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 
+                        'Access-Control-Allow-Headers': 'Content-Type', 
+                        'Access-Control-Allow-Origin':'*', 
+                        'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
+                    'body': json.dumps("FINISHED: THE WAZE FEED HAS NOT CHANGED SINCE THE PREVIOUS RUN.")
+                }
+                
+                if "CodePipeline.job" in event.keys():
+                    put_job_success(job_id, "Job is successful!")
+                
+                return status
+
+            data = feed["data"]
             
             if "alerts" not in data.keys():
                 print("WARNING: NO WAZE ALERTS DATA FOUND FROM THE WAZE ENDPOINT FOR STUDY AREA:", data_set_id)
@@ -168,25 +195,36 @@ def lambda_handler(event, context):
             print(response)
             print("Done uploading Waze alerts data to S3 bucket:", filename)
 
-            # retrieve all sidewalk and crosswalk nodes from OSM first for attachments, their start and end nodes are also retrieved
-            sidewalk_query1 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(sidewalk:`OSM-WAY` {{footway: 'sidewalk', __datasetid: '{}'}})-"
-            sidewalk_query2 = "[:LAST]-(node2:`OSM-NODE`) RETURN sidewalk, node1, node2"
-            sidewalk_query = sidewalk_query1 + sidewalk_query2
-            sidewalk_query = sidewalk_query.format(data_set_id)
-    
-            crosswalk_query1 = "MATCH (node1:`OSM-NODE`)-[:FIRST]-(crosswalk:`OSM-WAY` {{footway: 'crossing', __datasetid: '{}'}})-"
-            crosswalk_query2 = "[:LAST]-(node2:`OSM-NODE`) RETURN crosswalk, node1, node2"
-            crosswalk_query = crosswalk_query1 + crosswalk_query2
-            crosswalk_query = crosswalk_query.format(data_set_id)
-            
-            driverObj = GraphDatabaseDriver(QUERY_URL)
-            sidewalk_records = driverObj.run_query("CHECK", sidewalk_query)
-            crosswalk_records = driverObj.run_query("CHECK", crosswalk_query)
-    
+            # compare the alerts with the previous snapshot of the feed, only the new alerts are attached
+            snapshot = snapshot_cache.build_snapshot(data)
+            previous_snapshot = snapshot_cache.load(WAZE_BUCKET, data_set_id, data["endTimeMillis"])
+            new_uuids, updated_uuids, unchanged_uuids, vanished_uuids = snapshot_cache.find_delta(previous_snapshot, snapshot)
+            known_uuids = set(updated_uuids + unchanged_uuids)
+
+            print("WAZE ALERTS: {} NEW, {} UPDATED, {} UNCHANGED, {} VANISHED".format(
+                len(new_uuids), len(updated_uuids), len(unchanged_uuids), len(vanished_uuids)))
+
+            if new_uuids:
+
+                # find the sidewalk and crosswalk segments of the grid cell for attachments, from the cache if still valid
+                sidewalk_index, crosswalk_index = footway_cache.find_indexes(QUERY_URL, data_set_id)
+                intersection_index = footway_cache.find_intersection_index(data_set_id)
+
+            else:
+
+                # no alert needs the sidewalk/crosswalk attachments, skip the queries
+                sidewalk_index, crosswalk_index, intersection_index = None, None, None
+
             # ingest or update waze alert nodes and links
             print("Parsing Waze alert nodes and links to AWS Neptune database")
-            wazeObj = WazeAlertsQueries(QUERY_URL, method, data, sidewalk_records, crosswalk_records)
+            wazeObj = WazeAlertsQueries(QUERY_URL, method, data, [], [], batch_write=True, known_uuids=known_uuids,
+                                        sidewalk_index=sidewalk_index, crosswalk_index=crosswalk_index,
+                                        intersection_index=intersection_index)
             wazeObj.create_transaction()
+
+            # save the snapshot once the alerts are ingested
+            snapshot_cache.save(WAZE_BUCKET, data_set_id, snapshot)
+            feed_fetcher.commit(data_set_id, feed) # skip the feed from now on until it changes
             print("Done parsing Waze alert nodes and links to AWS Neptune database")
             print("Whole process is completed for the request:", method)
         
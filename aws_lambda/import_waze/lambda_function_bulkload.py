@@ -27,7 +27,31 @@ import pandas as pd
 from datetime import datetime
 
 from presigned_url_s3_put import generate_presigned_url
-from query_writer_waze_bulkload import WazeAlertsQueriesBulkLoad
+from query_writer_waze_bulkload import WazeAlertsQueriesBulkLoad, WazeBulkLoadStaging
+from waze_feed_fetcher import WazeFeedFetcher
+from neptune_loader import NeptuneLoaderClient
+
+
+# define the Waze endpoints where data could be retrieved; total 14 URLs
+WAZE_URLS = {
+    "34.0N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/f81ba212-edd3-4642-a8a3-17827f9b88d4?format=1",
+    "33.8N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/00681a08-252c-46be-b256-94cbc716c3fa?format=1",
+    "33.9N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/978ab657-9526-442c-bdae-78e6ee4910b0?format=1",
+    "33.8N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9a6ecef1-746f-4586-a0c8-d9d450390163?format=1",
+    "34.0N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/35ac99d3-7c4a-4c36-910b-608858735923?format=1",
+    "33.9N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/23a8c3f8-6ac7-4729-8c6d-7315b3ac0140?format=1",
+    "33.8N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/6a708742-3e7c-4965-a2d4-98b62a94e5d9?format=1",
+    "34.0N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c3675753-18d3-4523-be4c-3185349493f0?format=1",
+    "33.9N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/29219ce8-5074-4ceb-8db4-71144509dc25?format=1",
+    "34.0N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/a770cf40-9b08-41bb-ae6a-5fe9427abad2?format=1",
+    "34.0N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/002176a3-9b2b-4ffa-a45f-266363bb0a9f?format=1",
+    "33.9N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/eb0f5ce7-a394-4cbf-9d50-28b757313fbb?format=1",
+    "33.9N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c0681289-9f5d-48c3-b4fb-3ab4de15beea?format=1",
+    "33.8N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9d31c342-3b32-417c-8498-e6b93fa15777?format=1",
+}
+
+# keep the fetcher between the invocations of a warm container to reuse its connections and feed state
+feed_fetcher = WazeFeedFetcher(WAZE_URLS)
 
 
 def lambda_handler(event, context):
@@ -55,24 +79,6 @@ def lambda_handler(event, context):
 
         print("DATA SET ID:", data_set_id)
 
-        # defined the Waze endpoints where data could be retrieved; total 14 URLs
-        urls = { 
-            "34.0N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/f81ba212-edd3-4642-a8a3-17827f9b88d4?format=1",
-            "33.8N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/00681a08-252c-46be-b256-94cbc716c3fa?format=1",
-            "33.9N84.4W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/978ab657-9526-442c-bdae-78e6ee4910b0?format=1",
-            "33.8N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9a6ecef1-746f-4586-a0c8-d9d450390163?format=1",
-            "34.0N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/35ac99d3-7c4a-4c36-910b-608858735923?format=1",
-            "33.9N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/23a8c3f8-6ac7-4729-8c6d-7315b3ac0140?format=1",
-            "33.8N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/6a708742-3e7c-4965-a2d4-98b62a94e5d9?format=1",
-            "34.0N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c3675753-18d3-4523-be4c-3185349493f0?format=1",
-            "33.9N84.1W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/29219ce8-5074-4ceb-8db4-71144509dc25?format=1",
-            "34.0N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/a770cf40-9b08-41bb-ae6a-5fe9427abad2?format=1",
-            "34.0N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/002176a3-9b2b-4ffa-a45f-266363bb0a9f?format=1",
-            "33.9N84.2W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/eb0f5ce7-a394-4cbf-9d50-28b757313fbb?format=1",
-            "33.9N84.0W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/c0681289-9f5d-48c3-b4fb-3ab4de15beea?format=1",
-            "33.8N84.3W": "https://www.waze.com/partnerhub-api/partners/11172875649/waze-feeds/9d31c342-3b32-417c-8498-e6b93fa15777?format=1",
-        }
-
         # find current datetime to be used as part of the filename that will save the waze data
         now = datetime.now()
         datetime_str = now.strftime("%Y-%m-%d-%H%M%S")
@@ -86,28 +92,34 @@ def lambda_handler(event, context):
         if not os.path.isdir(filedir):
             os.mkdir(filedir)
 
-        # initialize variables to store waze nodes and relationships for bulk load
-        waze_nodes_bulkload = []
-        waze_relationships_bulkload = []
+        # initialize the staging area to store waze nodes and relationships for bulk load
+        waze_bulkload = WazeBulkLoadStaging()
+
+        # the GT/CE-SIDEWALK node index is built by the first study area and reused by the others
+        sidewalk_index = None
 
         s3_client_bulkload = boto3.client("s3")
-        config_bulkload = {
-            "source" : BULKLOAD_SOURCE+"/waze/api",
-            "format" : "csv",
-            "iamRoleArn" : "arn:aws:iam::760336115441:role/neptune-s3-read-access",
-            "region" : "us-east-2",
-            "failOnError" : "FALSE",
-            "parallelism" : "MEDIUM",
-            "updateSingleCardinalityProperties" : "TRUE",
-            "queueRequest" : "TRUE",
-            "dependencies" : []
-        }
-
-        # get Waze alerts data from the Waze URLs in json
-        for name, url in urls.items():
-
-            waze_response = requests.get(url)
-            data = waze_response.json()
+        loader = NeptuneLoaderClient(LOADER_URL)
+
+        # get Waze alerts data from all the Waze URLs concurrently in json
+        feeds = feed_fetcher.fetch_all()
+        ingested_feeds = {} # feeds committed to the fetcher once their rows are submitted to the bulk loader
+        feed_errors = {} # error messages of the feeds whose request failed, reported once the others are loaded
+
+        for name, feed in feeds.items():
+
+            if feed["status"] == "error":
+
+                print("ERROR: THE WAZE FEED REQUEST FAILED FOR STUDY AREA {}: {}".format(name, feed["error"]))
+                feed_errors[name] = feed["error"]
+                continue
+
+            if feed["status"] != "changed":
+
+                print("WARNING: THE WAZE FEED IS NOT INGESTED FOR STUDY AREA {}: {}".format(name, feed["status"].upper()))
+                continue
+
+            data = feed["data"]
 
             if "alerts" not in data.keys():
 
@@ -151,18 +163,17 @@ def lambda_handler(event, context):
 
             # ingest or update waze alert nodes and links using bulk load
             print("Parsing Waze alert nodes and links to AWS Neptune database using bulk load for study area:", name)
-            wazeObj = WazeAlertsQueriesBulkLoad(QUERY_URL, method, data, waze_nodes_bulkload, waze_relationships_bulkload)
-            waze_nodes, waze_relations = wazeObj.create_transaction()
-
-            waze_nodes_bulkload = waze_nodes
-            waze_relationships_bulkload = waze_relations
+            wazeObj = WazeAlertsQueriesBulkLoad(QUERY_URL, method, data, waze_bulkload, sidewalk_index)
+            waze_bulkload = wazeObj.create_transaction()
+            sidewalk_index = wazeObj.sidewalk_index
+            ingested_feeds[name] = feed
 
             print("Done parsing Waze alert nodes and links to AWS Neptune database for study area:", name)
 
         # create csv files for waze node and relationship ingestions
         print("Creating CSV files for waze nodes and relationships for bulk load ingestion")
-        waze_node_df = pd.DataFrame.from_dict(waze_nodes_bulkload)
-        waze_relationship_df = pd.DataFrame.from_dict(waze_relationships_bulkload)
+        waze_node_df = pd.DataFrame.from_dict(waze_bulkload.node_rows())
+        waze_relationship_df = pd.DataFrame.from_dict(waze_bulkload.relationship_rows())
 
         waze_node_df.to_csv("/tmp/waze-node.csv", encoding="utf-8", index=False)
         waze_relationship_df.to_csv("/tmp/waze-relationship.csv", encoding="utf-8", index=False)
@@ -171,10 +182,27 @@ def lambda_handler(event, context):
         s3_client_bulkload.upload_file("/tmp/waze-node.csv", LOAD_BUCKET, "waze/api/node.csv")
         s3_client_bulkload.upload_file("/tmp/waze-relationship.csv", LOAD_BUCKET, "waze/api/relationship.csv")
 
-        response_bulkload = requests.post(LOADER_URL, json = config_bulkload)
-        print("Bulk load response:", response_bulkload.json())
+        # load the waze nodes first, then the relationships once the nodes are loaded
+        loader.submit_vertices_edges([BULKLOAD_SOURCE+"/waze/api/node.csv"], [BULKLOAD_SOURCE+"/waze/api/relationship.csv"])
+
+        # skip the ingested feeds from now on until they change
+        for name, feed in ingested_feeds.items():
+            feed_fetcher.commit(name, feed)
         print("Whole process is completed for the request:", method)
 
+        if feed_errors:
+
+            # the feeds of the other study areas are loaded, but the request did not complete for these ones
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 
+                            'Access-Control-Allow-Headers': 'Content-Type', 
+                            'Access-Control-Allow-Origin':'*', 
+                            'Access-Control-Allow-Methods': 'OPTIONS,POST,DELETE'},
+                'body': json.dumps({"message": "ERROR: Waze feed requests failed for {} study areas.".format(len(feed_errors)),
+                                    "errors": feed_errors})
+            }
+
     if method == "DELETE":
     
         # extract data_set_id input parameter
@@ -185,9 +213,8 @@ def lambda_handler(event, context):
 
         # delete the Waze alert nodes and links on the Neptune database based on the last updated time
         print("Removing Waze alert nodes and links on AWS Neptune database by the last updated time")
-        wazeObj = WazeAlertsQueriesBulkLoad(QUERY_URL, method, data = None, waze_nodes_bulkload = [], 
-                                            waze_relationships_bulkload = [])
-        _, _ = wazeObj.create_transaction()
+        wazeObj = WazeAlertsQueriesBulkLoad(QUERY_URL, method, data = None, waze_bulkload = WazeBulkLoadStaging())
+        _ = wazeObj.create_transaction()
         print("Done removing Waze alert nodes and links on AWS Neptune database")
 
 
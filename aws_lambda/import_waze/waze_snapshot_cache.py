@@ -0,0 +1,124 @@
+"""
+The script consists of a cache of the previous Waze alerts snapshot of each grid cell (data_set_id),
+used to compare consecutive snapshots of the same feed before they are ingested to the AWS Neptune database.
+
+The snapshots are kept in memory, so a cache created at module level in a lambda function keeps them between
+the invocations of a warm container, and they are also saved to the S3 bucket to be read by cold containers:
+    s3://<bucket>/waze-snapshots/<data_set_id>.json
+
+Only the endTimeMillis of the feed, and the uuid and the fields used to detect updated alerts are kept for each alert.
+A previous snapshot older than max_age is not used, since the waze nodes it refers to may have been deleted
+since then. The alerts of the current snapshot are classified as:
+    new: the uuid is not in the previous snapshot, the alert needs the sidewalk/crosswalk attachments
+    updated: the uuid is in the previous snapshot with a different reliability, confidence, reportRating or nThumbsUp
+    unchanged: the uuid is in the previous snapshot with the same fields
+    vanished: the uuid of the previous snapshot is not in the current one
+
+Updated and unchanged alerts are already attached, only the endtime fields of their waze nodes are refreshed.
+
+"""
+
+import json
+from botocore.exceptions import ClientError
+
+
+class WazeSnapshotCache:
+
+    def __init__(self, s3_client, prefix="waze-snapshots/"):
+
+        self.s3_client = s3_client
+        self.prefix = prefix # S3 key prefix of the snapshots
+        self.snapshots = {} # data_set_id -> previous snapshot
+        self.max_age = 300000 # 5 minutes in ms, well below the 15 minutes holding time of the waze nodes
+
+        # alert fields compared between consecutive snapshots
+        self.compared_fields = ["reliability", "confidence", "reportRating", "nThumbsUp"]
+
+
+    def build_snapshot(self, data):
+
+        # keep the endTimeMillis of the feed, and the uuid and the compared fields of each alert
+        alerts = {}
+
+        for alert in data["alerts"]:
+
+            if "uuid" not in alert.keys():
+                continue # the alert cannot be compared without a uuid
+
+            alerts[alert["uuid"]] = {field: alert.get(field) for field in self.compared_fields}
+
+        return {"endTimeMillis": data["endTimeMillis"], "alerts": alerts}
+
+
+    def load(self, bucket, data_set_id, endtime_ms):
+
+        # find the previous snapshot in memory first, then in the S3 bucket; 
+        # None if there is no snapshot or if it is older than max_age w.r.t. the endtime of the current feed
+        if data_set_id not in self.snapshots:
+            self.load_s3(bucket, data_set_id)
+
+        previous_snapshot = self.snapshots.get(data_set_id)
+
+        if previous_snapshot is None:
+            return None
+
+        if endtime_ms - previous_snapshot["endTimeMillis"] > self.max_age:
+
+            print("THE PREVIOUS WAZE SNAPSHOT IS TOO OLD AND IS NOT USED FOR STUDY AREA:", data_set_id)
+            return None
+
+        return previous_snapshot
+
+
+    def load_s3(self, bucket, data_set_id):
+
+        # read the snapshot saved by the previous run from the S3 bucket
+        try:
+
+            response = self.s3_client.get_object(Bucket=bucket, Key=self.prefix + data_set_id + ".json")
+            self.snapshots[data_set_id] = json.loads(response["Body"].read())
+
+        except ClientError as error:
+
+            if error.response["Error"]["Code"] != "NoSuchKey":
+                raise
+
+            print("NO PREVIOUS WAZE SNAPSHOT FOUND FOR STUDY AREA:", data_set_id)
+
+        return
+
+
+    def save(self, bucket, data_set_id, snapshot):
+
+        # keep the snapshot in memory and in the S3 bucket for the next run
+        self.snapshots[data_set_id] = snapshot
+        self.s3_client.put_object(Body=json.dumps(snapshot), Bucket=bucket, Key=self.prefix + data_set_id + ".json")
+
+        return
+
+
+    def find_delta(self, previous_snapshot, snapshot):
+
+        # classify the uuids of the current snapshot w.r.t. the previous snapshot
+        alerts = snapshot["alerts"]
+
+        if previous_snapshot is None:
+            return list(alerts.keys()), [], [], []
+
+        previous_alerts = previous_snapshot["alerts"]
+        new_uuids = []
+        updated_uuids = []
+        unchanged_uuids = []
+
+        for uuid, fields in alerts.items():
+
+            if uuid not in previous_alerts:
+                new_uuids.append(uuid)
+            elif previous_alerts[uuid] != fields:
+                updated_uuids.append(uuid)
+            else:
+                unchanged_uuids.append(uuid)
+
+        vanished_uuids = [uuid for uuid in previous_alerts.keys() if uuid not in alerts]
+
+        return new_uuids, updated_uuids, unchanged_uuids, vanished_uuids
@@ -0,0 +1,114 @@
+"""
+The script consists of a cache of the sidewalk and crosswalk OSM-WAY segments of the grid cells (__datasetid),
+kept as spatial indexes between the invocations of a warm lambda container.
+
+The segments of a grid cell are retrieved from the AWS Neptune database with the start and end coordinates written
+on the OSM-WAY nodes by the OSM bulk loader, or else with their FIRST and LAST OSM-NODE nodes for the ways loaded
+before these properties, and indexed with SegmentGridIndex once. The following invocations for the same grid cell only run a count query
+on the sidewalk/crosswalk OSM-WAY nodes of the cell to make sure the cached segments are still valid, and the
+segments are retrieved again if the count or the largest way id has changed since then. The intersection boxes
+drawn from the crosswalk segments are also kept with the segments once they are needed.
+
+The grid cells that have not been used for the longest time are evicted once more than max_entries are cached.
+
+"""
+
+from collections import OrderedDict
+
+from graph_database_driver import GraphDatabaseDriver
+from spatial_index import SegmentGridIndex
+from intersection_index import IntersectionBoxIndex
+
+
+class FootwayGeometryCache:
+
+    def __init__(self, max_entries=4):
+
+        self.max_entries = max_entries # number of grid cells kept in memory
+        self.entries = OrderedDict() # __datasetid -> cached segments, from the least to the most recently used
+
+
+    def find_signature(self, driverObj, datasetid):
+
+        # count the sidewalk/crosswalk OSM-WAY nodes of the grid cell and find their largest id
+        query1 = "MATCH (way:`OSM-WAY`) WHERE way.__datasetid = '{}' AND way.footway IN ['sidewalk', 'crossing'] ".\
+            format(datasetid)
+        query2 = "RETURN count(way) AS count, max(way.id) AS max_id"
+        query = query1 + query2
+
+        record = driverObj.run_query("CHECK", query)
+
+        return record[0]["count"], record[0]["max_id"]
+
+
+    def segment_query(self, way_key, footway, datasetid):
+
+        # retrieve the OSM-WAY nodes of the footway with their start and end coordinates: a single node per way with
+        # the __start_lat/__start_lon/__end_lat/__end_lon properties, else their FIRST and LAST OSM-NODE nodes
+        query1 = "MATCH ({0}:`OSM-WAY` {{footway: '{1}', __datasetid: '{2}'}}) WHERE {0}.__start_lat IS NOT NULL "
+        query2 = "RETURN {0}, {{lat: {0}.__start_lat, lon: {0}.__start_lon}} AS node1, {{lat: {0}.__end_lat, lon: {0}.__end_lon}} AS node2 "
+        query3 = "UNION ALL MATCH (node1:`OSM-NODE`)-[:FIRST]-({0}:`OSM-WAY` {{footway: '{1}', __datasetid: '{2}'}})-"
+        query4 = "[:LAST]-(node2:`OSM-NODE`) WHERE {0}.__start_lat IS NULL "
+        query5 = "RETURN {0}, {{lat: node1.lat, lon: node1.lon}} AS node1, {{lat: node2.lat, lon: node2.lon}} AS node2"
+        query = query1 + query2 + query3 + query4 + query5
+
+        return query.format(way_key, footway, datasetid)
+
+
+    def retrieve_indexes(self, driverObj, datasetid):
+
+        # retrieve all sidewalk and crosswalk nodes from OSM first for attachments, with the coordinates of their ends
+        sidewalk_query = self.segment_query("sidewalk", "sidewalk", datasetid)
+        crosswalk_query = self.segment_query("crosswalk", "crossing", datasetid)
+
+        sidewalk_records = driverObj.run_query("CHECK", sidewalk_query)
+        crosswalk_records = driverObj.run_query("CHECK", crosswalk_query)
+
+        # index the segments, the records are converted once here
+        sidewalk_index = SegmentGridIndex(sidewalk_records, "sidewalk")
+        crosswalk_index = SegmentGridIndex(crosswalk_records, "crosswalk")
+
+        return sidewalk_index, crosswalk_index
+
+
+    def find_indexes(self, query_url, datasetid):
+
+        # find the sidewalk and crosswalk spatial indexes of the grid cell, from the cache if they are still valid
+        driverObj = GraphDatabaseDriver(query_url)
+        signature = self.find_signature(driverObj, datasetid)
+
+        if datasetid in self.entries and self.entries[datasetid]["signature"] == signature:
+
+            print("USING CACHED SIDEWALK/CROSSWALK SEGMENTS FOR GRID CELL:", datasetid)
+            self.entries.move_to_end(datasetid)
+
+        else:
+
+            print("RETRIEVING SIDEWALK/CROSSWALK SEGMENTS FOR GRID CELL:", datasetid)
+            sidewalk_index, crosswalk_index = self.retrieve_indexes(driverObj, datasetid)
+            self.entries[datasetid] = {"signature": signature, "sidewalk_index": sidewalk_index,
+                                       "crosswalk_index": crosswalk_index}
+            self.entries.move_to_end(datasetid)
+
+            # evict the grid cells that have not been used for the longest time
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        entry = self.entries[datasetid]
+
+        return entry["sidewalk_index"], entry["crosswalk_index"]
+
+
+    def find_intersection_index(self, datasetid, box_distance=300.0):
+
+        # find the intersection boxes of a grid cell whose segments are cached, drawn once from its crosswalk segments
+        entry = self.entries[datasetid]
+
+        if "intersection_index" not in entry:
+
+            crosswalk_index = entry["crosswalk_index"]
+            entry["intersection_index"] = IntersectionBoxIndex.build_crosswalk_boxes(
+                crosswalk_index.start_lat, crosswalk_index.start_lon, crosswalk_index.end_lat, crosswalk_index.end_lon,
+                box_distance, entry["signature"])
+
+        return entry["intersection_index"]
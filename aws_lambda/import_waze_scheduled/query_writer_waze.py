@@ -6,43 +6,62 @@ Waze alerts data and ingest them to an AWS Neptune database with AWS EventBridge
 UPDATED ON 01/04/24: Waze alerts are attaching to OSM-WAY nodes instead of sidewalksim links nodes.
 The OSM-WAY nodes that are attached contain either sidewalk or crossing keyword in the attributes.
 
+With batch_write set, the waze nodes, relationships, endtime updates and replacements are decided in memory
+for the whole feed and sent as a few parameterized UNWIND statements at the end of the POST request, 
+instead of one query per alert and per attached sidewalk/crosswalk node. The existing waze nodes of the grid cell
+and their relationships are also read once with a single query before the alerts are parsed, so the decisions
+are made from in-memory dictionaries only.
+
+With known_uuids set to the uuids of the previous snapshot of the feed, the alerts already seen are not
+attached again and only the endtime fields of their waze nodes are refreshed.
+
 For more information on the openCypher queries, visit:
     https://neo4j.com/docs/cypher-manual/5/introduction/
     https://neo4j.com/docs/getting-started/cypher-intro/
 
 """
 
-import os
-import sys
-sys.path.append("/mnt/fs2") # import shapely library from AWS EFS
-
 import time
-from shapely.geometry import Point, LineString
-from shapely.geometry.polygon import Polygon
-from shapely.ops import nearest_points
-from pyproj import Geod
 from neo4j import GraphDatabase, RoutingControl
 
 from set_impedance_factors import set_waze_impedance
+from spatial_index import SegmentGridIndex
+from intersection_index import IntersectionBoxIndex
+from geometry import point_segment_distances
+from batched_delete import BatchedDelete
 
 
 class WazeAlertsQueries:
 
-    def __init__(self, query_url, method, data, sidewalk_records, crosswalk_records):
-
-        print("Python Libraries on AWS EFS:", os.listdir("/mnt/fs2"))
+    def __init__(self, query_url, method, data, sidewalk_records, crosswalk_records, batch_write=False,
+                 known_uuids=None, sidewalk_index=None, crosswalk_index=None, intersection_index=None):
 
         self.method = method # API request method: POST, DELETE
         self.data = data
         self.sidewalk_records = sidewalk_records # OSM-WAY nodes and their start/end OSM-NODE nodes
         self.crosswalk_records = crosswalk_records # OSM-WAY nodes and their start/end OSM-NODE nodes
+        self.sidewalk_index = sidewalk_index # spatial index over the sidewalk segments, built from the records if None
+        self.crosswalk_index = crosswalk_index # spatial index over the crosswalk segments, built from the records if None
+        self.intersection_index = intersection_index # polygon index over the intersection boxes, built from the crosswalks if None
+        self.known_uuids = known_uuids # uuids of the alerts in the previous snapshot of the feed, None to attach all
         self.waze_holdtime = 900000 # holding waze data for 15 minutes or 900000 ms for DELETE request
         self.weather_distance = 1000.0 # distance (ft) boundary for sidewalk/crosswalk node attachments on weather hazard
         self.intersection_box = 300.0 # distance (ft) boundary for creating an intersection
         self.crosswalk_box_outside = 80.0 # distance (ft) boundary for crosswalk node attachments on outside of intersection box
         self.crosswalk_box_outside_sidewalk = 50.0 # distance (ft) boundary for sidealk node attachments on outside of intersection box
         self.crosswalk_box_inside = 20.0 # distance (ft) boundary for crosswalk node attachments on inside of intersection box
-        self.meter_to_feet = 3.28084 # 1 meter is 3.28084 feet
+
+        # store the writes of the feed in memory to be sent as UNWIND statements if batch_write is set
+        self.batch_write = batch_write
+        self.batch_size = 500 # maximum number of rows sent in a single UNWIND statement
+        self.pending_nodes = {} # uuid -> attributes of the waze node to be created
+        self.pending_endtimes = {} # uuid -> endtime fields to be updated on an existing waze node
+        self.pending_relationships = {} # relationship key -> relationship row
+        self.pending_detached_uuids = set() # uuids of the old waze nodes to be detached
+
+        # store the waze nodes and relationships already in the database, read once if batch_write is set
+        self.existing_endtimes = None # uuid -> endTimeMillis of the existing waze node
+        self.existing_relationships = None # relationship key -> uuid of the existing waze node attached
 
         self.waze_node_label = "WAZE-ALERT"
         self.osm_node_label = "OSM-NODE"
@@ -56,9 +75,6 @@ class WazeAlertsQueries:
 
         self.subtype_impedance_keys = self.subtype_impedance.keys()
 
-        # set WGS84 geospatial CRS
-        self.wgs84_geod = Geod(ellps = "WGS84")
-
         # set up the python driver to send data to graph database
         self.URI = query_url
 
@@ -122,6 +138,12 @@ class WazeAlertsQueries:
         attrs["location-y"] = location["y"] # float lat: 33.886974
         attrs["__datasetid"] = datasetid
 
+        if self.batch_write:
+
+            # hold the node to be created with the other nodes of the feed
+            self.pending_nodes[attrs["uuid"]] = attrs
+            return
+
         # ingest the node; NOTE: some fields may be in integer/float type
         self.create_node(self.waze_node_label, attrs)
 
@@ -130,6 +152,17 @@ class WazeAlertsQueries:
 
     def update_waze_endtimes(self, uuid, endtime_ms, endtime_timestamp):
 
+        if self.batch_write:
+
+            # hold the endtime update with the other updates of the feed, nodes not created yet are updated directly
+            if uuid in self.pending_nodes:
+                self.pending_nodes[uuid]["endTimeMillis"] = endtime_ms
+                self.pending_nodes[uuid]["endTime"] = endtime_timestamp
+            else:
+                self.pending_endtimes[uuid] = {"uuid": uuid, "endTimeMillis": endtime_ms, "endTime": endtime_timestamp}
+
+            return
+
         # update endtime property values
         query = "MATCH (waze:`{}`) WHERE waze.uuid = '{}' SET waze.endTimeMillis = {}, waze.endTime = '{}'".\
             format(self.waze_node_label, uuid, endtime_ms, endtime_timestamp)
@@ -181,6 +214,15 @@ class WazeAlertsQueries:
         # determine impedance factor and effect type to include in the relationship
         factor, effect_type = self.find_waze_impedance(osm_node_type, wazetype, subtype)
 
+        if self.batch_write:
+
+            # hold the relationship with the other relationships of the feed
+            relationship = {"way_id": osm_node["id"], "uuid": uuid, "__datasetid": osm_node["__datasetid"],
+                            "__impedance_factor": factor, "__impedance_effect_type": effect_type}
+            key = self.find_relationship_key(osm_node["id"], wazetype, subtype)
+            self.pending_relationships[key] = relationship
+            return
+
         # create relationship between the waze and its closest sidewalk/crosswalk node found
         query1 = "MATCH (osm:`{}`), (waze:`{}`) WHERE osm.id = '{}' AND waze.uuid = '{}' ".\
             format(self.osm_way_label, self.waze_node_label, osm_node["id"], uuid)
@@ -196,6 +238,18 @@ class WazeAlertsQueries:
     
     def detach_waze_node(self, uuid):
 
+        if self.batch_write:
+
+            # hold the detach and drop the pending writes of the waze node, the DETACH DELETE removes them all
+            self.pending_detached_uuids.add(uuid)
+            self.pending_nodes.pop(uuid, None)
+            self.pending_endtimes.pop(uuid, None)
+
+            for key in [key for key, relationship in self.pending_relationships.items() if relationship["uuid"] == uuid]:
+                del self.pending_relationships[key]
+
+            return
+
         # delete waze node and link based on the uuid
         query1 = "MATCH (waze:`{}`) WHERE waze.uuid = '{}' ".format(self.waze_node_label, uuid)
         query2 = "DETACH DELETE waze"
@@ -206,44 +260,172 @@ class WazeAlertsQueries:
         return
     
 
-    def create_update_waze_node_link(self, osm_node, osm_node_type, alert, time_fields):
+    def find_relationship_key(self, osm_id, wazetype, subtype):
 
-        # if the relationship exists where the attached waze has the same subtype, 
-        # update the waze node with the one that has the lastest endtime, detach the old one
-        # if the relationship doesn't exist, create the waze node and create the link
-        uuid = alert["uuid"]
-        wazetype = alert["type"]
-        subtype = alert["subtype"]
-        endtime = time_fields["endTimeMillis"]
+        # waze nodes with a subtype are matched by subtype only, others by the waze type
+        if subtype == "": # NO_SUBTYPE
+            return (osm_id, subtype, wazetype)
+
+        return (osm_id, subtype)
+
+
+    def prefetch_waze_state(self):
+
+        # read the waze nodes of the grid cell, the ones sharing a uuid with the current alerts, and the ones of the
+        # neighboring grid cells attached to the sidewalk/crosswalk nodes of this one, with the ids of the
+        # sidewalk/crosswalk nodes they are attached to
+        ways = self.sidewalk_index.ways + self.crosswalk_index.ways
+        datasetids = list({way["__datasetid"] for way in ways})
+        way_ids = list({way["id"] for way in ways})
+        uuids = [alert["uuid"] for alert in self.data["alerts"] if "uuid" in alert.keys()]
+
+        query1 = "MATCH (waze:`{}`) WHERE waze.__datasetid IN $datasetids OR waze.uuid IN $uuids ".\
+            format(self.waze_node_label)
+        query2 = "OPTIONAL MATCH (osm:`{}`)-[:`{}`]->(waze) ".format(self.osm_way_label, self.waze_node_label)
+        query3 = "RETURN waze.uuid, waze.type, waze.subtype, waze.endTimeMillis, collect(osm.id) AS way_ids UNION "
+        query4 = "MATCH (osm:`{0}`)-[:`{1}`]->(waze:`{1}`) WHERE osm.id IN $way_ids ".\
+            format(self.osm_way_label, self.waze_node_label)
+        query5 = "RETURN waze.uuid, waze.type, waze.subtype, waze.endTimeMillis, collect(osm.id) AS way_ids"
+        query = query1 + query2 + query3 + query4 + query5
+
+        records, _, _ = self.driver.execute_query(
+            query,
+            datasetids=datasetids,
+            uuids=uuids,
+            way_ids=way_ids,
+            routing_=RoutingControl.READ,
+        )
+
+        # build the dictionaries used by the decision logic
+        self.existing_endtimes = {}
+        self.existing_relationships = {}
+
+        for record in records:
+
+            uuid = record["waze.uuid"]
+            self.existing_endtimes[uuid] = record["waze.endTimeMillis"]
+
+            for way_id in record["way_ids"]:
+
+                # keep the first waze node found for the relationship, as the LIMIT 1 query did
+                key = self.find_relationship_key(way_id, record["waze.type"], record["waze.subtype"])
+                self.existing_relationships.setdefault(key, uuid)
+
+        print("PREFETCHED {} WAZE NODES AND {} RELATIONSHIPS".format(len(self.existing_endtimes), 
+                                                                      len(self.existing_relationships)))
+
+        return
+
+
+    def match_waze_node(self, uuid):
+
+        # determine if the waze node exists and find its endTimeMillis, including the writes held in memory
+        if uuid in self.pending_nodes:
+            return True, self.pending_nodes[uuid]["endTimeMillis"]
+
+        if uuid in self.pending_detached_uuids:
+            return False, None
+
+        if self.existing_endtimes is not None:
+
+            # use the waze nodes read before the alerts are parsed
+            if uuid not in self.existing_endtimes:
+                return False, None
+
+            attached_endtime = self.existing_endtimes[uuid]
+
+        else:
+
+            matched_node = self.match_node("uuid", uuid, self.waze_node_label)
+
+            if not matched_node:
+                return False, None
+
+            attached_endtime = matched_node[0].data()["node"]["endTimeMillis"]
+
+        if uuid in self.pending_endtimes:
+            attached_endtime = self.pending_endtimes[uuid]["endTimeMillis"]
+
+        return True, attached_endtime
+
+
+    def match_waze_relationship(self, osm_id, wazetype, subtype):
+
+        # find the uuid and endTimeMillis of the waze node attached to the sidewalk/crosswalk node 
+        # that has the same waze subtype as the current waze node, including the writes held in memory
+        key = self.find_relationship_key(osm_id, wazetype, subtype)
+
+        if key in self.pending_relationships:
+
+            attached_uuid = self.pending_relationships[key]["uuid"]
+            _, attached_endtime = self.match_waze_node(attached_uuid)
+
+            return attached_uuid, attached_endtime
+
+        if self.existing_relationships is not None:
+
+            # use the relationships read before the alerts are parsed
+            if key not in self.existing_relationships:
+                return None, None
+
+            attached_uuid = self.existing_relationships[key]
+            return self.find_attached_waze(attached_uuid, self.existing_endtimes[attached_uuid])
 
-        # check if the relationship exists between sidewalk/crosswalk and waze nodes that has the same waze subtype as the current waze node
         if subtype == "": # NO_SUBTYPE
 
             # use waze type to check the relationship where subtype is empty
             query = "MATCH (osm:`{}`)-[r:`{}`]->(waze:`{}`) WHERE osm.id = '{}' AND waze.subtype = '{}' " \
                 + "AND waze.type = '{}' RETURN r, waze.uuid, waze.endTimeMillis LIMIT 1"
-            query = query.format(self.osm_way_label, self.waze_node_label, self.waze_node_label, osm_node["id"], subtype, wazetype)
+            query = query.format(self.osm_way_label, self.waze_node_label, self.waze_node_label, osm_id, subtype, wazetype)
 
         else:
 
             # use waze subtype to check the relationship only
             query = "MATCH (osm:`{}`)-[r:`{}`]->(waze:`{}`) WHERE osm.id = '{}' AND waze.subtype = '{}' " \
                 + "RETURN r, waze.uuid, waze.endTimeMillis LIMIT 1"
-            query = query.format(self.osm_way_label, self.waze_node_label, self.waze_node_label, osm_node["id"], subtype)
+            query = query.format(self.osm_way_label, self.waze_node_label, self.waze_node_label, osm_id, subtype)
 
         # check if the relationship already exists or not
         record = self.check_existence(query)
 
-        if record:
+        if not record:
+            return None, None
 
-            # ensure the waze node attached has the latest endTimeMillis
-            attached_uuid = record[0]["waze.uuid"]
-            attached_endtime = record[0]["waze.endTimeMillis"]
+        return self.find_attached_waze(record[0]["waze.uuid"], record[0]["waze.endTimeMillis"])
+
+
+    def find_attached_waze(self, attached_uuid, attached_endtime):
+
+        # apply the writes held in memory to the waze node attached in the database
+        if attached_uuid in self.pending_detached_uuids:
+            return None, None # the waze node is already replaced in this feed
 
+        if attached_uuid in self.pending_endtimes:
+            attached_endtime = self.pending_endtimes[attached_uuid]["endTimeMillis"]
+
+        return attached_uuid, attached_endtime
+    
+
+    def create_update_waze_node_link(self, osm_node, osm_node_type, alert, time_fields):
+
+        # if the relationship exists where the attached waze has the same subtype, 
+        # update the waze node with the one that has the lastest endtime, detach the old one
+        # if the relationship doesn't exist, create the waze node and create the link
+        uuid = alert["uuid"]
+        wazetype = alert["type"]
+        subtype = alert["subtype"]
+        endtime = time_fields["endTimeMillis"]
+
+        # check if the relationship exists between sidewalk/crosswalk and waze nodes that has the same waze subtype as the current waze node
+        attached_uuid, attached_endtime = self.match_waze_relationship(osm_node["id"], wazetype, subtype)
+
+        if attached_uuid is not None:
+
+            # ensure the waze node attached has the latest endTimeMillis
             if attached_endtime < endtime:
 
                 # check to see if the waze node exists already in the database
-                matched_node = self.match_node("uuid", uuid, self.waze_node_label)
+                matched_node, _ = self.match_waze_node(uuid)
 
                 # create the waze node and create the relationship between the sidewalk/crosswalk and the waze node
                 if not matched_node:
@@ -265,7 +447,7 @@ class WazeAlertsQueries:
         else:
 
             # check to see if the waze node exists already in the database
-            matched_node = self.match_node("uuid", uuid, self.waze_node_label)
+            matched_node, _ = self.match_waze_node(uuid)
 
             # create the waze node and create the relationship between the sidewalk/crosswalk and the waze node
             if not matched_node:
@@ -304,102 +486,62 @@ class WazeAlertsQueries:
             sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon
 
 
-    def sort_sidewalk_crosswalk_nodes(self, alert):
-
-        # order sidewalk and crosswalk nodes w.r.t. the current waze node location
-        lat = alert["location"]["y"] # lat is y
-        lon = alert["location"]["x"] # lon is x
-        #waze_coords = (lat, lon)
-        waze_coords = Point(lat, lon)
-
-        sidewalk_nodes = []
-        sidewalk_distances = []
-        crosswalk_nodes = []
-        crosswalk_distances = []
-
-        first_crosswalk_latlon = []
-        last_crosswalk_latlon = []
-
-        for sidewalk_record in self.sidewalk_records:
-
-            sidewalk = sidewalk_record.data()["sidewalk"]
-
-            # find start and end points in lat/lon of the sidewalk
-            start_node = sidewalk_record.data()["node1"]
-            start_node_lat = start_node["lat"]
-            start_node_lon = start_node["lon"]
-
-            end_node = sidewalk_record.data()["node2"]
-            end_node_lat = end_node["lat"]
-            end_node_lon = end_node["lon"]
-
-            # create the sidewalk line
-            sidewalk_line = LineString(((start_node_lat, start_node_lon), (end_node_lat, end_node_lon)))
-
-            # find the nearest point on the sidewalk line to the waze alert
-            near_points = nearest_points(sidewalk_line, waze_coords)
+    def build_spatial_indexes(self):
 
-            # determine the distance in meters between the two points
-            lat1 = near_points[0].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon1 = near_points[0].y # x if use (lon, lat) as inputs to Point and LineString above
-            lat2 = near_points[1].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon2 = near_points[1].y # x if use (lon, lat) as inputs to Point and LineString above
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+        # index the sidewalk and crosswalk segments once so each alert only visits its nearby segments,
+        # unless the indexes are given already
+        if self.sidewalk_index is None:
+            self.sidewalk_index = SegmentGridIndex(self.sidewalk_records, "sidewalk")
 
-            # convert the distance from meters to feet
-            distance = self.meter_to_feet * dist
+        if self.crosswalk_index is None:
+            self.crosswalk_index = SegmentGridIndex(self.crosswalk_records, "crosswalk")
 
-            # store the sidewalk node and the computed distance
-            sidewalk_nodes.append(sidewalk)
-            sidewalk_distances.append(distance)
+        if self.intersection_index is None:
+            self.intersection_index = IntersectionBoxIndex.build_crosswalk_boxes(
+                self.crosswalk_index.start_lat, self.crosswalk_index.start_lon,
+                self.crosswalk_index.end_lat, self.crosswalk_index.end_lon, self.intersection_box)
 
-        for crosswalk_record in self.crosswalk_records:
+        return
 
-            crosswalk = crosswalk_record.data()["crosswalk"]
 
-            # find start and end points in lat/lon of the crosswalk
-            start_node = crosswalk_record.data()["node1"]
-            start_node_lat = start_node["lat"]
-            start_node_lon = start_node["lon"]
+    def sort_sidewalk_crosswalk_nodes(self, alert, search_radius):
 
-            end_node = crosswalk_record.data()["node2"]
-            end_node_lat = end_node["lat"]
-            end_node_lon = end_node["lon"]
+        # order sidewalk and crosswalk nodes within the search radius (ft) w.r.t. the current waze node location
+        lat = alert["location"]["y"] # lat is y
+        lon = alert["location"]["x"] # lon is x
 
-            # create the crosswalk line
-            crosswalk_line = LineString(((start_node_lat, start_node_lon), (end_node_lat, end_node_lon)))
+        # only the segments from the spatial index that could be within the search radius are measured
+        indices = self.sidewalk_index.query(lat, lon, search_radius)
 
-            # find the nearest point on the crosswalk line to the waze alert
-            near_points = nearest_points(crosswalk_line, waze_coords)
+        # compute the distances in ft to all the candidate sidewalks at once, ordered by distance
+        distances, order = point_segment_distances(lat, lon,
+                                                   self.sidewalk_index.start_lat[indices],
+                                                   self.sidewalk_index.start_lon[indices],
+                                                   self.sidewalk_index.end_lat[indices],
+                                                   self.sidewalk_index.end_lon[indices])
 
-            # determine the distance in meters between the two points
-            lat1 = near_points[0].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon1 = near_points[0].y # x if use (lon, lat) as inputs to Point and LineString above
-            lat2 = near_points[1].x # y if use (lon, lat) as inputs to Point and LineString above
-            lon2 = near_points[1].y # x if use (lon, lat) as inputs to Point and LineString above
-            _, _, dist = self.wgs84_geod.inv(lon1, lat1, lon2, lat2)
+        sorted_sidewalk_nodes = [self.sidewalk_index.ways[index] for index in indices[order]]
+        sorted_sidewalk_distances = distances[order].tolist()
+        print("SORTED SIDEWALK DISTANCES:", sorted_sidewalk_distances)
 
-            # convert the distance from meters to feet
-            distance = self.meter_to_feet * dist
+        indices = self.crosswalk_index.query(lat, lon, search_radius)
 
-            # store the crosswalk node and the computed distance
-            crosswalk_nodes.append(crosswalk)
-            crosswalk_distances.append(distance)
+        # compute the distances in ft to all the candidate crosswalks at once, ordered by distance
+        distances, order = point_segment_distances(lat, lon,
+                                                   self.crosswalk_index.start_lat[indices],
+                                                   self.crosswalk_index.start_lon[indices],
+                                                   self.crosswalk_index.end_lat[indices],
+                                                   self.crosswalk_index.end_lon[indices])
 
-            # store the lat/lon of start and end points of the crosswalk node
-            first_crosswalk_latlon.append((start_node_lat, start_node_lon))
-            last_crosswalk_latlon.append((end_node_lat, end_node_lon))
+        sorted_crosswalk_nodes = [self.crosswalk_index.ways[index] for index in indices[order]]
+        sorted_crosswalk_distances = distances[order].tolist()
+        print("SORTED CROSSWALK DISTANCES:", sorted_crosswalk_distances)
 
-        # sort the sidewalk and crosswalk nodes based on the distances computed
-        sorted_sidewalk_nodes, sorted_sidewalk_distances, \
-        sorted_crosswalk_nodes, sorted_crosswalk_distances, \
-        sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon \
-            = self.sort_sidewalks_crosswalks(sidewalk_nodes, sidewalk_distances, 
-                                             crosswalk_nodes, crosswalk_distances,
-                                             first_crosswalk_latlon, last_crosswalk_latlon)
+        # order the crosswalk indices in the spatial index based on the computed distances
+        sorted_crosswalk_indices = indices[order].tolist()
         
         return sorted_sidewalk_nodes, sorted_sidewalk_distances, sorted_crosswalk_nodes, sorted_crosswalk_distances, \
-            sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon
+            sorted_crosswalk_indices
 
 
     def find_sidewalk_crosswalk_nodes_weather(self, sorted_sidewalk_nodes, sorted_sidewalk_distances,
@@ -448,44 +590,18 @@ class WazeAlertsQueries:
         return node_attachments, node_attachment_types
     
 
-    def find_square_box_points(self, close_first_crosswalk_latlon, close_last_crosswalk_latlon,
-                               far_first_crosswalk_latlon, far_last_crosswalk_latlon):
-
-        # form the square based on the 4 points found
-        points = [close_first_crosswalk_latlon, close_last_crosswalk_latlon,
-                  far_first_crosswalk_latlon, far_last_crosswalk_latlon]
-        square = Polygon(points)
-
-        return square
-
-
-    def check_waze_intersection(self, alert, sorted_crosswalk_nodes, sorted_crosswalk_distances,
-                                sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon):
+    def check_waze_intersection(self, alert, sorted_crosswalk_indices, sorted_crosswalk_distances):
 
         inbox = False
 
-        if len(sorted_crosswalk_nodes) >= 4: # sufficient to check 4 closest crosswalk nodes
-
-            # check to see if the 4th closest crosswalk is within 300 ft 
-            crosswalk_distance_check = sorted_crosswalk_distances[3]
-
-            if crosswalk_distance_check <= self.intersection_box:
-
-                # extract the start and end points lat/lon of the closest and the fartherest (4th) crosswalks
-                close_first_crosswalk_latlon = sorted_first_crosswalk_latlon[0]
-                close_last_crosswalk_latlon = sorted_last_crosswalk_latlon[0]
-                far_first_crosswalk_latlon = sorted_first_crosswalk_latlon[3]
-                far_last_crosswalk_latlon = sorted_last_crosswalk_latlon[3]
-
-                # draw a rough intersection box to check if waze alert is in the box
-                square = self.find_square_box_points(close_first_crosswalk_latlon, close_last_crosswalk_latlon,
-                                                     far_first_crosswalk_latlon, far_last_crosswalk_latlon)
+        # check to see if the 4th closest crosswalk is within 300 ft
+        if len(sorted_crosswalk_indices) >= 4 and sorted_crosswalk_distances[3] <= self.intersection_box:
 
-                # check to see if the waze node is in the square box
-                lat = alert["location"]["y"] # lat is y
-                lon = alert["location"]["x"] # lon is x
-                waze_point = Point(lat, lon)
-                inbox = square.contains(waze_point)
+            # check to see if the waze node is in the intersection box of its closest and 4th closest crosswalks
+            lat = alert["location"]["y"] # lat is y
+            lon = alert["location"]["x"] # lon is x
+            inbox = self.intersection_index.contains_pair(lat, lon, sorted_crosswalk_indices[0],
+                                                          sorted_crosswalk_indices[3])
 
         return inbox
     
@@ -521,6 +637,14 @@ class WazeAlertsQueries:
         endtime_timestamp = self.data["endTime"] # str
         time_fields = {"startTimeMillis": starttime_ms, "endTimeMillis": endtime_ms, 
                        "startTime": starttime_timestamp, "endTime": endtime_timestamp}
+
+        # index the sidewalk and crosswalk segments once for all the alerts
+        self.build_spatial_indexes()
+
+        if self.batch_write:
+
+            # read the existing waze nodes and relationships once for all the alerts
+            self.prefetch_waze_state()
         
         # ingest or update waze alert nodes
         for alert in alerts:
@@ -540,29 +664,42 @@ class WazeAlertsQueries:
                 print("THE CURRENT WAZE ALERT REPRESENTS A FREEWAY AND IS DISCARDED:", alert)
                 continue # waze alert represents a freeway and is discarded
             
-            # determine if the waze node exists with uuid and label WAZE-ALERT
             uuid = alert["uuid"]
-            matched_node = self.match_node("uuid", uuid, self.waze_node_label)
+
+            if self.known_uuids is not None and uuid in self.known_uuids:
+
+                # the alert is in the previous snapshot and already attached, only refresh its endtime fields
+                self.update_waze_endtimes(uuid, endtime_ms, endtime_timestamp)
+                continue
+
+            # determine if the waze node exists with uuid and label WAZE-ALERT
+            matched_node, attached_endtime = self.match_waze_node(uuid)
             subtype = alert["subtype"]
 
             if matched_node:
 
                 # update endtime fields of the waze node if the current waze has later endtimes
-                attached_endtime = matched_node[0].data()["node"]["endTimeMillis"]
                 if attached_endtime < endtime_ms:
                     self.update_waze_endtimes(uuid, endtime_ms, endtime_timestamp)
                     print("WAZE NODE UUID {} IS FOUND AND ITS ENDTIME FIELDS UPDATED".format(uuid))
             
             else:
 
-                # find and sort sidewalk and crosswalk nodes w.r.t. the current waze node first
+                # weather hazards attach within 1,000 ft, other alerts never look beyond the 300 ft intersection check
+                if subtype.startswith("HAZARD_WEATHER_"):
+                    search_radius = self.weather_distance
+                else:
+                    search_radius = self.intersection_box
+
+                # find and sort sidewalk and crosswalk nodes within the search radius w.r.t. the current waze node first
                 sorted_sidewalk_nodes, sorted_sidewalk_distances, \
-                sorted_crosswalk_nodes, sorted_crosswalk_distances, \
-                sorted_first_crosswalk_latlon, sorted_last_crosswalk_latlon \
-                    = self.sort_sidewalk_crosswalk_nodes(alert)
+                sorted_crosswalk_nodes, sorted_crosswalk_distances, sorted_crosswalk_indices \
+                    = self.sort_sidewalk_crosswalk_nodes(alert, search_radius)
                 
-                # discard the waze alert if closest sidewalk and crosswalk nodes are farther than 1,000 ft away
-                if sorted_sidewalk_distances[0] > self.weather_distance and sorted_crosswalk_distances[0] > self.weather_distance:
+                # discard the waze alert if no sidewalk and crosswalk nodes are within the search radius,
+                # or if closest sidewalk and crosswalk nodes are farther than 1,000 ft away
+                nearest_distances = sorted_sidewalk_distances[:1] + sorted_crosswalk_distances[:1]
+                if all(distance > self.weather_distance for distance in nearest_distances):
 
                     print("THE CURRENT WAZE ALERT IS TOO FAR AWAY FROM ANY SIDEWALK/CROSSWALK AND IS DISCARDED:", alert)
                     continue # waze alert is more than 1,000 ft away from its closest sidewalk/crosswalk and is discarded
@@ -580,10 +717,7 @@ class WazeAlertsQueries:
                 else:
 
                     # determine if the waze alert is within an intersection box
-                    inbox = self.check_waze_intersection(alert, sorted_crosswalk_nodes,
-                                                         sorted_crosswalk_distances,
-                                                         sorted_first_crosswalk_latlon,
-                                                         sorted_last_crosswalk_latlon)
+                    inbox = self.check_waze_intersection(alert, sorted_crosswalk_indices, sorted_crosswalk_distances)
 
                     if inbox:
 
@@ -614,6 +748,51 @@ class WazeAlertsQueries:
                     self.create_update_waze_node_link(osm_node, osm_node_type, alert, time_fields)
                     count += 1
 
+        if self.batch_write:
+
+            # send the writes decided for the whole feed
+            self.write_batch()
+
+        return
+    
+
+    def execute_batch(self, query, rows):
+
+        # execute the UNWIND query with the rows split into chunks of batch_size
+        for start in range(0, len(rows), self.batch_size):
+            self.driver.execute_query(query, rows=rows[start:start + self.batch_size])
+
+        return
+
+
+    def write_batch(self):
+
+        # detach the replaced waze nodes first, a replaced uuid may be created again later in the same feed
+        query = "UNWIND $rows AS uuid MATCH (waze:`{}` {{uuid: uuid}}) DETACH DELETE waze".format(self.waze_node_label)
+        self.execute_batch(query, list(self.pending_detached_uuids))
+
+        # create the new waze nodes
+        query = "UNWIND $rows AS attrs CREATE (waze:`{}`) SET waze += attrs".format(self.waze_node_label)
+        self.execute_batch(query, list(self.pending_nodes.values()))
+
+        # update endtime property values of the existing waze nodes
+        query = "UNWIND $rows AS row MATCH (waze:`{}` {{uuid: row.uuid}}) ".format(self.waze_node_label) \
+            + "SET waze.endTimeMillis = row.endTimeMillis, waze.endTime = row.endTime"
+        self.execute_batch(query, list(self.pending_endtimes.values()))
+
+        # create relationships between the waze nodes and their sidewalk/crosswalk nodes
+        query1 = "UNWIND $rows AS row MATCH (osm:`{}` {{id: row.way_id}}), (waze:`{}` {{uuid: row.uuid}}) ".\
+            format(self.osm_way_label, self.waze_node_label)
+        query2 = "CREATE (osm)-[r:`{}` {{__datasetid: row.__datasetid, __impedance_factor: row.__impedance_factor, ".\
+            format(self.waze_node_label)
+        query3 = "__impedance_effect_type: row.__impedance_effect_type}]->(waze)"
+        query = query1 + query2 + query3
+        self.execute_batch(query, list(self.pending_relationships.values()))
+
+        print("BATCH WRITES: {} NODES CREATED, {} ENDTIMES UPDATED, {} RELATIONSHIPS CREATED, {} NODES DETACHED".format(
+            len(self.pending_nodes), len(self.pending_endtimes), len(self.pending_relationships), 
+            len(self.pending_detached_uuids)))
+
         return
     
 
@@ -624,11 +803,9 @@ class WazeAlertsQueries:
         time_limit = current_time_ms - self.waze_holdtime 
         
         # delete waze nodes and links that have last update time less than the time limit; endTimeMillis in EST/EDT
-        query1 = "MATCH (waze:`{}`) WHERE waze.endTimeMillis < {} ".format(self.waze_node_label, time_limit)
-        query2 = "DETACH DELETE waze"
-        query = query1 + query2
-
-        self.driver.execute_query(query)
+        # in batches, so that a long feed outage does not turn into a single huge transaction
+        match = "MATCH (waze:`{}`) WHERE waze.endTimeMillis < $time_limit".format(self.waze_node_label)
+        BatchedDelete(self.driver).delete("WAZE", match, "waze", parameters={"time_limit": time_limit})
 
         return
 
@@ -3,6 +3,13 @@ The script consists of openCypher queries for creating/deleting nodes and links
 Waze alerts data and ingest them to an AWS Neptune database using bulk load from EventBridge scheduler:
     "bolt://<database-name.cluster-id>.us-east-2.neptune.amazonaws.com:8182"
 
+The GT/CE-SIDEWALK node centroids are read once and kept in a grid index, so the sidewalk node closest to each
+waze alert is found in memory and no distance is written to the sidewalk nodes in the database.
+
+The waze nodes and relationships to be bulk loaded are staged in WazeBulkLoadStaging, keyed by uuid and by
+sidewalk id and subtype, so the lookups, replacements and removals stay constant time as the 14 study areas
+are accumulated into a single bulk load.
+
 For more information on the openCypher queries, visit:
     https://neo4j.com/docs/cypher-manual/5/introduction/
     https://neo4j.com/docs/getting-started/cypher-intro/
@@ -12,10 +19,97 @@ For more information on the openCypher queries, visit:
 import time
 from neo4j import GraphDatabase, RoutingControl
 
+from spatial_index import CentroidGridIndex
+from batched_delete import BatchedDelete
+
+
+class WazeBulkLoadStaging:
+
+    def __init__(self):
+
+        # store waze data in dictionaries of bulk load rows, in the order they are added
+        self.nodes = {} # uuid -> waze node row
+        self.relationships = {} # relationship id -> waze relationship row
+        self.relationship_ids = {} # (sidewalk id, waze subtype) -> relationship ids, as keys of a dictionary
+        self.relationship_keys = {} # relationship id -> (sidewalk id, waze subtype)
+
+
+    def find_node(self, uuid):
+
+        # find the waze node row with the uuid, None if it is not staged
+        return self.nodes.get(uuid)
+
+
+    def add_node(self, node):
+
+        # stage the waze node row
+        self.nodes[node["~id"]] = node
+
+        return
+
+
+    def remove_node(self, uuid):
+
+        # remove the waze node row, its relationships are skipped by find_relationship
+        self.nodes.pop(uuid, None)
+
+        return
+
+
+    def find_relationship(self, sidewalk_id, subtype):
+
+        # find the waze node row attached to the sidewalk with the subtype, in the order the relationships are added
+        for relationship_id in self.relationship_ids.get((sidewalk_id, subtype), []):
+
+            node = self.nodes.get(self.relationships[relationship_id]["~to"])
+
+            if node is not None and node["subtype:String(single)"] == subtype:
+                return node
+
+        return None
+
+
+    def add_relationship(self, relationship):
+
+        # stage the relationship row and index it by the sidewalk id and the subtype of its waze node
+        relationship_id = relationship["~id"]
+        key = (relationship["~from"], self.nodes[relationship["~to"]]["subtype:String(single)"])
+
+        self.relationships[relationship_id] = relationship
+        self.relationship_keys[relationship_id] = key
+        self.relationship_ids.setdefault(key, {})[relationship_id] = None
+
+        return
+
+
+    def remove_relationship(self, relationship_id):
+
+        # remove the relationship row and its index entry
+        if relationship_id not in self.relationships:
+            return
+
+        key = self.relationship_keys.pop(relationship_id)
+        del self.relationships[relationship_id]
+        del self.relationship_ids[key][relationship_id]
+
+        return
+
+
+    def node_rows(self):
+
+        # list the waze node rows for the node CSV file
+        return list(self.nodes.values())
+
+
+    def relationship_rows(self):
+
+        # list the waze relationship rows for the relationship CSV file
+        return list(self.relationships.values())
+
 
 class WazeAlertsQueriesBulkLoad:
 
-    def __init__(self, query_url, method, data, waze_nodes_bulkload, waze_relationships_bulkload):
+    def __init__(self, query_url, method, data, waze_bulkload, sidewalk_index=None):
 
         self.method = method # API request method: POST, DELETE
         self.data = data
@@ -24,13 +118,11 @@ class WazeAlertsQueriesBulkLoad:
         self.waze_node_label = "WAZE-ALERT"
         self.sidewalk_link_label = "GT/CE-SIDEWALK"
 
-        # define fields to store the computed waze distances based for the scheduler
-        self.computed_wazedistance = "__wazedistance_scheduled"
-        self.wazedistance = "wazedistance_scheduled"
+        # store waze data in WazeBulkLoadStaging for bulk load, shared by the study areas
+        self.waze_bulkload = waze_bulkload
 
-        # store waze data in list of dictionaries for bulk load
-        self.waze_node_bulkload = waze_nodes_bulkload
-        self.waze_relationship_bulkload = waze_relationships_bulkload
+        # grid index over the GT/CE-SIDEWALK node centroids, read once and shared by the study areas
+        self.sidewalk_index = sidewalk_index
 
         # set up the python driver to send data to graph database
         self.URI = query_url
@@ -76,18 +168,17 @@ class WazeAlertsQueriesBulkLoad:
 
     def match_node_bulkload(self, uuid):
 
-        # find if the node already exists in self.waze_node_bulkload
+        # find if the node already exists in self.waze_bulkload
         matched = False
         waze_found = {}
 
-        for node in self.waze_node_bulkload:
+        node = self.waze_bulkload.find_node(uuid)
 
-            if node["~id"] == uuid:
+        if node is not None:
 
-                # extract node's endTimeMillis to check the timestamp
-                waze_found["endTimeMillis"] = node["endTimeMillis:Long(single)"]
-                matched = True
-                break
+            # extract node's endTimeMillis to check the timestamp
+            waze_found["endTimeMillis"] = node["endTimeMillis:Long(single)"]
+            matched = True
         
         return matched, waze_found
 
@@ -122,7 +213,7 @@ class WazeAlertsQueriesBulkLoad:
             waze_node[name] = val
 
         # store the waze node for bulk load
-        self.waze_node_bulkload.append(waze_node)
+        self.waze_bulkload.add_node(waze_node)
 
         return
     
@@ -134,7 +225,7 @@ class WazeAlertsQueriesBulkLoad:
         #             "endTime:String(single)": endtime_timestamp}
 
         # store the waze node for bulk load
-        #self.waze_node_bulkload.append(waze_node)
+        #self.waze_bulkload.add_node(waze_node)
         
         # update endtime property values directly in the database
         query = "MATCH (waze:`{}`) WHERE waze.uuid = '{}' SET waze.endTimeMillis = {}, waze.endTime = '{}'".\
@@ -145,31 +236,34 @@ class WazeAlertsQueriesBulkLoad:
         return
     
 
+    def load_sidewalk_index(self):
+
+        # read the centroids of all GT/CE-SIDEWALK nodes and index them for the nearest sidewalk lookups
+        query = "MATCH (sidewalk:`{}`) RETURN ID(sidewalk), sidewalk.__datasetid, " \
+            + "sidewalk.sidewalksimLinkCentroidLatitude, sidewalk.sidewalksimLinkCentroidLongitude"
+        query = query.format(self.sidewalk_link_label)
+
+        records = self.check_existence(query)
+        self.sidewalk_index = CentroidGridIndex(records)
+
+        print("INDEXED {} GT/CE-SIDEWALK NODES".format(len(self.sidewalk_index.ids)))
+
+        return
+    
+
     def find_sidewalk_node(self, alert):
 
-        # compute the aggregated distances between all GT/CE-SIDEWALK nodes and the current waze alert node
+        # find the GT/CE-SIDEWALK node that is closest to the current waze alert node,
+        # with the sum of absolute lat and lon differences to the sidewalk centroid as the distance
         lat = alert["location"]["y"] # lat is y
         lon = alert["location"]["x"] # lon is x
 
-        # compute distances and store them in computed_wazedistance for eventbridge scheduler 
-        query1 = "MATCH (sidewalk:`{}`) WITH sidewalk, abs(sidewalk.sidewalksimLinkCentroidLatitude - {}) as latDiff, ".\
-            format(self.sidewalk_link_label, lat)
-        query2 = "abs(sidewalk.sidewalksimLinkCentroidLongitude - {}) as lonDiff ".format(lon)
-        query3 = "SET sidewalk.{} = latDiff + lonDiff".format(self.computed_wazedistance)
-        
-        query = query1 + query2 + query3
-
-        self.execute_query(query)
+        index = self.sidewalk_index.nearest(lat, lon)
 
-        # find the GT/CE-SIDEWALK node that is closest to the current waze alert node
-        query = "MATCH (sidewalk:`{}`) WITH sidewalk, sidewalk.{} as {} " \
-            + "ORDER BY {} ASC RETURN ID(sidewalk), sidewalk.__datasetid LIMIT 1"
-        query = query.format(self.sidewalk_link_label, self.computed_wazedistance, self.wazedistance,
-                             self.wazedistance)
-        
-        record = self.check_existence(query)
+        if index is None:
+            return None, None
 
-        return record
+        return self.sidewalk_index.ids[index], self.sidewalk_index.datasetids[index]
     
 
     def create_relationship(self, sidewalk_id, uuid, datasetid):
@@ -182,7 +276,7 @@ class WazeAlertsQueriesBulkLoad:
                              "__datasetid:String(single)": datasetid}
 
         # store the waze relationship for bulk load
-        self.waze_relationship_bulkload.append(waze_relationship)
+        self.waze_bulkload.add_relationship(waze_relationship)
 
         return
     
@@ -201,34 +295,18 @@ class WazeAlertsQueriesBulkLoad:
 
     def match_relationship_bulkload(self, sidewalk_id, subtype):
 
-        # check if the relationship is in the current self.waze_relationship_bulkload with the subtype
+        # check if the relationship is in the current self.waze_bulkload with the subtype
         matched = False
         waze_found = {}
 
-        for relation in self.waze_relationship_bulkload:
-
-            if relation["~from"] == sidewalk_id:
-
-                # find the waze node in self.waze_node_bulkload to find its subtype
-                waze_node_id = relation["~to"]
-
-                for node in self.waze_node_bulkload:
-
-                    if node["~id"] == waze_node_id:
-
-                        subtype_found = node["subtype:String(single)"]
-
-                        if subtype_found == subtype:
+        node = self.waze_bulkload.find_relationship(sidewalk_id, subtype)
 
-                            # extract uuid and endTimeMillis of the waze node
-                            waze_found["uuid"] = waze_node_id
-                            waze_found["endTimeMillis"] = node["endTimeMillis:Long(single)"]
+        if node is not None:
 
-                            matched = True
-                            break
-
-                if matched:
-                    break
+            # extract uuid and endTimeMillis of the waze node
+            waze_found["uuid"] = node["~id"]
+            waze_found["endTimeMillis"] = node["endTimeMillis:Long(single)"]
+            matched = True
 
         return matched, waze_found
     
@@ -284,12 +362,11 @@ class WazeAlertsQueriesBulkLoad:
                 self.create_waze_node(alert, time_fields, datasetid)
                 self.create_relationship(sidewalk_id, uuid, datasetid)
 
-                # remove the old waze node and relationship from the bulk load fields: 
-                # self.waze_node_bulkload and self.waze_relationship_bulkload
-                self.waze_node_bulkload[:] = [node for node in self.waze_node_bulkload if node.get("~id") != attached_uuid]
+                # remove the old waze node and relationship from the bulk load fields in self.waze_bulkload
+                self.waze_bulkload.remove_node(attached_uuid)
 
                 id_bulkload = sidewalk_id + "-" + attached_uuid
-                self.waze_relationship_bulkload[:] = [relation for relation in self.waze_relationship_bulkload if relation.get("~id") != id_bulkload]
+                self.waze_bulkload.remove_relationship(id_bulkload)
 
         else:
 
@@ -304,16 +381,14 @@ class WazeAlertsQueriesBulkLoad:
 
     def update_waze_endtimes_bulkload(self, uuid, endtime_ms, endtime_timestamp):
 
-        # update endtime fields of the waze node in self.waze_node_bulkload, should be a single waze found
-        for node in self.waze_node_bulkload:
-
-            if node["~id"] == uuid:
+        # update endtime fields of the waze node in self.waze_bulkload, should be a single waze found
+        node = self.waze_bulkload.find_node(uuid)
 
-                # update the endtime fields
-                node.update({"endTimeMillis:Long(single)": endtime_ms})
-                node.update({"endTime:String(single)": endtime_timestamp})
+        if node is not None:
 
-                break
+            # update the endtime fields
+            node.update({"endTimeMillis:Long(single)": endtime_ms})
+            node.update({"endTime:String(single)": endtime_timestamp})
         
         return
     
@@ -328,6 +403,11 @@ class WazeAlertsQueriesBulkLoad:
         endtime_timestamp = self.data["endTime"] # str
         time_fields = {"startTimeMillis": starttime_ms, "endTimeMillis": endtime_ms, 
                        "startTime": starttime_timestamp, "endTime": endtime_timestamp}
+
+        if self.sidewalk_index is None:
+
+            # read the sidewalk centroids once, the index is reused by the following study areas
+            self.load_sidewalk_index()
         
         # ingest or update waze alert nodes
         for alert in alerts:
@@ -361,15 +441,11 @@ class WazeAlertsQueriesBulkLoad:
             if not matched and not matched_bulkload:
 
                 # this is a new waze node, find the cloeset sidewalk GT/CE-SIDEWALK node to the new waze node
-                record = self.find_sidewalk_node(alert)
+                sidewalk_id, datasetid = self.find_sidewalk_node(alert)
 
-                if record:
+                if sidewalk_id is not None:
                     
-                    # the sidewalk node is found
-                    sidewalk_id = record[0]["ID(sidewalk)"]
-                    datasetid = record[0]["sidewalk.__datasetid"]
-
-                    # create or update waze node or link based on the current waze subtype
+                    # the sidewalk node is found, create or update waze node or link based on the current waze subtype
                     self.create_update_waze_node_link(sidewalk_id, alert, time_fields, datasetid)
 
                 else:
@@ -388,11 +464,9 @@ class WazeAlertsQueriesBulkLoad:
         time_limit = current_time_ms - self.waze_holdtime 
         
         # delete waze nodes and links that have last update time less than the time limit
-        query1 = "MATCH (waze:`{}`) WHERE waze.endTimeMillis < {} ".format(self.waze_node_label, time_limit)
-        query2 = "DETACH DELETE waze"
-        query = query1 + query2
-
-        self.driver.execute_query(query)
+        # in batches, so that a long feed outage does not turn into a single huge transaction
+        match = "MATCH (waze:`{}`) WHERE waze.endTimeMillis < $time_limit".format(self.waze_node_label)
+        BatchedDelete(self.driver).delete("WAZE", match, "waze", parameters={"time_limit": time_limit})
 
         return
 
@@ -409,4 +483,4 @@ class WazeAlertsQueriesBulkLoad:
                 message = "ERROR: Request method {} is not supported. Choose POST or DELETE.".format(self.method)
                 print(message)
 
-        return self.waze_node_bulkload, self.waze_relationship_bulkload
\ No newline at end of file
+        return self.waze_bulkload
\ No newline at end of file
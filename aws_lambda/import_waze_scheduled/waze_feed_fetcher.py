@@ -0,0 +1,140 @@
+"""
+The script consists of a fetcher that retrieves the Waze alerts feeds of the grid cells concurrently
+with a thread pool sharing a pooled HTTP session.
+
+Conditional requests are sent with the ETag and Last-Modified values of the previous response of each cell,
+and the SHA-256 hash of each payload is kept so that a cell whose feed has not changed since the previous run
+can be skipped. The state is kept on the fetcher, so a fetcher created at module level in a lambda function
+keeps it between the invocations of a warm container. The validators of a response are only kept once the
+caller commits the result after the feed is ingested, so a feed whose ingestion failed is retrieved again
+by the next run instead of being skipped as not modified.
+
+Each result reports the status of the cell and how long its request took:
+    "changed": the feed is new or has changed, its json data is returned
+    "not-modified": the server answered 304 Not Modified to the conditional request
+    "unchanged": the payload has the same content hash as the previous run
+    "error": the request failed or the cell is unknown, the error message is returned
+
+"""
+
+import time
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+
+class WazeFeedFetcher:
+
+    def __init__(self, urls, max_workers=14, timeout=30):
+
+        self.urls = urls # grid cell name, e.g. "33.8N84.2W" -> Waze feed URL
+        self.max_workers = max_workers # number of feeds retrieved at the same time
+        self.timeout = timeout # seconds to wait for a feed before the request fails
+
+        # keep the connections to the feed host open between the requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # state of the previous response of each cell
+        self.etags = {} # cell name -> ETag header
+        self.last_modified = {} # cell name -> Last-Modified header
+        self.content_hashes = {} # cell name -> SHA-256 hash of the payload
+
+
+    def find_request_headers(self, name):
+
+        # set up the conditional request headers from the previous response of the cell
+        headers = {}
+
+        if name in self.etags:
+            headers["If-None-Match"] = self.etags[name]
+
+        if name in self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified[name]
+
+        return headers
+
+
+    def fetch_feed(self, name):
+
+        # retrieve the feed of the cell and determine if it has changed since the previous run
+        start = time.perf_counter()
+        result = {"name": name, "status": "changed", "data": None, "error": None, "validators": {}}
+
+        if name not in self.urls:
+
+            result["status"] = "error"
+            result["error"] = "Unknown Waze data set id: {}".format(name)
+            result["elapsed"] = time.perf_counter() - start
+
+            return result
+
+        try:
+
+            response = self.session.get(self.urls[name], headers=self.find_request_headers(name),
+                                        timeout=self.timeout)
+
+            if response.status_code == 304:
+
+                result["status"] = "not-modified"
+
+            else:
+
+                response.raise_for_status()
+                content_hash = hashlib.sha256(response.content).hexdigest()
+
+                if self.content_hashes.get(name) == content_hash:
+                    result["status"] = "unchanged"
+                else:
+                    result["data"] = response.json()
+
+                # return the validators of the response, kept for the next conditional request by commit
+                result["validators"] = {"content_hash": content_hash, "etag": response.headers.get("ETag"),
+                                        "last_modified": response.headers.get("Last-Modified")}
+
+        except (requests.RequestException, ValueError) as error:
+
+            result["status"] = "error"
+            result["error"] = str(error)
+
+        result["elapsed"] = time.perf_counter() - start
+
+        return result
+
+
+    def commit(self, name, result):
+
+        # keep the validators of a result once its feed is ingested, for the next conditional request of the cell
+        validators = result.get("validators") or {}
+
+        if "content_hash" in validators:
+            self.content_hashes[name] = validators["content_hash"]
+
+        if validators.get("etag"):
+            self.etags[name] = validators["etag"]
+
+        if validators.get("last_modified"):
+            self.last_modified[name] = validators["last_modified"]
+
+
+    def fetch_all(self, names=None):
+
+        # retrieve the feeds of the cells concurrently, all the cells if names is not given
+        if names is None:
+            names = list(self.urls.keys())
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.fetch_feed, names))
+
+        print("FETCHED {} WAZE FEEDS IN {:.3f} SECONDS".format(len(names), time.perf_counter() - start))
+
+        for result in results:
+            print("WAZE FEED {}: {} IN {:.3f} SECONDS".format(result["name"], result["status"].upper(),
+                                                             result["elapsed"]))
+
+        return {result["name"]: result for result in results}
@@ -1,5 +1,24 @@
+"""
+The script imports the OSM data of the study area grid cells: the tiles of the cells are fetched from the OSM API
+by the tile scheduler of the bulk loader (aws_lambda/bulk_loader_osm/tile_scheduler.py), written to the AWS
+Neptune bulk load CSVs with the elements on the tile boundaries once, uploaded to S3 and bulk loaded through
+the PUT method of the import endpoint.
+
+A run that stopped on failed tiles is resumed by running the script again with the same TILE_DIRECTORY.
+
+"""
+
+import os
+import sys
+
+import boto3
 import requests
-import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "aws_lambda", "bulk_loader_osm"))
+
+from driver import main_tiles
+from tile_scheduler import planTiles, OsmApiTileSource, OsmTileScheduler, AdaptiveRateLimiter
+
 
 study_area = {
     "33.8N84.4W": {"min_lat": 33.8, "max_lat": 33.9, "min_lon": -84.4, "max_lon": -84.3},
@@ -21,20 +40,22 @@ study_area = {
 WRITE_KEY = ""
 url = "https://<api-id>.execute-api.us-east-2.amazonaws.com/dev/api/osm/import"
 headers = {'Authorization': WRITE_KEY}
-for id, bbox in study_area.items():
-    print(id)
-    minlat = bbox['min_lat']
-    while minlat < bbox['max_lat']:
-        minlon = bbox['min_lon']
-        while minlon < bbox['max_lon']:
-            params = {
-                "id": id,
-                "bbox": "{},{},{},{}".format(minlon,minlat,minlon+0.02,minlat+0.02)
-            }
-            print(params['bbox'])
-            response = requests.post(url, params=params, headers=headers)
-            print(response.json())
-            time.sleep(10)
-            minlon = minlon + 0.02
-        minlat = minlat + 0.02
-    
\ No newline at end of file
+LOAD_BUCKET = ""
+TILE_DIRECTORY = "osm-tiles"
+
+# fetch the tiles, 4 requests in flight starting 1 s apart; the interval adapts to the throttling of the OSM API
+tiles = planTiles(study_area, 0.02)
+os.makedirs(TILE_DIRECTORY, exist_ok=True)
+scheduler = OsmTileScheduler(OsmApiTileSource(), TILE_DIRECTORY, workers=4, limiter=AdaptiveRateLimiter(interval=1.0))
+failed = scheduler.run(tiles)
+if failed:
+    sys.exit("{} tiles failed, run the script again to resume them: {}".format(len(failed), ", ".join(failed)))
+
+# write the CSVs of all the tiles, then upload and bulk load them with the vertex loads first
+main_tiles(scheduler, tiles, dataset_id="area-unset", directory=TILE_DIRECTORY)
+s3 = boto3.client('s3')
+for name in ["node", "way", "relation", "wayLink", "relationLink"]:
+    s3.upload_file(os.path.join(TILE_DIRECTORY, "{}.csv".format(name)), LOAD_BUCKET, "osm-updated/{}.csv".format(name))
+
+response = requests.put(url, params={"source": "osm-updated", "chain": "true"}, headers=headers)
+print(response.json())